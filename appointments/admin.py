@@ -1,9 +1,17 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.utils.html import format_html
-from .models import BookingSettings, AvailableDay, Appointment
+from church_records.exports import export_response
+from church_records.routers import ReplicaChangelistMixin
+from church_records.search import FullTextSearchMixin
+from .availability import ACTIVE_STATUSES
+from .models import BookingSettings, Resource, AvailableDay, ScheduleException, Appointment, appointment_search_index
+from .cache import invalidate_availability, schedule_index_cache
+from .tasks import send_appointment_email
 
 @admin.register(BookingSettings)
-class BookingSettingsAdmin(admin.ModelAdmin):
+class BookingSettingsAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('system_status', 'is_enabled')
     fieldsets = (
         ('System Status', {
@@ -31,11 +39,29 @@ class BookingSettingsAdmin(admin.ModelAdmin):
         # Prevent deletion of the settings object
         return False
 
+@admin.register(Resource)
+class ResourceAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('name', 'kind', 'capacity', 'is_active')
+    list_filter = ('kind', 'is_active')
+    list_editable = ('capacity', 'is_active')
+    search_fields = ('name',)
+    
+    fieldsets = (
+        ('Resource', {
+            'fields': ('name', 'kind', 'is_active'),
+        }),
+        ('Capacity', {
+            'fields': ('capacity',),
+            'description': 'Raise above 1 for group sessions that several people book together'
+        }),
+    )
+
 @admin.register(AvailableDay)
-class AvailableDayAdmin(admin.ModelAdmin):
-    list_display = ('day_display', 'time_range', 'slot_duration_display', 'slot_count', 'is_active', 'status_display')
-    list_filter = ('day_of_week', 'is_active')
+class AvailableDayAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('day_display', 'resource', 'time_range', 'slot_duration_display', 'slot_count', 'is_active', 'status_display')
+    list_filter = ('day_of_week', 'resource', 'is_active')
     list_editable = ('is_active',)
+    list_select_related = ('resource',)
     actions = ['activate_days', 'deactivate_days']
     
     def day_display(self, obj):
@@ -52,7 +78,7 @@ class AvailableDayAdmin(admin.ModelAdmin):
     slot_duration_display.short_description = 'Duration'
     
     def slot_count(self, obj):
-        return len(obj.get_time_slots())
+        return len(obj.get_slot_minutes())
     slot_count.short_description = 'Available Slots'
     
     def status_display(self, obj):
@@ -62,16 +88,19 @@ class AvailableDayAdmin(admin.ModelAdmin):
     status_display.short_description = 'Status'
     
     def activate_days(self, request, queryset):
-        queryset.update(is_active=True)
+        queryset.update(is_active=True, updated_at=timezone.now())
+        # Bulk updates bypass the post_save signal
+        transaction.on_commit(schedule_index_cache.invalidate)
     activate_days.short_description = "Activate selected days"
     
     def deactivate_days(self, request, queryset):
-        queryset.update(is_active=False)
+        queryset.update(is_active=False, updated_at=timezone.now())
+        transaction.on_commit(schedule_index_cache.invalidate)
     deactivate_days.short_description = "Deactivate selected days"
     
     fieldsets = (
         ('Day', {
-            'fields': ('day_of_week', 'is_active'),
+            'fields': ('resource', 'day_of_week', 'is_active'),
         }),
         ('Time Slots', {
             'fields': ('start_time', 'end_time', 'slot_duration'),
@@ -79,13 +108,49 @@ class AvailableDayAdmin(admin.ModelAdmin):
         }),
     )
 
+@admin.register(ScheduleException)
+class ScheduleExceptionAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('date', 'resource', 'kind_display', 'time_range', 'slot_count', 'reason')
+    list_filter = ('kind', 'resource', 'date')
+    list_select_related = ('resource',)
+    date_hierarchy = 'date'
+    
+    def kind_display(self, obj):
+        color = 'red' if obj.kind == 'closed' else 'green'
+        return format_html('<span style="color: {};">{}</span>', color, obj.get_kind_display())
+    kind_display.short_description = 'Type'
+    kind_display.admin_order_field = 'kind'
+    
+    def time_range(self, obj):
+        if obj.kind == 'closed':
+            return '-'
+        return f"{obj.start_time.strftime('%I:%M %p')} - {obj.end_time.strftime('%I:%M %p')}"
+    time_range.short_description = 'Hours'
+    
+    def slot_count(self, obj):
+        return len(obj.get_slot_minutes())
+    slot_count.short_description = 'Extra Slots'
+    
+    fieldsets = (
+        ('Date', {
+            'fields': ('date', 'resource', 'kind', 'reason'),
+            'description': 'Close a date (holiday, event) or open extra hours on it'
+        }),
+        ('Extra Hours', {
+            'fields': ('start_time', 'end_time', 'slot_duration'),
+            'description': 'Only used for extra hours; replaces the weekly hours when the date is also closed'
+        }),
+    )
+
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
-    list_display = ('name', 'appointment_date', 'appointment_time', 'purpose', 'status_display', 'created_at')
-    list_filter = ('status', 'appointment_date')
+class AppointmentAdmin(ReplicaChangelistMixin, FullTextSearchMixin, admin.ModelAdmin):
+    list_display = ('name', 'appointment_date', 'appointment_time', 'resource', 'purpose', 'status_display', 'created_at')
+    list_filter = ('status', 'resource', 'appointment_date')
+    list_select_related = ('resource',)
     search_fields = ('name', 'email', 'phone', 'purpose')
+    search_index = appointment_search_index
     readonly_fields = ('created_at',)
-    actions = ['approve_appointments', 'cancel_appointments']
+    actions = ['approve_appointments', 'cancel_appointments', 'export_csv', 'export_jsonl']
     date_hierarchy = 'appointment_date'
     
     def status_display(self, obj):
@@ -101,19 +166,72 @@ class AppointmentAdmin(admin.ModelAdmin):
     status_display.admin_order_field = 'status'
     
     def approve_appointments(self, request, queryset):
-        queryset.update(status='approved')
+        self.update_status(request, queryset, 'approved')
     approve_appointments.short_description = "Approve selected appointments"
     
     def cancel_appointments(self, request, queryset):
-        queryset.update(status='cancelled')
+        self.update_status(request, queryset, 'cancelled')
     cancel_appointments.short_description = "Cancel selected appointments"
     
+    def update_status(self, request, queryset, status):
+        """Update the status, queue an email per changed appointment and
+        move the booking page version
+
+        Cancelled appointments being made active again need a free seat of
+        their slot; those are saved one by one and skipped when the slot
+        has been booked up in the meantime.
+        """
+        with transaction.atomic():
+            changed = list(queryset.exclude(status=status).values_list('pk', 'status'))
+            bulk = [pk for pk, current in changed
+                    if status not in ACTIVE_STATUSES or current in ACTIVE_STATUSES]
+            reopened = Appointment.objects.filter(pk__in=[
+                pk for pk, current in changed
+                if status in ACTIVE_STATUSES and current not in ACTIVE_STATUSES
+            ])
+            Appointment.objects.filter(pk__in=bulk).update(status=status, updated_at=timezone.now())
+            
+            updated, full = list(bulk), []
+            for appointment in reopened:
+                appointment.status = status
+                if not appointment.assign_seat():
+                    full.append(appointment)
+                    continue
+                try:
+                    with transaction.atomic():
+                        appointment.save(update_fields=['status', 'seat', 'updated_at'])
+                except IntegrityError:
+                    # The seat was taken by a booking committed meanwhile
+                    full.append(appointment)
+                else:
+                    updated.append(appointment.pk)
+            
+            send_appointment_email.enqueue_many([
+                {'appointment_id': pk, 'kind': status} for pk in updated
+            ])
+            # Bulk updates bypass the post_save signal
+            if bulk:
+                transaction.on_commit(invalidate_availability)
+        
+        if full:
+            self.message_user(request, 'Skipped %d appointment(s) whose time slot is fully booked: %s' % (
+                len(full), ', '.join(str(appointment) for appointment in full)
+            ), messages.WARNING)
+    
+    def export_csv(self, request, queryset):
+        return export_response(queryset, Appointment.EXPORT_FIELDS, 'csv', 'appointments')
+    export_csv.short_description = "Export selected appointments as CSV"
+    
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, Appointment.EXPORT_FIELDS, 'jsonl', 'appointments')
+    export_jsonl.short_description = "Export selected appointments as JSONL"
+    
     fieldsets = (
         ('Contact Information', {
             'fields': ('name', 'email', 'phone')
         }),
         ('Appointment Details', {
-            'fields': ('appointment_date', 'appointment_time', 'purpose', 'status')
+            'fields': ('resource', 'appointment_date', 'appointment_time', 'purpose', 'status')
         }),
         ('Additional Information', {
             'fields': ('additional_notes', 'created_at'),
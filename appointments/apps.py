@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals  # noqa: F401
+        from .models import appointment_search_index
+        post_migrate.connect(
+            appointment_search_index.install_after_migrate, sender=self, weak=False
+        )
@@ -0,0 +1,566 @@
+"""
+Availability engine for the appointment booking system.
+
+The weekly schedule is loaded once and every date window is computed in
+memory, instead of querying ``AvailableDay`` once per calendar day.
+
+Each resource (counselor, room) has its own calendar, and the rules
+without a resource form the shared calendar. A slot stays free while its
+bookings are fewer than the calendar capacity; bookings are counted per
+calendar, date and time with one grouped query per date window.
+"""
+import datetime
+import hashlib
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+
+from django.db.models import BooleanField, Count, Func, Max, Q, Value
+
+from church_records.routers import use_primary
+
+from .cache import availability_cache, free_slots_key, schedule_index_cache
+from .models import Appointment, AvailableDay, BookingSettings, Resource, ScheduleException
+from .slots import SlotList
+
+# Appointment statuses that occupy a time slot
+ACTIVE_STATUSES = ['pending', 'approved']
+
+
+class Likely(Func):
+    """SQLite likely(): marks a condition as true for most rows
+
+    The query planner then stops treating it as selective; other databases
+    get the bare condition.
+    """
+    function = 'likely'
+    arity = 1
+    output_field = BooleanField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return compiler.compile(self.source_expressions[0])
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, **extra_context)
+
+
+class InLiterals(Func):
+    """``expression IN (...)`` with the values written into the SQL
+
+    The column is compiled like any other, so it follows the table alias
+    of a subquery. Only meant for constants from the code, never for user
+    input.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, expression, values):
+        super().__init__(expression)
+        self.values = tuple(values)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        literals = ', '.join("'%s'" % value.replace("'", "''") for value in self.values)
+        return f'{sql} IN ({literals})', params
+
+
+# status__in=ACTIVE_STATUSES with the statuses written into the SQL. SQLite
+# only uses a partial index (appointment_active_slot_idx) when the query
+# repeats its WHERE clause, and a bound parameter never matches it. Without
+# ANALYZE statistics the planner would still rather seek the two statuses
+# in appointment_status_date_idx, hence likely().
+ACTIVE_CONDITION = Likely(InLiterals('status', ACTIVE_STATUSES))
+
+
+def active_appointments():
+    """Return appointments that occupy a time slot"""
+    return Appointment.objects.filter(ACTIVE_CONDITION)
+
+
+def active_rules():
+    """Return the active weekly rules of the shared and active resource calendars"""
+    return AvailableDay.objects.filter(
+        Q(resource__isnull=True) | Q(resource__is_active=True), is_active=True,
+    ).select_related('resource')
+
+
+def upcoming_exceptions():
+    """Return the schedule exceptions from today on, unordered"""
+    return ScheduleException.objects.filter(
+        Q(resource__isnull=True) | Q(resource__is_active=True),
+        date__gte=datetime.date.today(),
+    ).select_related('resource').order_by()
+
+
+def time_to_minutes(value):
+    """Convert a ``datetime.time`` to minutes since midnight"""
+    return value.hour * 60 + value.minute
+
+
+def minutes_to_time(minutes):
+    """Convert minutes since midnight to a ``datetime.time``"""
+    return datetime.time(minutes // 60, minutes % 60)
+
+
+def _schedule_changes(date):
+    """Count and latest change of the date's weekly rules, exceptions and resources
+
+    The aggregates travel in one UNION query; a group without rows is
+    simply absent, which still changes the token.
+    """
+    weekly = AvailableDay.objects.filter(day_of_week=date.weekday()).order_by().values(
+        'day_of_week'
+    ).annotate(count=Count('id'), changed=Max('updated_at')).values_list(
+        Value('weekly'), 'count', 'changed'
+    )
+    exceptions = ScheduleException.objects.filter(date=date).order_by().values(
+        'date'
+    ).annotate(count=Count('id'), changed=Max('updated_at')).values_list(
+        Value('exceptions'), 'count', 'changed'
+    )
+    # Capacities and active flags of every calendar
+    resources = Resource.objects.order_by().values('is_active').annotate(
+        count=Count('id'), changed=Max('updated_at')
+    ).values_list(Value('resources'), 'count', 'changed')
+    return weekly.union(exceptions, resources, all=True)
+
+
+# (row count, latest change) of a date without appointments
+NO_APPOINTMENT_CHANGES = (0, None)
+
+
+def _appointment_changes(dates):
+    # Row count and latest change of the appointments per date. Saving or
+    # deleting a row moves them, so they version both the ETag and the
+    # cached free slots of a date.
+    return Appointment.objects.filter(
+        appointment_date__range=(dates[0], dates[-1])
+    ).order_by().values('appointment_date').annotate(
+        count=Count('id'), changed=Max('updated_at')
+    ).values_list('appointment_date', 'count', 'changed')
+
+
+def _changes_by_date(rows):
+    return {date: (count, changed) for date, count, changed in rows}
+
+
+def availability_version(date):
+    """Return a token that changes whenever the availability of a date can
+
+    Derived from the row count and latest change time of the date's
+    appointments, of its weekday's schedule, of its exceptions and of the
+    resources, so it is consistent across workers and also moves when a row
+    is deleted.
+    """
+    appointments = _changes_by_date(_appointment_changes([date]))
+    schedule = list(_schedule_changes(date))
+    booking_settings = BookingSettings.get_cached_settings()
+    return _version_token(date, booking_settings, appointments, schedule)
+
+
+async def aavailability_version(date):
+    """Async availability_version()"""
+    appointments = _changes_by_date([row async for row in _appointment_changes([date])])
+    schedule = [row async for row in _schedule_changes(date)]
+    booking_settings = await BookingSettings.aget_cached_settings()
+    return _version_token(date, booking_settings, appointments, schedule)
+
+
+def _version_token(date, booking_settings, appointments, schedule):
+    raw = '|'.join(str(part) for part in (
+        date, datetime.date.today(), booking_settings.is_enabled,
+        *appointments.get(date, NO_APPOINTMENT_CHANGES),
+        *sorted(schedule),
+    ))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class CalendarSchedule:
+    """Slot starts of one calendar for every weekday and exception date
+
+    Exception dates are kept sorted and resolved with a binary search, so
+    any date costs O(log n) in the number of upcoming exceptions.
+    """
+
+    def __init__(self, weekly, exceptions):
+        # ``weekly`` holds a SlotList per weekday (Monday == 0);
+        # ``exceptions`` maps a date to (SlotList replacing the weekday's,
+        # reason shown when the date is closed)
+        self._slots = tuple(weekly)
+
+        # Bit N is set when weekday N has an active schedule
+        self.weekday_mask = 0
+        for day_of_week, slots in enumerate(self._slots):
+            if slots:
+                self.weekday_mask |= 1 << day_of_week
+
+        # Parallel tuples ordered by date
+        self._exception_dates = sorted(exceptions)
+        self._exception_slots = tuple(exceptions[date][0] for date in self._exception_dates)
+        self._exception_reasons = tuple(exceptions[date][1] for date in self._exception_dates)
+
+    @classmethod
+    def from_rules(cls, available_days, exceptions):
+        """Build a calendar from its weekly rules and date exceptions"""
+        ranges_by_weekday = [[] for _ in range(7)]
+        for day in available_days:
+            ranges_by_weekday[day.day_of_week].append(day.get_slot_minutes())
+
+        exceptions_by_date = defaultdict(list)
+        for exception in exceptions:
+            exceptions_by_date[exception.date].append(exception)
+
+        resolved = {}
+        for date, date_exceptions in exceptions_by_date.items():
+            closed = [e for e in date_exceptions if e.kind == 'closed']
+            ranges = [] if closed else list(ranges_by_weekday[date.weekday()])
+            ranges.extend(e.get_slot_minutes() for e in date_exceptions if e.kind == 'extra')
+            reason = next((e.reason for e in closed if e.reason), '')
+            resolved[date] = (SlotList.from_ranges(ranges), reason)
+
+        return cls([SlotList.from_ranges(ranges) for ranges in ranges_by_weekday], resolved)
+
+    @staticmethod
+    def merge(calendars):
+        """Return the (weekly, exceptions) of a calendar offering every slot
+        any of ``calendars`` offers"""
+        calendars = list(calendars)
+        weekly = [
+            SlotList.from_ranges(calendar.slot_minutes(day_of_week) for calendar in calendars)
+            for day_of_week in range(7)
+        ]
+        dates = set()
+        for calendar in calendars:
+            dates.update(calendar._exception_dates)
+        exceptions = {
+            date: (
+                SlotList.from_ranges(calendar.slot_minutes_on(date) for calendar in calendars),
+                next(filter(None, (calendar.closed_reason(date) for calendar in calendars)), ''),
+            )
+            for date in dates
+        }
+        return weekly, exceptions
+
+    def has_schedule(self, day_of_week):
+        """Check if any active schedule exists for a day of the week"""
+        return bool(self.weekday_mask & (1 << day_of_week))
+
+    def slot_minutes(self, day_of_week):
+        """Return the sorted slot starts for a day of the week as a SlotList"""
+        return self._slots[day_of_week]
+
+    def slot_count(self, day_of_week):
+        """Return the number of bookable slots on a day of the week"""
+        return len(self._slots[day_of_week])
+
+    def is_valid_slot(self, day_of_week, minutes):
+        """Check if a slot starts at ``minutes`` on a day of the week"""
+        return minutes in self._slots[day_of_week]
+
+    def _exception_index(self, date):
+        index = bisect_left(self._exception_dates, date)
+        if index < len(self._exception_dates) and self._exception_dates[index] == date:
+            return index
+        return None
+
+    def slot_minutes_on(self, date):
+        """Return the sorted slot starts for a date, exceptions applied"""
+        index = self._exception_index(date)
+        if index is None:
+            return self._slots[date.weekday()]
+        return self._exception_slots[index]
+
+    def slot_count_on(self, date):
+        """Return the number of bookable slots on a date"""
+        return len(self.slot_minutes_on(date))
+
+    def is_open_on(self, date):
+        """Check if a date offers any slot"""
+        return bool(self.slot_minutes_on(date))
+
+    def is_valid_slot_on(self, date, minutes):
+        """Check if a slot starts at ``minutes`` on a date"""
+        return minutes in self.slot_minutes_on(date)
+
+    def open_dates(self, start, end):
+        """Return the dates from ``start`` to ``end`` that offer any slot
+
+        Only the exceptions inside the window are looked at, found with two
+        binary searches.
+        """
+        low = bisect_left(self._exception_dates, start)
+        high = bisect_right(self._exception_dates, end)
+        overrides = dict(zip(self._exception_dates[low:high], self._exception_slots[low:high]))
+
+        dates = []
+        date = start
+        while date <= end:
+            if date in overrides:
+                if overrides[date]:
+                    dates.append(date)
+            elif self.has_schedule(date.weekday()):
+                dates.append(date)
+            date += datetime.timedelta(days=1)
+        return dates
+
+    def closed_reason(self, date):
+        """Return the reason given for closing a date, or ''"""
+        index = self._exception_index(date)
+        return '' if index is None else self._exception_reasons[index]
+
+    def closed_message(self, date):
+        """Explain why a date offers no slot"""
+        index = self._exception_index(date)
+        if index is None or not self.has_schedule(date.weekday()):
+            day_name = dict(AvailableDay.DAYS_OF_WEEK)[date.weekday()]
+            return f"Appointments are not available on {day_name}s."
+        message = f"Appointments are not available on {date.strftime('%A, %B %d')}"
+        reason = self._exception_reasons[index]
+        return f"{message} ({reason})." if reason else f"{message}."
+
+
+NO_CALENDAR = CalendarSchedule([SlotList()] * 7, {})
+
+
+class ScheduleIndex(CalendarSchedule):
+    """Every calendar's slots, built from two queries
+
+    The index itself answers for all calendars combined (a slot is offered
+    when any calendar offers it); ``calendar()`` narrows it to one resource,
+    or to the shared calendar for ``None``. It is cached per process by
+    ``get_schedule_index`` and rebuilt whenever an ``AvailableDay``,
+    ``ScheduleException`` or ``Resource`` is saved or deleted, so callers
+    can look up slots instead of regenerating them from the rules.
+    """
+
+    def __init__(self, available_days, exceptions=()):
+        rules = defaultdict(list)
+        resources = {}
+        for day in available_days:
+            rules[day.resource_id].append(day)
+            if day.resource_id is not None:
+                resources[day.resource_id] = day.resource
+
+        # Exceptions without a resource close every calendar and add extra
+        # hours to the shared one
+        shared, own = [], defaultdict(list)
+        for exception in exceptions:
+            if exception.resource_id is None:
+                shared.append(exception)
+            else:
+                own[exception.resource_id].append(exception)
+                resources[exception.resource_id] = exception.resource
+        closed_everywhere = [e for e in shared if e.kind == 'closed']
+
+        calendar_ids = set(rules) | set(resources)
+        if any(e.kind == 'extra' for e in shared):
+            calendar_ids.add(None)
+
+        self.calendars = {
+            resource_id: CalendarSchedule.from_rules(
+                rules[resource_id],
+                shared if resource_id is None else closed_everywhere + own[resource_id],
+            )
+            for resource_id in calendar_ids
+        }
+        # Resources with a calendar, in display order
+        self.resources = dict(sorted(resources.items(), key=lambda item: item[1].name))
+        self.capacities = {resource_id: resource.capacity for resource_id, resource in resources.items()}
+
+        super().__init__(*self.merge(self.calendars.values()))
+
+    @classmethod
+    def load(cls):
+        """Build the index from the active weekly rules and upcoming exceptions"""
+        return cls(list(active_rules()), list(upcoming_exceptions()))
+
+    @classmethod
+    async def aload(cls):
+        """Async load()"""
+        return cls(
+            [day async for day in active_rules()],
+            [exception async for exception in upcoming_exceptions()],
+        )
+
+    def calendar(self, resource_id):
+        """Return the schedule of a resource, or of the shared calendar for None"""
+        return self.calendars.get(resource_id, NO_CALENDAR)
+
+    def capacity(self, resource_id):
+        """Return how many bookings a slot of a calendar holds"""
+        return self.capacities.get(resource_id, 1)
+
+    def calendar_order(self):
+        """Return the calendar ids in booking preference order, shared first"""
+        return [resource_id for resource_id in (None, *self.resources) if resource_id in self.calendars]
+
+
+def get_schedule_index():
+    """Return the cached schedule index for this process"""
+    return schedule_index_cache.get()
+
+
+async def aget_schedule_index():
+    """Async get_schedule_index()"""
+    return await schedule_index_cache.aget()
+
+
+def free_slot_minutes(date, resource_id=None):
+    """Return the free slot starts for a date as a SlotList"""
+    return free_slot_minutes_for_range(date, date, resource_id).get(date, SlotList())
+
+
+async def afree_slot_minutes(date, resource_id=None):
+    """Async free_slot_minutes()"""
+    return (await afree_slot_minutes_for_range(date, date, resource_id)).get(date, SlotList())
+
+
+def _booked_rows(dates):
+    # Bookings per calendar and slot, counted by the database
+    return active_appointments().filter(
+        appointment_date__range=(dates[0], dates[-1])
+    ).order_by().values('resource', 'appointment_date', 'appointment_time').annotate(
+        booked=Count('id')
+    ).values_list('resource', 'appointment_date', 'appointment_time', 'booked')
+
+
+def _free_slots(schedule, dates, booked_rows):
+    # Slots whose bookings reached the capacity, per (calendar, date)
+    full = defaultdict(set)
+    for resource_id, booked_date, booked_time, booked in booked_rows:
+        if booked >= schedule.capacity(resource_id):
+            full[resource_id, booked_date].add(time_to_minutes(booked_time))
+    return {
+        date: {
+            resource_id: calendar.slot_minutes_on(date).difference(full.get((resource_id, date)))
+            for resource_id, calendar in schedule.calendars.items()
+            if calendar.is_open_on(date)
+        }
+        for date in dates
+    }
+
+
+def _pick_calendar(free_by_resource, resource_id):
+    """Reduce {calendar: free SlotList} to one calendar, or to all of them"""
+    if resource_id is not None:
+        return free_by_resource.get(resource_id)
+    if len(free_by_resource) == 1:
+        return next(iter(free_by_resource.values()))
+    return SlotList.from_ranges(free_by_resource.values())
+
+
+def free_slots_by_resource_for_range(start, end):
+    """Return {date: {resource id: SlotList of free slots}} for a range
+
+    Covers every date on which any calendar is open; the shared calendar
+    is keyed ``None``. Booked times are reduced to minute-of-day integers
+    and filtered out of each calendar's SlotList, so no ``datetime.time``
+    objects are created. Results are cached per date until an appointment
+    on that date changes, in any worker: the cache keys carry each date's
+    appointment changes, read with one grouped query. Dates missing from
+    the cache share one more grouped Appointment query, however many
+    resources there are.
+    """
+    schedule = get_schedule_index()
+    dates = schedule.open_dates(start, end)
+    if not dates:
+        return {}
+
+    # Versions and bookings come from the primary, so the slots are never
+    # older than an ETag read from a replica
+    with use_primary():
+        changes = _changes_by_date(_appointment_changes(dates))
+    cache = availability_cache()
+    keys = {free_slots_key(date, changes.get(date, NO_APPOINTMENT_CHANGES)): date for date in dates}
+    free = {keys[key]: slots for key, slots in cache.get_many(list(keys)).items()}
+
+    missing = [date for date in dates if date not in free]
+    if missing:
+        with use_primary():
+            rows = list(_booked_rows(missing))
+        fresh = _free_slots(schedule, missing, rows)
+        cache.set_many({key: fresh[date] for key, date in keys.items() if date in fresh})
+        free.update(fresh)
+
+    return {date: free[date] for date in dates}
+
+
+async def afree_slots_by_resource_for_range(start, end):
+    """Async free_slots_by_resource_for_range()"""
+    schedule = await aget_schedule_index()
+    dates = schedule.open_dates(start, end)
+    if not dates:
+        return {}
+
+    with use_primary():
+        changes = _changes_by_date([row async for row in _appointment_changes(dates)])
+    cache = availability_cache()
+    keys = {free_slots_key(date, changes.get(date, NO_APPOINTMENT_CHANGES)): date for date in dates}
+    free = {keys[key]: slots for key, slots in (await cache.aget_many(list(keys))).items()}
+
+    missing = [date for date in dates if date not in free]
+    if missing:
+        with use_primary():
+            rows = [row async for row in _booked_rows(missing)]
+        fresh = _free_slots(schedule, missing, rows)
+        await cache.aset_many({key: fresh[date] for key, date in keys.items() if date in fresh})
+        free.update(fresh)
+
+    return {date: free[date] for date in dates}
+
+
+def free_slot_minutes_for_range(start, end, resource_id=None):
+    """Return {date: SlotList of free slots} for every scheduled date in a range
+
+    Slots are those free on ``resource_id``'s calendar, or on any calendar
+    when it is None. Dates the calendar is closed on are omitted.
+    """
+    by_resource = free_slots_by_resource_for_range(start, end)
+    picked = {date: _pick_calendar(free, resource_id) for date, free in by_resource.items()}
+    return {date: slots for date, slots in picked.items() if slots is not None}
+
+
+async def afree_slot_minutes_for_range(start, end, resource_id=None):
+    """Async free_slot_minutes_for_range()"""
+    by_resource = await afree_slots_by_resource_for_range(start, end)
+    picked = {date: _pick_calendar(free, resource_id) for date, free in by_resource.items()}
+    return {date: slots for date, slots in picked.items() if slots is not None}
+
+
+class AvailabilityEngine:
+    """Answer date availability questions from a single schedule load"""
+
+    def __init__(self, schedule=None):
+        self.schedule = schedule or get_schedule_index()
+
+    def is_available_weekday(self, day_of_week):
+        """Check if any active schedule exists for a day of the week"""
+        return self.schedule.has_schedule(day_of_week)
+
+    def available_dates(self, start=None, days=30):
+        """Return the dates in the window that offer any slot"""
+        if start is None:
+            start = datetime.date.today()
+        if days <= 0:
+            return []
+        return self.schedule.open_dates(start, start + datetime.timedelta(days=days - 1))
+
+    def get_available_days(self, start=None, days=30):
+        """Return available days in the window with their booking status"""
+        if start is None:
+            start = datetime.date.today()
+
+        dates = self.available_dates(start, days)
+        if not dates:
+            return []
+
+        # A date is fully booked once no calendar has a free seat left
+        free = free_slot_minutes_for_range(dates[0], dates[-1])
+
+        available_days = []
+        for check_date in dates:
+            available_days.append({
+                'date': check_date,
+                'day_name': check_date.strftime('%A'),
+                'formatted': check_date.strftime('%Y-%m-%d'),
+                'fully_booked': not free.get(check_date),
+            })
+        return available_days
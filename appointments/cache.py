@@ -0,0 +1,200 @@
+"""
+Process-local caches for the appointment booking system.
+
+Cached values live in each worker's memory next to the version they were
+loaded at. The version is the modification time of a small stamp file, so
+a change saved by one gunicorn worker is noticed by every other worker on
+its next lookup without a database round trip. A maximum age bounds
+staleness even when workers do not share a filesystem.
+
+Per-date availability is stored in the ``availability`` cache from
+settings.CACHES instead, keyed on each date's appointment changes.
+Rendered booking page fragments are keyed on ``booking_page_version()``.
+"""
+import datetime
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from church_records.caches import is_shared_cache
+from church_records.routers import use_primary
+
+
+class VersionStamp:
+    """Cross-process version marker backed by a file modification time"""
+
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def path(self):
+        return Path(settings.CACHE_VERSION_DIR) / f'{self.name}.version'
+
+    def get(self):
+        """Return the current version, or 0 if it was never bumped"""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self):
+        """Move the version forward so every process reloads its copy"""
+        path = self.path
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+            version = max(time.time_ns(), self.get() + 1)
+            os.utime(path, ns=(version, version))
+        except OSError:
+            # Workers fall back to the maximum age of their cached copy
+            pass
+
+
+class VersionedValue:
+    """A value cached in process memory until its version stamp moves"""
+
+    def __init__(self, stamp, loader, max_age, aloader=None):
+        self.stamp = stamp
+        self.loader = loader
+        self.aloader = aloader
+        self.max_age = max_age
+        self._entry = None
+
+    def _cached(self, version, now):
+        entry = self._entry
+        if entry is not None:
+            value, loaded_version, loaded_at = entry
+            if loaded_version == version and now - loaded_at < self.max_age:
+                return entry
+        return None
+
+    def get(self):
+        """Return the cached value, reloading it if it is stale"""
+        version = self.stamp.get()
+        now = time.monotonic()
+        entry = self._cached(version, now)
+        if entry is not None:
+            return entry[0]
+
+        # Cached values outlive any replica lag, so load them from the primary
+        with use_primary():
+            value = self.loader()
+        self._entry = (value, version, now)
+        return value
+
+    async def aget(self):
+        """Async get(), reloading a stale value with the async loader"""
+        version = self.stamp.get()
+        now = time.monotonic()
+        entry = self._cached(version, now)
+        if entry is not None:
+            return entry[0]
+
+        with use_primary():
+            value = await self.aloader()
+        self._entry = (value, version, now)
+        return value
+
+    def clear(self):
+        """Drop this process's copy without touching other processes"""
+        self._entry = None
+
+    def invalidate(self):
+        """Drop the cached value in this and every other process"""
+        self._entry = None
+        self.stamp.bump()
+
+
+def _load_booking_settings():
+    from .models import BookingSettings
+    return BookingSettings.get_settings()
+
+
+async def _aload_booking_settings():
+    from .models import BookingSettings
+    return await BookingSettings.aget_settings()
+
+
+def _load_schedule_index():
+    from .availability import ScheduleIndex
+    return ScheduleIndex.load()
+
+
+async def _aload_schedule_index():
+    from .availability import ScheduleIndex
+    return await ScheduleIndex.aload()
+
+
+booking_settings_cache = VersionedValue(
+    VersionStamp('booking_settings'),
+    _load_booking_settings,
+    max_age=settings.BOOKING_SETTINGS_CACHE_TIMEOUT,
+    aloader=_aload_booking_settings,
+)
+
+schedule_index_cache = VersionedValue(
+    VersionStamp('schedule'),
+    _load_schedule_index,
+    max_age=settings.SCHEDULE_CACHE_TIMEOUT,
+    aloader=_aload_schedule_index,
+)
+
+
+# Moves whenever any appointment changes; versions whole-window fragments
+# such as the booking page, which are not keyed on per-date versions
+availability_stamp = VersionStamp('availability')
+
+
+def availability_cache():
+    return caches['availability']
+
+
+def availability_cache_is_shared():
+    """Whether other processes read the availability cache this one writes"""
+    return is_shared_cache(availability_cache())
+
+
+def _availability_key(kind, date):
+    # The schedule version is part of the key, so editing an AvailableDay, a
+    # ScheduleException or a Resource retires every cached date at once
+    return f'{kind}:{schedule_index_cache.stamp.get()}:{date.isoformat()}'
+
+
+def free_slots_key(date, changes):
+    """Cache key of the free SlotList of each calendar on a date
+
+    ``changes`` is the (row count, latest change) of the date's
+    appointments. Any booking saved or deleted by any worker moves it, so
+    a worker never reads slots cached before that booking, whatever cache
+    backend is configured.
+    """
+    count, changed = changes
+    return '%s:%d:%s' % (
+        _availability_key('free-slots-by-resource', date), count, changed.isoformat() if changed else '',
+    )
+
+
+def invalidate_availability():
+    """Move the booking page version after an appointment change
+
+    Per-date free slots need no invalidation; their keys move by
+    themselves (see ``free_slots_key``).
+    """
+    availability_stamp.bump()
+
+
+def booking_page_version():
+    """Version of the cached booking page fragments
+
+    Moves with the booking settings, the schedule and its exceptions, any
+    appointment change and the date, all read from stamp files without a
+    query.
+    """
+    return '-'.join(str(part) for part in (
+        booking_settings_cache.stamp.get(),
+        schedule_index_cache.stamp.get(),
+        availability_stamp.get(),
+        datetime.date.today(),
+    ))
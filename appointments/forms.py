@@ -1,7 +1,11 @@
 from django import forms
 from django.utils import timezone
 import datetime
-from .models import Appointment, AvailableDay, BookingSettings
+from .models import Appointment, BookingSettings
+from .availability import (
+    AvailabilityEngine, free_slot_minutes_for_range, free_slots_by_resource_for_range,
+    get_schedule_index, time_to_minutes,
+)
 
 class AppointmentForm(forms.ModelForm):
     """Form for booking public appointments"""
@@ -28,10 +32,13 @@ class AppointmentForm(forms.ModelForm):
         model = Appointment
         fields = [
             'name', 'email', 'phone', 
-            'appointment_date', 'appointment_time', 
+            'resource', 'appointment_date', 'appointment_time', 
             'purpose', 'additional_notes'
         ]
         widgets = {
+            'resource': forms.Select(attrs={
+                'class': 'form-control'
+            }),
             'name': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Your full name',
@@ -71,20 +78,45 @@ class AppointmentForm(forms.ModelForm):
         self.fields['appointment_time'].widget.choices = [
             ('', 'Select a date first to see available times')
         ]
+        
+        # Offer the resources with a calendar, read from the cached schedule
+        # index when the field is rendered instead of querying for them
+        self.fields['resource'].choices = self.resource_choices
+        self.fields['resource'].help_text = "Leave as is to book the first available time."
+    
+    @staticmethod
+    def resource_choices():
+        """Return the select options: any calendar, then each resource"""
+        resources = get_schedule_index().resources
+        return [('', 'First available')] + [
+            (pk, f"{resource} ({resource.get_kind_display()})") for pk, resource in resources.items()
+        ]
+    
+    @property
+    def offers_resources(self):
+        """Check if visitors can choose between resources"""
+        return bool(get_schedule_index().resources)
     
     def clean(self):
         """Validate the appointment details"""
         cleaned_data = super().clean()
         appointment_date = cleaned_data.get('appointment_date')
         appointment_time = cleaned_data.get('appointment_time')
+        resource = cleaned_data.get('resource')
         
         # Check if the system is enabled
-        booking_settings = BookingSettings.get_settings()
+        booking_settings = BookingSettings.get_cached_settings()
         if not booking_settings.is_enabled:
             raise forms.ValidationError(
                 "The appointment booking system is currently disabled. Please try again later."
             )
         
+        # The chosen resource's calendar, or every calendar for the first
+        # available one
+        schedule = get_schedule_index()
+        if resource is not None:
+            schedule = schedule.calendar(resource.pk)
+        
         # Validation for date
         if appointment_date:
             # Check if date is in the past
@@ -92,78 +124,56 @@ class AppointmentForm(forms.ModelForm):
             if appointment_date < today:
                 self.add_error('appointment_date', "Appointment date cannot be in the past.")
             
-            # Check if the day is available
-            day_of_week = appointment_date.weekday()
-            available_days = AvailableDay.objects.filter(
-                day_of_week=day_of_week,
-                is_active=True
-            )
-            
-            if not available_days.exists():
-                day_name = dict(AvailableDay.DAYS_OF_WEEK)[day_of_week]
+            # Check if the day is available, including date exceptions
+            if not schedule.is_open_on(appointment_date):
                 self.add_error('appointment_date', 
-                              f"Appointments are not available on {day_name}s. "
+                              f"{schedule.closed_message(appointment_date)} "
                               "Please select another day.")
         
         # Validation for time
         if appointment_date and appointment_time:
             # Check if the selected time is valid for the day
-            valid_slot = False
-            available_days = AvailableDay.objects.filter(
-                day_of_week=appointment_date.weekday(),
-                is_active=True
+            # (compares hours and minutes, ignoring seconds)
+            valid_slot = schedule.is_valid_slot_on(
+                appointment_date,
+                time_to_minutes(appointment_time)
             )
             
-            for day in available_days:
-                time_slots = day.get_time_slots()
-                for slot_time in time_slots:
-                    # Compare hours and minutes (ignore seconds)
-                    if (slot_time.hour == appointment_time.hour and 
-                        slot_time.minute == appointment_time.minute):
-                        valid_slot = True
-                        break
-                
-                if valid_slot:
-                    break
-            
             if not valid_slot:
                 self.add_error('appointment_time', 
                               "The selected time slot is not available. "
                               "Please select a different time.")
-            
-            # Check if the time slot is already booked
-            existing_appointments = Appointment.objects.filter(
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                status__in=['pending', 'approved']
-            )
-            
-            if existing_appointments.exists():
-                self.add_error('appointment_time', 
-                              "This time slot is already booked. "
-                              "Please select another time.")
+            elif resource is None and 'resource' not in self.errors:
+                self.assign_first_available(appointment_date, appointment_time)
         
         return cleaned_data
     
-    def get_available_days(self):
-        """Return a list of available days for the next 30 days"""
-        available_days = []
-        today = datetime.date.today()
-        
-        # Check the next 30 days
-        for i in range(30):
-            check_date = today + datetime.timedelta(days=i)
-            day_of_week = check_date.weekday()
-            
-            # Check if this day of week is available
-            if AvailableDay.objects.filter(day_of_week=day_of_week, is_active=True).exists():
-                available_days.append({
-                    'date': check_date,
-                    'day_name': check_date.strftime('%A'),
-                    'formatted': check_date.strftime('%Y-%m-%d')
-                })
+    def assign_first_available(self, date, time):
+        """Book the first calendar with a free seat at the chosen slot
+
+        Reads the cached free slots, so a seat taken since is caught by the
+        seat check of Appointment.clean or the unique constraint.
+        """
+        schedule = get_schedule_index()
+        calendars = schedule.calendar_order()
+        if len(calendars) == 1:
+            # Nothing to choose; a full slot is reported by the seat check
+            self.cleaned_data['resource'] = schedule.resources.get(calendars[0])
+            return
         
-        return available_days
+        minutes = time_to_minutes(time)
+        free = free_slots_by_resource_for_range(date, date).get(date, {})
+        for resource_id in calendars:
+            if minutes in free.get(resource_id, ()):
+                self.cleaned_data['resource'] = schedule.resources.get(resource_id)
+                return
+        self.add_error('appointment_time', 
+                      "This time slot is fully booked. "
+                      "Please select another time.")
+    
+    def get_available_days(self, days=30):
+        """Return a list of available days for the next ``days`` days"""
+        return AvailabilityEngine().get_available_days(days=days)
     
     def get_time_slots_for_day(self, date):
         """Return available time slots for a specific date"""
@@ -177,42 +187,12 @@ class AppointmentForm(forms.ModelForm):
             except ValueError:
                 return []
         
-        day_of_week = date.weekday()
-        available_slots = []
-        
-        # Get all available day configurations for this day of week
-        available_days = AvailableDay.objects.filter(
-            day_of_week=day_of_week,
-            is_active=True
-        )
-        
-        # Get all booked slots for this date to exclude them
-        booked_times = Appointment.objects.filter(
-            appointment_date=date,
-            status__in=['pending', 'approved']
-        ).values_list('appointment_time', flat=True)
-        
-        # Generate all possible time slots
-        for day in available_days:
-            time_slots = day.get_time_slots()
-            
-            for slot_time in time_slots:
-                # Check if this slot is already booked
-                is_booked = False
-                for booked_time in booked_times:
-                    if (slot_time.hour == booked_time.hour and 
-                        slot_time.minute == booked_time.minute):
-                        is_booked = True
-                        break
-                
-                if not is_booked:
-                    formatted_time = slot_time.strftime('%I:%M %p')
-                    value = slot_time.strftime('%H:%M')
-                    available_slots.append({
-                        'time': slot_time,
-                        'formatted': formatted_time,
-                        'value': value
-                    })
-        
-        return available_slots
+        return self.get_time_slots_for_range(date, date).get(date, [])
+    
+    def get_time_slots_for_range(self, start, end):
+        """Return {date: available time slots} for every scheduled date in a range"""
+        return {
+            date: free_slots.slots()
+            for date, free_slots in free_slot_minutes_for_range(start, end).items()
+        }
 
@@ -0,0 +1,68 @@
+"""
+Shared helpers for the benchmark management commands.
+
+Benchmarks run against a throwaway copy of the schema so that seeding
+thousands of rows never touches the real database.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def benchmark_database():
+    """Create a scratch test database for the duration of the block"""
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def time_calls(func, repeat):
+    """Call ``func`` ``repeat`` times and return the duration of each call"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(ordered, pct):
+    """Return the nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Summarize timing samples (seconds) as millisecond latency figures"""
+    ordered = sorted(samples)
+    count = len(ordered)
+    return {
+        'count': count,
+        'mean_ms': (sum(ordered) / count * 1000) if count else 0.0,
+        'p50_ms': percentile(ordered, 50) * 1000,
+        'p90_ms': percentile(ordered, 90) * 1000,
+        'p99_ms': percentile(ordered, 99) * 1000,
+        'max_ms': (ordered[-1] * 1000) if count else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    """Render a summary produced by ``summarize`` as a single line"""
+    return (
+        f"{label}: n={summary['count']} "
+        f"mean={summary['mean_ms']:.2f}ms "
+        f"p50={summary['p50_ms']:.2f}ms "
+        f"p90={summary['p90_ms']:.2f}ms "
+        f"p99={summary['p99_ms']:.2f}ms "
+        f"max={summary['max_ms']:.2f}ms"
+    )
@@ -0,0 +1,133 @@
+"""
+Compare the sync and async variants of the read-heavy views under concurrency.
+
+Each variant is driven the way an ASGI server runs it: async views are
+awaited on the event loop with a thread-sensitive context per request,
+sync views run in the loop's thread pool. Either way connections are
+recycled after each request the way ``request_finished`` does it.
+``--concurrency`` requests are kept in flight until ``--requests`` have
+completed.
+"""
+import asyncio
+import datetime
+import time
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.test import AsyncRequestFactory
+
+from appointments.cache import booking_settings_cache, schedule_index_cache
+from appointments.models import Appointment, AvailableDay, BookingSettings
+from appointments.views import AppointmentTimeSlotsView, AsyncAppointmentTimeSlotsView
+from members.models import Member
+from members.views import (
+    AsyncMemberDetailView, AsyncMemberListView, MemberDetailView, MemberListView,
+)
+
+from ._bench import benchmark_database, format_summary, summarize
+
+
+def run_sync(view, request, kwargs):
+    """Call a sync view in a worker thread, then recycle that thread's connections"""
+    try:
+        return view(request, **kwargs)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Compare throughput and latency of the sync and async views at several concurrency levels'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50],
+                            help='Numbers of requests kept in flight')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per view, variant and concurrency level')
+        parser.add_argument('--members', type=int, default=500,
+                            help='Number of members seeded')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            target_date, member = self.seed(options['members'])
+            factory = AsyncRequestFactory()
+            endpoints = [
+                ('time-slots', AppointmentTimeSlotsView, AsyncAppointmentTimeSlotsView,
+                 lambda: factory.get('/', {'date': target_date.isoformat()}), {}),
+                ('member-list', MemberListView, AsyncMemberListView,
+                 lambda: factory.get('/'), {}),
+                ('member-detail', MemberDetailView, AsyncMemberDetailView,
+                 lambda: factory.get('/'), {'pk': member.pk}),
+            ]
+            for name, sync_view, async_view, make_request, kwargs in endpoints:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                for concurrency in options['concurrency']:
+                    for label, view, is_async in (
+                        ('sync', sync_view.as_view(), False),
+                        ('async', async_view.as_view(), True),
+                    ):
+                        samples, elapsed = asyncio.run(self.drive(
+                            view, is_async, make_request, kwargs,
+                            concurrency, options['requests'],
+                        ))
+                        self.stdout.write(
+                            f'  {format_summary(f"{label} c={concurrency}", summarize(samples))} '
+                            f'throughput={len(samples) / elapsed:.0f}/s'
+                        )
+            connections.close_all()
+
+    async def drive(self, view, is_async, make_request, kwargs, concurrency, total):
+        """Keep ``concurrency`` requests in flight; return (latencies, wall time)"""
+        remaining = total
+        samples = []
+
+        async def call():
+            request = make_request()
+            if is_async:
+                # What ASGIHandler does for every request
+                async with ThreadSensitiveContext():
+                    await view(request, **kwargs)
+                    await sync_to_async(close_old_connections)()
+            else:
+                await sync_to_async(run_sync, thread_sensitive=False)(view, request, kwargs)
+
+        async def client():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                await call()
+                samples.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+    def seed(self, members):
+        """Create one open weekday with some bookings, and a member roster"""
+        booking_settings_cache.clear()
+        schedule_index_cache.clear()
+        BookingSettings.get_settings()
+        target_date = datetime.date.today() + datetime.timedelta(days=1)
+        day = AvailableDay.objects.create(
+            day_of_week=target_date.weekday(),
+            start_time=datetime.time(8, 0),
+            end_time=datetime.time(18, 0),
+            slot_duration=5,
+        )
+        Appointment.objects.bulk_create([
+            Appointment(
+                name=f'Bench {i}',
+                email=f'bench{i}@example.com',
+                phone='0200000000',
+                appointment_date=target_date,
+                appointment_time=slot_time,
+                purpose='Benchmark',
+            )
+            for i, slot_time in enumerate(day.get_time_slots()[::2])
+        ])
+        Member.objects.bulk_create([
+            Member(name=f'Member {i}', email=f'member{i}@example.com', telephone_number='0200000000')
+            for i in range(members)
+        ])
+        return target_date, Member.objects.first()
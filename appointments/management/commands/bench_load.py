@@ -0,0 +1,332 @@
+"""
+Load-test the booking flow with several processes replaying mixed traffic.
+
+By default every worker process drives the app through the Django test
+client against a throwaway copy of the schema, so the run is offline and
+self-contained but still contends for the same SQLite file. With
+``--url`` the workers send real HTTP requests to a running server
+(e.g. ``manage.py runserver``) instead; pass ``--seed`` to also seed the
+database that server uses.
+
+Results, including the settings of the run, are written to a JSON file so
+that runs can be compared across commits.
+"""
+import datetime
+import http.cookiejar
+import json
+import multiprocessing
+import platform
+import random
+import re
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import nullcontext
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+
+from appointments.availability import ScheduleIndex, minutes_to_time
+from appointments.models import Appointment, AvailableDay, BookingSettings
+from members.models import Member
+
+from ._bench import benchmark_database, summarize
+
+# Relative weight of each operation in the replayed traffic
+TRAFFIC_MIX = {
+    'booking_page': 10,
+    'time_slots': 55,
+    'booking_post': 15,
+    'member_list': 20,
+}
+
+
+class ClientTransport:
+    """Send requests through the Django test client"""
+
+    def __init__(self):
+        self.client = Client(raise_request_exception=False)
+
+    def get(self, path, params=None):
+        return self.client.get(path, params).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data).status_code
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpTransport:
+    """Send requests to a running server, keeping cookies and the CSRF token"""
+
+    csrf_pattern = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+        self.csrf_token = ''
+
+    def request(self, path, params=None, data=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        headers = {'Referer': self.base_url + path}
+        try:
+            with self.opener.open(urllib.request.Request(url, body, headers), timeout=30) as response:
+                content = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+        match = self.csrf_pattern.search(content.decode('utf-8', 'replace'))
+        if match:
+            self.csrf_token = match.group(1)
+        return status
+
+    def get(self, path, params=None):
+        return self.request(path, params)
+
+    def post(self, path, data):
+        if not self.csrf_token:
+            self.request(path)
+        return self.request(path, data={**data, 'csrfmiddlewaretoken': self.csrf_token})
+
+
+def run_worker(worker, options, candidates, start_at):
+    """Replay traffic until the deadline and return (operation, seconds, status) samples"""
+    # Never share the parent's SQLite handle across the fork
+    connections.close_all()
+
+    transport = HttpTransport(options['url']) if options['url'] else ClientTransport()
+    rng = random.Random(options['random_seed'] + worker)
+    operations = list(TRAFFIC_MIX)
+    weights = list(TRAFFIC_MIX.values())
+    urls = {
+        'booking_page': reverse('appointment-create'),
+        'time_slots': reverse('appointment-time-slots'),
+        'member_list': reverse('member-list'),
+    }
+    dates = sorted({date for date, _ in candidates})
+
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + options['duration']
+    samples = []
+    sequence = 0
+
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            if operation == 'booking_post':
+                sequence += 1
+                date, slot_time = rng.choice(candidates)
+                status = transport.post(urls['booking_page'], {
+                    'name': f'Load {worker}-{sequence}',
+                    'email': f'load{worker}-{sequence}@example.com',
+                    'phone': '0200000000',
+                    'appointment_date': date,
+                    'appointment_time': slot_time,
+                    'purpose': 'Load test',
+                })
+            elif operation == 'time_slots':
+                status = transport.get(urls['time_slots'], {'date': rng.choice(dates)})
+            else:
+                status = transport.get(urls[operation])
+        except Exception as e:
+            status = type(e).__name__
+        samples.append((operation, time.perf_counter() - started, status))
+
+    connections.close_all()
+    return samples
+
+
+class Command(BaseCommand):
+    help = 'Replay mixed booking traffic from several processes and report throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4,
+                            help='Number of worker processes')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds each worker replays traffic for')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Number of upcoming days bookings are spread over')
+        parser.add_argument('--slot-duration', type=int, default=15,
+                            help='Slot length in minutes of the seeded weekday schedule')
+        parser.add_argument('--appointments', type=int, default=200,
+                            help='Number of appointments seeded before the run')
+        parser.add_argument('--members', type=int, default=2000,
+                            help='Number of members seeded before the run')
+        parser.add_argument('--random-seed', type=int, default=0,
+                            help='Seed of the traffic generator, for repeatable runs')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running server, e.g. http://127.0.0.1:8000 '
+                                 '(default: Django test client against a scratch database)')
+        parser.add_argument('--seed', action='store_true',
+                            help='With --url, seed the configured database the server uses')
+        parser.add_argument('--output', default='bench-load.json',
+                            help='Where to write the JSON results')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise CommandError('The load benchmark needs the fork start method')
+
+        scratch = benchmark_database() if not options['url'] else nullcontext()
+        with scratch:
+            if not options['url'] or options['seed']:
+                self.seed(options)
+            candidates = self.candidates(options['days'])
+            if not candidates:
+                raise CommandError('No bookable slots in the next --days days; seed the schedule')
+
+            # Workers must not inherit an open connection
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            start_at = time.time() + 1.0
+            with context.Pool(options['processes']) as pool:
+                results = pool.starmap(run_worker, [
+                    (worker, options, candidates, start_at)
+                    for worker in range(options['processes'])
+                ])
+            report = self.report(options, [sample for samples in results for sample in samples])
+
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump(report, output, indent=2)
+        self.print_report(report)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def seed(self, options):
+        """Create a weekday schedule, upcoming appointments and members"""
+        BookingSettings.get_settings()
+        for day_of_week in range(5):
+            AvailableDay.objects.get_or_create(
+                day_of_week=day_of_week,
+                start_time=datetime.time(9, 0),
+                end_time=datetime.time(17, 0),
+                defaults={'slot_duration': options['slot_duration']},
+            )
+
+        rng = random.Random(options['random_seed'])
+        candidates = self.candidates(options['days'])
+        taken = set(Appointment.objects.values_list('appointment_date', 'appointment_time'))
+        free = [
+            (date, slot_time) for date, slot_time in candidates
+            if (datetime.date.fromisoformat(date), datetime.time.fromisoformat(slot_time)) not in taken
+        ]
+        Appointment.objects.bulk_create([
+            Appointment(
+                name=f'Seed {i}',
+                email=f'seed{i}@example.com',
+                phone='0200000000',
+                appointment_date=datetime.date.fromisoformat(date),
+                appointment_time=datetime.time.fromisoformat(slot_time),
+                purpose='Load test',
+                status=rng.choice(['pending', 'approved', 'cancelled']),
+            )
+            for i, (date, slot_time) in enumerate(
+                rng.sample(free, min(options['appointments'], len(free))))
+        ])
+
+        existing = Member.objects.count()
+        Member.objects.bulk_create([
+            Member(
+                name=f'Load Member {i}',
+                email=f'load-member{i}@example.com',
+                telephone_number='0200000000',
+            )
+            for i in range(existing, existing + options['members'])
+        ], batch_size=1000)
+
+    def candidates(self, days):
+        """Return every scheduled (date, time) in the window as form strings"""
+        schedule = ScheduleIndex.load()
+        today = datetime.date.today()
+        candidates = []
+        for offset in range(1, days + 1):
+            date = today + datetime.timedelta(days=offset)
+            for minutes in schedule.slot_minutes_on(date):
+                candidates.append((date.isoformat(), minutes_to_time(minutes).strftime('%H:%M')))
+        return candidates
+
+    def report(self, options, samples):
+        """Aggregate samples into per-operation throughput and latency figures"""
+        duration = options['duration']
+        operations = {}
+        for operation in TRAFFIC_MIX:
+            selected = [s for s in samples if s[0] == operation]
+            statuses = {}
+            for _, _, status in selected:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            operations[operation] = {
+                **summarize([seconds for _, seconds, _ in selected]),
+                'throughput_per_s': len(selected) / duration,
+                'statuses': statuses,
+            }
+
+        errors = sum(
+            1 for _, _, status in samples
+            if not isinstance(status, int) or status >= 500
+        )
+        booked = operations['booking_post']['statuses'].get('302', 0)
+        return {
+            'run': {
+                'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'commit': self.git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'database_options': {
+                    key: str(value) for key, value in settings.DATABASES['default'].get('OPTIONS', {}).items()
+                },
+                'target': options['url'] or 'test-client',
+            },
+            'options': {
+                key: options[key] for key in (
+                    'processes', 'duration', 'days', 'slot_duration',
+                    'appointments', 'members', 'random_seed',
+                )
+            },
+            'traffic_mix': TRAFFIC_MIX,
+            'total': {
+                **summarize([seconds for _, seconds, _ in samples]),
+                'throughput_per_s': len(samples) / duration,
+                'errors': errors,
+                'bookings_per_s': booked / duration,
+            },
+            'operations': operations,
+        }
+
+    def git_commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def print_report(self, report):
+        total = report['total']
+        self.stdout.write(
+            f"{report['options']['processes']} processes, {report['options']['duration']}s: "
+            f"{total['count']} requests, {total['throughput_per_s']:.1f} req/s, "
+            f"{total['bookings_per_s']:.1f} bookings/s, {total['errors']} errors"
+        )
+        for operation, figures in report['operations'].items():
+            self.stdout.write(
+                f"  {operation}: n={figures['count']} {figures['throughput_per_s']:.1f}/s "
+                f"p50={figures['p50_ms']:.2f}ms p90={figures['p90_ms']:.2f}ms "
+                f"p99={figures['p99_ms']:.2f}ms statuses={figures['statuses']}"
+            )
@@ -0,0 +1,64 @@
+"""
+Micro-benchmark the compact slot representation against AvailableDay.get_time_slots.
+
+Both pipelines generate a day of slots, drop the booked ones and serialize
+the rest to the time-slots JSON payload. Nothing touches the database.
+"""
+import datetime
+import sys
+
+from django.core.management.base import BaseCommand
+
+from appointments.models import AvailableDay
+from appointments.slots import SlotList
+
+from ._bench import format_summary, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Compare generating, diffing and serializing slots as time objects vs SlotList'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slot-duration', type=int, default=1,
+                            help='Slot length in minutes (1 gives 1439 slots per day)')
+        parser.add_argument('--bookings', type=int, default=1000,
+                            help='Number of booked slots removed from the day')
+        parser.add_argument('--repeat', type=int, default=500,
+                            help='Number of timed runs per pipeline')
+
+    def handle(self, *args, **options):
+        day = AvailableDay(
+            day_of_week=0,
+            start_time=datetime.time(0, 0),
+            end_time=datetime.time(23, 59),
+            slot_duration=options['slot_duration'],
+        )
+        booked_times = set(day.get_time_slots()[:options['bookings']])
+        booked_minutes = {t.hour * 60 + t.minute for t in booked_times}
+
+        def time_objects():
+            free = sorted(set(day.get_time_slots()) - booked_times)
+            return [
+                {'value': t.strftime('%H:%M'), 'text': t.strftime('%I:%M %p')}
+                for t in free
+            ]
+
+        def slot_list():
+            return SlotList(day.get_slot_minutes()).difference(booked_minutes).as_json()
+
+        if time_objects() != slot_list():
+            self.stderr.write(self.style.ERROR('Pipelines disagree on the payload'))
+            return
+
+        slots = day.get_time_slots()
+        compact = SlotList(day.get_slot_minutes())
+        self.stdout.write(
+            f"slots={len(slots)} bookings={len(booked_times)} "
+            f"time-objects={sys.getsizeof(slots) + sum(sys.getsizeof(t) for t in slots)}B "
+            f"slot-list={sys.getsizeof(compact.minutes)}B"
+        )
+
+        for label, func in (('time-objects', time_objects), ('slot-list', slot_list)):
+            func()
+            samples = time_calls(func, options['repeat'])
+            self.stdout.write(format_summary(label, summarize(samples)))
@@ -0,0 +1,70 @@
+"""
+Benchmark the /book-appointment/time-slots/ endpoint on a crowded day.
+"""
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.urls import reverse
+
+from appointments.models import Appointment, AvailableDay, BookingSettings
+
+from ._bench import benchmark_database, format_summary, summarize, time_calls
+
+
+class Command(BaseCommand):
+    help = 'Report p50/p99 latency of the time-slots endpoint for a day with many slots and bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slot-duration', type=int, default=1,
+                            help='Slot length in minutes (1 gives 1439 slots per day)')
+        parser.add_argument('--bookings', type=int, default=1000,
+                            help='Number of booked slots on the benchmarked date')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Number of timed requests')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            target_date = self.seed(options['slot_duration'], options['bookings'])
+            client = Client()
+            url = reverse('appointment-time-slots')
+            params = {'date': target_date.strftime('%Y-%m-%d')}
+
+            # Warm up imports, URL resolution and the connection
+            response = client.get(url, params)
+            free_slots = len(response.json().get('slots', []))
+
+            samples = time_calls(lambda: client.get(url, params), options['requests'])
+
+        self.stdout.write(
+            f"date={target_date} slots={self.slot_count} "
+            f"bookings={options['bookings']} free={free_slots}"
+        )
+        self.stdout.write(format_summary('time-slots', summarize(samples)))
+
+    def seed(self, slot_duration, bookings):
+        """Create one fully open weekday with ``bookings`` booked slots"""
+        BookingSettings.get_settings()
+        target_date = datetime.date.today() + datetime.timedelta(days=1)
+
+        day = AvailableDay.objects.create(
+            day_of_week=target_date.weekday(),
+            start_time=datetime.time(0, 0),
+            end_time=datetime.time(23, 59),
+            slot_duration=slot_duration,
+        )
+        slot_times = day.get_time_slots()
+        self.slot_count = len(slot_times)
+
+        Appointment.objects.bulk_create([
+            Appointment(
+                name=f'Bench {i}',
+                email=f'bench{i}@example.com',
+                phone='0000000000',
+                appointment_date=target_date,
+                appointment_time=slot_time,
+                purpose='Benchmark',
+            )
+            for i, slot_time in enumerate(slot_times[:bookings])
+        ])
+        return target_date
@@ -0,0 +1,151 @@
+"""
+Benchmark concurrent booking writes under each SQLite database profile.
+
+For every profile in church_records.settings.DATABASE_PROFILES, writer
+processes insert appointments as fast as they can while reader processes
+poll availability, all against one scratch database file. Connections are
+recycled after each operation the way the request cycle does it, so
+CONN_MAX_AGE takes effect.
+"""
+import datetime
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+
+from appointments.availability import availability_version
+from appointments.models import Appointment
+from church_records.search import write_transaction
+
+from ._bench import benchmark_database, format_summary, summarize
+
+
+def run_writer(worker, duration, start_at):
+    """Insert appointments until the deadline; return (latencies, lock errors)"""
+    connections.close_all()
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    base_date = datetime.date.today() + datetime.timedelta(days=1 + worker * 1000)
+    latencies = []
+    errors = 0
+    sequence = 0
+
+    while time.perf_counter() < deadline:
+        # One slot per minute of the day, then move on to the next date
+        date = base_date + datetime.timedelta(days=sequence // 1440)
+        minutes = sequence % 1440
+        sequence += 1
+        started = time.perf_counter()
+        try:
+            # Same write path as the booking form
+            with write_transaction():
+                Appointment.objects.create(
+                    name=f'Writer {worker}',
+                    email=f'writer{worker}@example.com',
+                    phone='0200000000',
+                    appointment_date=date,
+                    appointment_time=datetime.time(minutes // 60, minutes % 60),
+                    purpose='Write benchmark',
+                )
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+        close_old_connections()
+
+    connections.close_all()
+    return latencies, errors
+
+
+def run_reader(worker, duration, start_at):
+    """Compute availability versions until the deadline; return (latencies, lock errors)"""
+    connections.close_all()
+    time.sleep(max(0.0, start_at - time.time()))
+    deadline = time.perf_counter() + duration
+    date = datetime.date.today() + datetime.timedelta(days=1)
+    latencies = []
+    errors = 0
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            availability_version(date)
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+        close_old_connections()
+
+    connections.close_all()
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent appointment write throughput across SQLite database profiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='+', default=list(settings.DATABASE_PROFILES),
+                            help='Database profiles to compare (default: all)')
+        parser.add_argument('--writers', type=int, default=4,
+                            help='Number of writer processes')
+        parser.add_argument('--readers', type=int, default=2,
+                            help='Number of reader processes')
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Seconds each profile is benchmarked for')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('bench_writes compares SQLite profiles')
+        unknown = set(options['profiles']) - set(settings.DATABASE_PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown database profiles: {', '.join(sorted(unknown))}")
+
+        original = {
+            key: connection.settings_dict[key]
+            for key in ('OPTIONS', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')
+        }
+        try:
+            for name in options['profiles']:
+                self.apply_profile(settings.DATABASE_PROFILES[name])
+                self.benchmark(name, options)
+        finally:
+            connection.close()
+            connection.settings_dict.update(original)
+
+    def apply_profile(self, profile):
+        """Point the default connection at a profile's settings"""
+        connection.close()
+        connection.settings_dict.update({
+            'OPTIONS': {**profile['OPTIONS']},
+            'CONN_MAX_AGE': profile.get('CONN_MAX_AGE', 0),
+            'CONN_HEALTH_CHECKS': profile.get('CONN_HEALTH_CHECKS', False),
+        })
+
+    def benchmark(self, name, options):
+        duration = options['duration']
+        with benchmark_database():
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            start_at = time.time() + 1.0
+            processes = options['writers'] + options['readers']
+            with context.Pool(processes) as pool:
+                writers = pool.starmap_async(run_writer, [
+                    (worker, duration, start_at) for worker in range(options['writers'])
+                ])
+                readers = pool.starmap_async(run_reader, [
+                    (worker, duration, start_at) for worker in range(options['readers'])
+                ])
+                write_results, read_results = writers.get(), readers.get()
+
+        write_samples = [s for latencies, _ in write_results for s in latencies]
+        read_samples = [s for latencies, _ in read_results for s in latencies]
+        write_errors = sum(errors for _, errors in write_results)
+        read_errors = sum(errors for _, errors in read_results)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name}: {len(write_samples) / duration:.0f} writes/s, "
+            f"{len(read_samples) / duration:.0f} reads/s, "
+            f"{write_errors} write errors, {read_errors} read errors"
+        ))
+        self.stdout.write('  ' + format_summary('write', summarize(write_samples)))
+        self.stdout.write('  ' + format_summary('read', summarize(read_samples)))
@@ -0,0 +1,86 @@
+"""
+Print the database query plan for every hot booking query.
+
+Run this against a production-sized database to confirm the indexes from
+appointments/migrations are used, e.g. ``SEARCH ... USING INDEX`` rather
+than ``SCAN`` on SQLite. The querysets come from the same functions and
+views the application runs, so the plans are those of the real SQL.
+"""
+import datetime
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+
+from appointments.availability import _appointment_changes, _booked_rows, active_rules, upcoming_exceptions
+from appointments.models import Appointment
+from members.models import Member
+from members.pagination import KeysetPage, encode_cursor
+from members.views import MemberListView
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN QUERY PLAN output for the hot appointment and member queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', default=None,
+                            help='Date (YYYY-MM-DD) used as the query parameter, defaults to today')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            date = datetime.datetime.strptime(options['date'], '%Y-%m-%d').date()
+        else:
+            date = datetime.date.today()
+
+        for label, queryset in self.hot_queries(date):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(f'  {queryset.query}')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+            self.stdout.write('')
+
+    def hot_queries(self, date):
+        """Return (label, queryset) pairs of the application queries"""
+        window_end = date + datetime.timedelta(days=29)
+        slot = Appointment(appointment_date=date, appointment_time=datetime.time(9, 0))
+        # A cursor in the middle of the roster, as on a deep page
+        cursor = encode_cursor(Member(pk=2 ** 31 - 1, created_at=timezone.now() - datetime.timedelta(days=365)))
+        return [
+            ('Appointment versions per date (ETag and free-slot cache keys)',
+             _appointment_changes([date, window_end])),
+            ('Bookings per calendar and slot for one date (time-slots endpoint)',
+             _booked_rows([date])),
+            ('Bookings per calendar and slot (booking page date window)',
+             _booked_rows([date, window_end])),
+            ('Seats taken in a slot (Appointment.assign_seat)',
+             slot.taken_seats()),
+            ('Active weekly schedule (ScheduleIndex.load)',
+             active_rules()),
+            ('Upcoming schedule exceptions (ScheduleIndex.load)',
+             upcoming_exceptions()),
+            ('Member roster, first page (MemberListView)',
+             self.roster_page()),
+            ('Member roster, deep page (MemberListView)',
+             self.roster_page(after=cursor)),
+            ('Admin changelist filtered by status',
+             self.changelist_page(Appointment, {'status__exact': 'pending'})),
+            ('Admin date_hierarchy month drill-down',
+             self.changelist_page(Appointment, {
+                 'appointment_date__year': str(date.year),
+                 'appointment_date__month': str(date.month),
+             })),
+        ]
+
+    def roster_page(self, after=None):
+        """Return the query a MemberListView page runs"""
+        queryset = MemberListView.model.objects.order_by(*MemberListView.ordering)
+        return KeysetPage(queryset, MemberListView.page_size, after=after, rows=[]).rows_queryset
+
+    def changelist_page(self, model, params):
+        """Return the query an admin changelist page runs for the given filters"""
+        request = RequestFactory().get('/', params)
+        request.user = User(is_active=True, is_staff=True, is_superuser=True)
+        changelist = admin.site.get_model_admin(model).get_changelist_instance(request)
+        return changelist.get_queryset(request)[:changelist.list_per_page]
@@ -0,0 +1,101 @@
+"""
+Profile the cold start of django.setup() or of a management command.
+
+Each run is a fresh interpreter, so nothing is cached in sys.modules.
+The last run is made with ``python -X importtime`` and its per-module
+report is aggregated into the most expensive modules and the import
+time spent in each top-level package. Pass ``--profile slim`` to measure
+the slim settings profile used by the data-only commands.
+"""
+import os
+import re
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# "import time: self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+SETUP_SCRIPT = 'import django; django.setup()'
+
+
+def parse_importtime(stderr):
+    """Return [(module, self_us, cumulative_us, depth)] from -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            modules.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = 'Report per-module import cost and cold-start time of django.setup() or a command'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--command', default='',
+                            help='manage.py command line to profile instead of django.setup(), '
+                                 'e.g. "run_jobs --once"')
+        parser.add_argument('--profile', choices=sorted(settings.SETTINGS_PROFILES),
+                            help='SETTINGS_PROFILE of the profiled interpreter '
+                                 '(default: as manage.py or the environment choose)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Cold starts timed')
+        parser.add_argument('--top', type=int, default=20,
+                            help='Number of modules listed')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative',
+                            help='Order of the module list')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        if options['profile']:
+            env['SETTINGS_PROFILE'] = options['profile']
+        if options['command']:
+            argv = [sys.executable, 'manage.py', *shlex.split(options['command'])]
+        else:
+            argv = [sys.executable, '-c', SETUP_SCRIPT]
+
+        samples = []
+        for _ in range(max(1, options['repeat'])):
+            started = time.perf_counter()
+            self.run(argv, env)
+            samples.append(time.perf_counter() - started)
+
+        modules = parse_importtime(self.run([argv[0], '-X', 'importtime', *argv[1:]], env))
+        # Top-level entries cover everything imported beneath them
+        total_us = sum(cumulative for _, _, cumulative, depth in modules if depth == 0)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{options['command'] or 'django.setup()'} "
+            f"(SETTINGS_PROFILE={env.get('SETTINGS_PROFILE', 'default')}): "
+            f"cold start p50={statistics.median(samples) * 1000:.0f}ms "
+            f"min={min(samples) * 1000:.0f}ms over {len(samples)} runs, "
+            f"{len(modules)} modules imported in {total_us / 1000:.0f}ms"
+        ))
+
+        column = 1 if options['sort'] == 'self' else 2
+        self.stdout.write(f"Slowest modules by {options['sort']} time:")
+        for module, self_us, cumulative_us, _ in sorted(
+                modules, key=lambda row: row[column], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {cumulative_us / 1000:8.1f}ms {self_us / 1000:7.1f}ms self  {module}')
+
+        packages = defaultdict(int)
+        for module, self_us, _, _ in modules:
+            packages[module.partition('.')[0]] += self_us
+        self.stdout.write('Self time by top-level package:')
+        for package, self_us in sorted(packages.items(), key=lambda row: row[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'  {self_us / 1000:8.1f}ms  {package}')
+
+    def run(self, argv, env):
+        """Run ``argv`` from the project directory and return its stderr"""
+        result = subprocess.run(argv, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(f'{shlex.join(argv)} failed:\n{result.stderr}')
+        return result.stderr
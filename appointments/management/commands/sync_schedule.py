@@ -0,0 +1,173 @@
+"""
+Bring the weekly schedule (AvailableDay rows) in line with a schedule file.
+
+The file lists the weekly rules as JSON::
+
+    {"days": [
+        {"day": "monday", "start": "09:00", "end": "17:00", "slot_duration": 30},
+        {"day": "tuesday", "start": "18:00", "end": "20:00", "resource": "Youth Room"},
+        ...
+    ]}
+
+Rules without a ``resource`` (a Resource name) belong to the shared
+calendar. Rules are matched to rows by (resource, day, start, end). Missing rows are created,
+changed ones updated, and rows no longer listed are deactivated instead of
+deleted, all in one transaction with bulk_create/bulk_update, so live
+traffic sees either the old or the new schedule and never an empty one.
+Running it twice changes nothing. A shared availability cache (file, db,
+redis) is warmed for the new schedule afterwards; a local memory cache
+would be thrown away with this process.
+"""
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from appointments.availability import (
+    AvailabilityEngine, free_slot_minutes_for_range, get_schedule_index,
+)
+from appointments.cache import availability_cache, availability_cache_is_shared, schedule_index_cache
+from appointments.models import AvailableDay, Resource
+from church_records.commands import SlimCommand
+
+DAY_NUMBERS = {name.lower(): number for number, name in AvailableDay.DAYS_OF_WEEK}
+
+
+class Command(SlimCommand):
+    help = 'Create, update and deactivate available days to match a schedule file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=str(settings.BASE_DIR / 'schedule.json'),
+                            help='JSON schedule file (default: schedule.json in the project directory)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the changes without saving them')
+        parser.add_argument('--warm-days', type=int, default=30,
+                            help='Days of availability cached after the sync (0 to skip)')
+
+    def handle(self, *args, **options):
+        self._resources = None
+        rules = self.read_rules(options['path'])
+        now = timezone.now()
+
+        with transaction.atomic():
+            existing = {
+                (day.resource_id, day.day_of_week, day.start_time, day.end_time): day
+                for day in AvailableDay.objects.select_for_update()
+            }
+            created, updated = [], []
+            for key, slot_duration in rules.items():
+                day = existing.pop(key, None)
+                if day is None:
+                    created.append(AvailableDay(
+                        resource_id=key[0],
+                        day_of_week=key[1],
+                        start_time=key[2],
+                        end_time=key[3],
+                        slot_duration=slot_duration,
+                        is_active=True,
+                    ))
+                elif day.slot_duration != slot_duration or not day.is_active:
+                    day.slot_duration = slot_duration
+                    day.is_active = True
+                    day.updated_at = now
+                    updated.append(day)
+
+            # Rows no longer listed keep their history, but offer no slots
+            deactivated = [day for day in existing.values() if day.is_active]
+            for day in deactivated:
+                day.is_active = False
+                day.updated_at = now
+
+            for label, days in (('Create', created), ('Update', updated), ('Deactivate', deactivated)):
+                for day in days:
+                    if day.resource_id is not None:
+                        day.resource = self.resources()[day.resource_id]
+                    self.stdout.write(f'{label} {day} ({day.slot_duration} minute slots)')
+
+            changed = created or updated or deactivated
+            if changed and not options['dry_run']:
+                AvailableDay.objects.bulk_create(created)
+                AvailableDay.objects.bulk_update(
+                    updated + deactivated, ['slot_duration', 'is_active', 'updated_at'])
+                # Bulk writes bypass the post_save signal
+                transaction.on_commit(schedule_index_cache.invalidate)
+
+        unchanged = len(rules) - len(created) - len(updated)
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would apply' if options['dry_run'] else 'Applied'}: {len(created)} created, "
+            f"{len(updated)} updated, {len(deactivated)} deactivated, {unchanged} unchanged"
+        ))
+
+        if changed and not options['dry_run'] and options['warm_days'] > 0:
+            self.warm(options['warm_days'])
+
+    def read_rules(self, path):
+        """Return {(resource_id, day_of_week, start_time, end_time): slot_duration}
+        from a schedule file"""
+        try:
+            with open(path, encoding='utf-8') as schedule_file:
+                entries = json.load(schedule_file)['days']
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            raise CommandError(f'Cannot read schedule file {path}: {exc}')
+
+        rules = {}
+        for number, entry in enumerate(entries, start=1):
+            try:
+                day = AvailableDay(
+                    resource_id=self.parse_resource(entry.get('resource')),
+                    day_of_week=self.parse_day(entry['day']),
+                    start_time=datetime.time.fromisoformat(entry['start']),
+                    end_time=datetime.time.fromisoformat(entry['end']),
+                    slot_duration=int(entry.get('slot_duration', 30)),
+                )
+                if day.slot_duration <= 0:
+                    raise ValidationError('Slot duration must be positive')
+                day.clean()
+            except (KeyError, TypeError, ValueError, ValidationError) as exc:
+                raise CommandError(f'Invalid schedule entry {number} ({entry}): {exc}')
+
+            key = (day.resource_id, day.day_of_week, day.start_time, day.end_time)
+            if key in rules:
+                raise CommandError(f'Schedule entry {number} repeats {day}')
+            rules[key] = day.slot_duration
+        return rules
+
+    def parse_resource(self, name):
+        """Return the id of the named Resource, or None for the shared calendar"""
+        if name is None:
+            return None
+        for resource in self.resources().values():
+            if resource.name == name:
+                return resource.pk
+        raise ValueError(f'Unknown resource {name!r}')
+
+    def resources(self):
+        """Return {pk: Resource}, loaded on first use"""
+        if self._resources is None:
+            self._resources = {resource.pk: resource for resource in Resource.objects.all()}
+        return self._resources
+
+    def parse_day(self, value):
+        """Accept a weekday name or its number (Monday == 0)"""
+        if isinstance(value, int) and value in DAY_NUMBERS.values():
+            return value
+        try:
+            return DAY_NUMBERS[str(value).lower()]
+        except KeyError:
+            raise ValueError(f'Unknown day {value!r}')
+
+    def warm(self, days):
+        """Rebuild the slot index and cache the availability of the next ``days`` days"""
+        if not availability_cache_is_shared():
+            backend = type(availability_cache()).__name__
+            self.stdout.write(f'Skipped warming: the availability cache ({backend}) is local to this process')
+            return
+        start = datetime.date.today()
+        get_schedule_index()
+        free_slot_minutes_for_range(start, start + datetime.timedelta(days=days - 1))
+        AvailabilityEngine().get_available_days(start, days)
+        self.stdout.write(f'Warmed availability for {days} days')
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 15:46
+
+from django.db import migrations, models
+
+ACTIVE_STATUSES = ['pending', 'approved']
+
+
+def cancel_duplicate_bookings(apps, schema_editor):
+    """Keep one active booking per slot so the constraint can be added
+
+    Approved bookings win over pending ones, then the earliest booking.
+    The others are cancelled.
+    """
+    Appointment = apps.get_model('appointments', 'Appointment')
+    db_alias = schema_editor.connection.alias
+    active = Appointment.objects.using(db_alias).filter(status__in=ACTIVE_STATUSES)
+    duplicate_slots = (
+        active.values('appointment_date', 'appointment_time')
+        .annotate(bookings=models.Count('id'))
+        .filter(bookings__gt=1)
+        .order_by()
+    )
+    cancelled = []
+    for slot in duplicate_slots:
+        bookings = sorted(
+            active.filter(
+                appointment_date=slot['appointment_date'],
+                appointment_time=slot['appointment_time'],
+            ).values_list('status', 'created_at', 'pk'),
+            key=lambda booking: (booking[0] != 'approved', booking[1], booking[2]),
+        )
+        cancelled.extend(pk for _, _, pk in bookings[1:])
+    Appointment.objects.using(db_alias).filter(pk__in=cancelled).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'appointment_time'], name='appointment_slot_idx'),
+        ),
+        # Bookings made before the constraint may share a slot
+        migrations.RunPython(cancel_duplicate_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'approved'])), fields=('appointment_date', 'appointment_time'), name='unique_active_appointment_slot', violation_error_message='This time slot is already booked. Please select another time.'),
+        ),
+    ]
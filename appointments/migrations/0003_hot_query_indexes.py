@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_appointment_unique_active_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'status', 'appointment_time'], name='appointment_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'appointment_date', 'appointment_time'], name='appointment_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='availableday',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['day_of_week', 'start_time'], name='availableday_active_idx'),
+        ),
+    ]
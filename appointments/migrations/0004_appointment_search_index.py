@@ -0,0 +1,28 @@
+from django.db import migrations
+
+from church_records.search import SearchIndex
+
+# Frozen copy of the index definition at the time of this migration
+SEARCH_INDEX = SearchIndex(
+    'appointments_appointment',
+    ['name', 'email', 'phone', 'purpose'],
+)
+
+
+def install_search_index(apps, schema_editor):
+    SEARCH_INDEX.install(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    SEARCH_INDEX.uninstall(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
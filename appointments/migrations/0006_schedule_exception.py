@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 16:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('kind', models.CharField(choices=[('closed', 'Closed'), ('extra', 'Extra Hours')], default='closed', max_length=10, verbose_name='Type')),
+                ('start_time', models.TimeField(blank=True, null=True, verbose_name='Start Time')),
+                ('end_time', models.TimeField(blank=True, null=True, verbose_name='End Time')),
+                ('slot_duration', models.IntegerField(default=30, help_text='Duration of each appointment slot in minutes', verbose_name='Slot Duration (minutes)')),
+                ('reason', models.CharField(blank=True, help_text='Shown to visitors who pick a closed date, e.g. Easter Monday', max_length=100)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Schedule Exception',
+                'verbose_name_plural': 'Schedule Exceptions',
+                'ordering': ['date', 'start_time'],
+                'indexes': [models.Index(fields=['date'], name='scheduleexception_date_idx')],
+            },
+        ),
+    ]
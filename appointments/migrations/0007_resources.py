@@ -0,0 +1,76 @@
+# Generated by Django 5.2 on 2026-10-18 16:28
+
+import django.core.validators
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_schedule_exception'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Resource',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Name')),
+                ('kind', models.CharField(choices=[('counselor', 'Counselor'), ('room', 'Room')], default='counselor', max_length=20, verbose_name='Type')),
+                ('capacity', models.PositiveSmallIntegerField(default=1, help_text='People who can book the same time slot, e.g. 8 for a group session', validators=[django.core.validators.MinValueValidator(1)], verbose_name='Capacity')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Active')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resource',
+                'verbose_name_plural': 'Resources',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='appointment',
+            name='unique_active_appointment_slot',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_date_status_idx',
+        ),
+        migrations.AlterUniqueTogether(
+            name='availableday',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='seat',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Place taken in a group slot, below the resource capacity'),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='resource',
+            field=models.ForeignKey(blank=True, help_text='Empty for the shared calendar', limit_choices_to={'is_active': True}, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='appointments', to='appointments.resource', verbose_name='Counselor / Room'),
+        ),
+        migrations.AddField(
+            model_name='availableday',
+            name='resource',
+            field=models.ForeignKey(blank=True, help_text='Leave empty for the shared calendar', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='available_days', to='appointments.resource', verbose_name='Counselor / Room'),
+        ),
+        migrations.AddField(
+            model_name='scheduleexception',
+            name='resource',
+            field=models.ForeignKey(blank=True, help_text='Leave empty to close every calendar, or for extra hours on the shared calendar', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='schedule_exceptions', to='appointments.resource', verbose_name='Counselor / Room'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'status', 'appointment_time', 'resource'], name='appointment_date_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('resource', 0), models.F('appointment_date'), models.F('appointment_time'), models.F('seat'), condition=models.Q(('status__in', ['pending', 'approved'])), name='unique_active_appointment_seat', violation_error_message='This time slot is already booked. Please select another time.'),
+        ),
+        migrations.AddConstraint(
+            model_name='availableday',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('resource', 0), models.F('day_of_week'), models.F('start_time'), models.F('end_time'), name='unique_available_day_rule', violation_error_message='This calendar already has a rule for these hours.'),
+        ),
+    ]
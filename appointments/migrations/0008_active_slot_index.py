@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-18 16:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_resources'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appointment_date_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__in', ['pending', 'approved'])), fields=['appointment_date', 'appointment_time', 'resource'], name='appointment_active_slot_idx'),
+        ),
+    ]
@@ -1,7 +1,22 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
 import datetime
 
+from church_records.search import SearchIndex
+
+
+def slot_range(start_time, end_time, slot_duration):
+    """Return the slot starts between two times as minutes since midnight"""
+    start_minutes = start_time.hour * 60 + start_time.minute
+    end_minutes = end_time.hour * 60 + end_time.minute
+    
+    if slot_duration <= 0:
+        return range(0)
+    return range(start_minutes, end_minutes - slot_duration + 1, slot_duration)
+
+
 class BookingSettings(models.Model):
     """Global settings for the appointment booking system"""
     is_enabled = models.BooleanField(default=True, verbose_name="Enable Booking System")
@@ -23,11 +38,60 @@ class BookingSettings(models.Model):
         settings, created = cls.objects.get_or_create(pk=1)
         return settings
     
+    @classmethod
+    async def aget_settings(cls):
+        """Async get_settings()"""
+        settings, created = await cls.objects.aget_or_create(pk=1)
+        return settings
+    
+    @classmethod
+    def get_cached_settings(cls):
+        """Get booking settings from the per-process versioned cache"""
+        from .cache import booking_settings_cache
+        return booking_settings_cache.get()
+    
+    @classmethod
+    async def aget_cached_settings(cls):
+        """Async get_cached_settings()"""
+        from .cache import booking_settings_cache
+        return await booking_settings_cache.aget()
+    
     def __str__(self):
         status = "Enabled" if self.is_enabled else "Disabled"
         return f"Booking System: {status}"
 
 
+class Resource(models.Model):
+    """A counselor, pastor or room that takes bookings on its own calendar
+
+    Weekly rules, exceptions and appointments without a resource make up
+    the shared calendar, which holds one booking per slot.
+    """
+    KIND_CHOICES = [
+        ('counselor', 'Counselor'),
+        ('room', 'Room'),
+    ]
+    
+    name = models.CharField(max_length=100, unique=True, verbose_name="Name")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='counselor', verbose_name="Type")
+    capacity = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1)],
+        verbose_name="Capacity",
+        help_text="People who can book the same time slot, e.g. 8 for a group session"
+    )
+    is_active = models.BooleanField(default=True, verbose_name="Active")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Resource'
+        verbose_name_plural = 'Resources'
+    
+    def __str__(self):
+        return self.name
+
+
 class AvailableDay(models.Model):
     """Days and time slots available for booking"""
     DAYS_OF_WEEK = [
@@ -40,6 +104,15 @@ class AvailableDay(models.Model):
         (6, 'Sunday'),
     ]
     
+    resource = models.ForeignKey(
+        Resource,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='available_days',
+        verbose_name="Counselor / Room",
+        help_text="Leave empty for the shared calendar"
+    )
     day_of_week = models.IntegerField(choices=DAYS_OF_WEEK, verbose_name="Day")
     start_time = models.TimeField(verbose_name="Start Time")
     end_time = models.TimeField(verbose_name="End Time")
@@ -49,12 +122,29 @@ class AvailableDay(models.Model):
         help_text="Duration of each appointment slot in minutes"
     )
     is_active = models.BooleanField(default=True, verbose_name="Active")
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['day_of_week', 'start_time']
         verbose_name = 'Available Day'
         verbose_name_plural = 'Available Days'
-        unique_together = ['day_of_week', 'start_time', 'end_time']
+        constraints = [
+            # One rule per calendar and time range; the shared calendar
+            # (no resource) is compared as resource 0, since NULLs never clash
+            models.UniqueConstraint(
+                Coalesce('resource', 0), 'day_of_week', 'start_time', 'end_time',
+                name='unique_available_day_rule',
+                violation_error_message="This calendar already has a rule for these hours.",
+            ),
+        ]
+        indexes = [
+            # Active weekly schedule in display order (ScheduleIndex.load)
+            models.Index(
+                fields=['day_of_week', 'start_time'],
+                condition=models.Q(is_active=True),
+                name='availableday_active_idx',
+            ),
+        ]
     
     def clean(self):
         """Validate time slots"""
@@ -69,28 +159,95 @@ class AvailableDay(models.Model):
         if total_minutes < self.slot_duration:
             raise ValidationError('Time range is too short for the specified slot duration')
     
+    def get_slot_minutes(self):
+        """Return the start of each slot as minutes since midnight"""
+        return slot_range(self.start_time, self.end_time, self.slot_duration)
+    
     def get_time_slots(self):
         """Generate all time slots for this day based on duration"""
-        slots = []
-        
-        # Calculate minutes
-        start_minutes = self.start_time.hour * 60 + self.start_time.minute
-        end_minutes = self.end_time.hour * 60 + self.end_time.minute
-        current_minutes = start_minutes
-        
-        while current_minutes + self.slot_duration <= end_minutes:
-            # Convert minutes to time
-            hours = current_minutes // 60
-            minutes = current_minutes % 60
-            slot_time = datetime.time(hours, minutes)
-            
-            slots.append(slot_time)
-            current_minutes += self.slot_duration
+        return [
+            datetime.time(minutes // 60, minutes % 60)
+            for minutes in self.get_slot_minutes()
+        ]
+    
+    def __str__(self):
+        hours = f"{self.get_day_of_week_display()}: {self.start_time.strftime('%I:%M %p')} - {self.end_time.strftime('%I:%M %p')}"
+        return f"{self.resource}, {hours}" if self.resource_id else hours
+
+
+class ScheduleException(models.Model):
+    """A date that departs from the weekly schedule
+
+    A closed date drops the weekly hours of that date (holidays, events).
+    Extra hours add a window on top of them, or replace them when the date
+    is also closed. Exceptions without a resource close every calendar, or
+    add hours to the shared calendar.
+    """
+    KIND_CHOICES = [
+        ('closed', 'Closed'),
+        ('extra', 'Extra Hours'),
+    ]
+    
+    resource = models.ForeignKey(
+        Resource,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='schedule_exceptions',
+        verbose_name="Counselor / Room",
+        help_text="Leave empty to close every calendar, or for extra hours on the shared calendar"
+    )
+    date = models.DateField(verbose_name="Date")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default='closed', verbose_name="Type")
+    start_time = models.TimeField(null=True, blank=True, verbose_name="Start Time")
+    end_time = models.TimeField(null=True, blank=True, verbose_name="End Time")
+    slot_duration = models.IntegerField(
+        default=30,
+        verbose_name="Slot Duration (minutes)",
+        help_text="Duration of each appointment slot in minutes"
+    )
+    reason = models.CharField(
+        max_length=100,
+        blank=True,
+        help_text="Shown to visitors who pick a closed date, e.g. Easter Monday"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date', 'start_time']
+        verbose_name = 'Schedule Exception'
+        verbose_name_plural = 'Schedule Exceptions'
+        indexes = [
+            # Upcoming exceptions (ScheduleIndex.load) and the ETag aggregate
+            models.Index(fields=['date'], name='scheduleexception_date_idx'),
+        ]
+    
+    def clean(self):
+        """Validate the hours of an extra window"""
+        if self.kind == 'closed':
+            if self.start_time or self.end_time:
+                raise ValidationError('Leave the hours empty for a closed date')
+            return
         
-        return slots
+        if self.start_time is None or self.end_time is None:
+            raise ValidationError('Extra hours need a start and end time')
+        if self.start_time >= self.end_time:
+            raise ValidationError('End time must be after start time')
+        if self.slot_duration <= 0 or not self.get_slot_minutes():
+            raise ValidationError('Time range is too short for the specified slot duration')
+    
+    def get_slot_minutes(self):
+        """Return the start of each extra slot as minutes since midnight"""
+        if self.kind == 'closed' or self.start_time is None or self.end_time is None:
+            return range(0)
+        return slot_range(self.start_time, self.end_time, self.slot_duration)
     
     def __str__(self):
-        return f"{self.get_day_of_week_display()}: {self.start_time.strftime('%I:%M %p')} - {self.end_time.strftime('%I:%M %p')}"
+        if self.kind == 'closed':
+            label = f"{self.date.strftime('%Y-%m-%d')}: Closed"
+        else:
+            label = f"{self.date.strftime('%Y-%m-%d')}: {self.start_time.strftime('%I:%M %p')} - {self.end_time.strftime('%I:%M %p')}"
+        return f"{self.resource}, {label}" if self.resource_id else label
 
 
 class Appointment(models.Model):
@@ -101,11 +258,32 @@ class Appointment(models.Model):
         ('cancelled', 'Cancelled'),
     ]
     
+    # Columns written by the CSV/JSONL exports, in order
+    EXPORT_FIELDS = [
+        'id', 'name', 'email', 'phone', 'appointment_date', 'appointment_time',
+        'resource', 'purpose', 'additional_notes', 'status', 'created_at',
+    ]
+    
     name = models.CharField(max_length=100, verbose_name="Full Name")
     email = models.EmailField(verbose_name="Email Address")
     phone = models.CharField(max_length=20, verbose_name="Phone Number")
     appointment_date = models.DateField(verbose_name="Date")
     appointment_time = models.TimeField(verbose_name="Time")
+    resource = models.ForeignKey(
+        Resource,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        limit_choices_to={'is_active': True},
+        related_name='appointments',
+        verbose_name="Counselor / Room",
+        help_text="Empty for the shared calendar"
+    )
+    seat = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        help_text="Place taken in a group slot, below the resource capacity"
+    )
     purpose = models.CharField(
         max_length=100, 
         verbose_name="Purpose of Meeting",
@@ -123,58 +301,109 @@ class Appointment(models.Model):
         verbose_name="Status"
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
         verbose_name = 'Appointment'
         verbose_name_plural = 'Appointments'
+        constraints = [
+            # Each seat of a calendar's time slot holds at most one pending or
+            # approved booking, so a slot takes no more bookings than the
+            # resource capacity (seats are numbered below it by clean()).
+            # Cancelled appointments free their seat for a new booking.
+            models.UniqueConstraint(
+                Coalesce('resource', 0), 'appointment_date', 'appointment_time', 'seat',
+                condition=models.Q(status__in=['pending', 'approved']),
+                name='unique_active_appointment_seat',
+                violation_error_message="This time slot is already booked. Please select another time.",
+            ),
+        ]
+        indexes = [
+            # Covering index for the grouped seat counts of the booking
+            # pages. Only active bookings are indexed, and SQLite uses it only
+            # for queries repeating the condition with literal statuses
+            # (see ACTIVE_CONDITION in appointments.availability).
+            models.Index(
+                fields=['appointment_date', 'appointment_time', 'resource'],
+                condition=models.Q(status__in=['pending', 'approved']),
+                name='appointment_active_slot_idx',
+            ),
+            # Admin date_hierarchy and list_filter on appointment_date
+            models.Index(
+                fields=['appointment_date', 'appointment_time'],
+                name='appointment_slot_idx',
+            ),
+            # Admin list_filter on status, in changelist order
+            models.Index(
+                fields=['status', 'appointment_date', 'appointment_time'],
+                name='appointment_status_date_idx',
+            ),
+        ]
     
     def clean(self):
         """Validate appointment date and time"""
         # Check if booking system is enabled
-        booking_settings = BookingSettings.get_settings()
+        booking_settings = BookingSettings.get_cached_settings()
         if not booking_settings.is_enabled:
             raise ValidationError("The booking system is currently disabled.")
         
+        # A missing date is already reported by clean_fields()
+        if self.appointment_date is None:
+            return
+        
         # Check if date is in the past
         if self.appointment_date < datetime.date.today():
             raise ValidationError("Appointment date cannot be in the past.")
         
-        # Check if day is available
-        day_of_week = self.appointment_date.weekday()
-        available_days = AvailableDay.objects.filter(
-            day_of_week=day_of_week,
-            is_active=True
-        )
+        # Check if the calendar is open that day, including date exceptions
+        from .availability import ACTIVE_STATUSES, get_schedule_index, time_to_minutes
+        calendar = get_schedule_index().calendar(self.resource_id)
         
-        if not available_days.exists():
-            day_name = dict(AvailableDay.DAYS_OF_WEEK)[day_of_week]
-            raise ValidationError(f"Appointments are not available on {day_name}s.")
+        if not calendar.is_open_on(self.appointment_date):
+            raise ValidationError(calendar.closed_message(self.appointment_date))
         
         # Check if time slot is valid
-        valid_slot = False
-        for day in available_days:
-            time_slots = day.get_time_slots()
-            for slot_time in time_slots:
-                if slot_time == self.appointment_time:
-                    valid_slot = True
-                    break
-            
-            if valid_slot:
-                break
-        
-        if not valid_slot:
+        if (self.appointment_time is None or
+                not calendar.is_valid_slot_on(self.appointment_date, time_to_minutes(self.appointment_time))):
             raise ValidationError("The selected time slot is not available.")
         
-        # Check if slot is already booked
-        existing_appointments = Appointment.objects.filter(
+        # Take a free seat; the unique_active_appointment_seat constraint
+        # still rejects a seat taken concurrently at INSERT time
+        if self.status in ACTIVE_STATUSES and not self.assign_seat():
+            raise ValidationError("This time slot is fully booked. Please select another time.")
+    
+    def assign_seat(self):
+        """Move to the lowest seat of the slot no other active booking holds
+
+        Keeps the current seat while it is free. Returns False when all
+        seats of the resource capacity are taken.
+        """
+        from .availability import get_schedule_index
+        capacity = get_schedule_index().capacity(self.resource_id)
+        taken = set(self.taken_seats())
+        
+        if self.seat < capacity and self.seat not in taken:
+            return True
+        for seat in range(capacity):
+            if seat not in taken:
+                self.seat = seat
+                return True
+        return False
+    
+    def taken_seats(self):
+        """Return the seats other active bookings of this slot hold"""
+        from .availability import active_appointments
+        return active_appointments().filter(
+            resource=self.resource_id,
             appointment_date=self.appointment_date,
             appointment_time=self.appointment_time,
-            status__in=['pending', 'approved']
-        ).exclude(pk=self.pk)
-        
-        if existing_appointments.exists():
-            raise ValidationError("This time slot is already booked. Please select another time.")
+        ).exclude(pk=self.pk).order_by().values_list('seat', flat=True)
+    
+    @staticmethod
+    def is_seat_conflict(error):
+        """Check if an IntegrityError comes from unique_active_appointment_seat"""
+        return 'unique_active_appointment_seat' in str(error)
     
     def is_active(self):
         """Check if appointment is active (not cancelled and in the future)"""
@@ -190,9 +419,19 @@ class Appointment(models.Model):
         return self.status != 'cancelled' and self.is_active()
     
     def cancel(self):
-        """Cancel the appointment"""
-        self.status = 'cancelled'
-        self.save()
+        """Cancel the appointment and queue the cancellation email"""
+        from .tasks import send_appointment_email
+        with transaction.atomic():
+            self.status = 'cancelled'
+            self.save()
+            send_appointment_email.enqueue(appointment_id=self.pk, kind='cancelled')
     
     def __str__(self):
         return f"{self.name} - {self.appointment_date.strftime('%Y-%m-%d')} at {self.appointment_time.strftime('%I:%M %p')}"
+
+
+# Full-text index behind AppointmentAdmin search (see church_records.search)
+appointment_search_index = SearchIndex(
+    'appointments_appointment',
+    ['name', 'email', 'phone', 'purpose'],
+)
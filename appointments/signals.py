@@ -0,0 +1,32 @@
+"""
+Signal handlers that keep the appointment caches in sync with the database.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import booking_settings_cache, invalidate_availability, schedule_index_cache
+from .models import Appointment, AvailableDay, BookingSettings, Resource, ScheduleException
+
+
+@receiver([post_save, post_delete], sender=BookingSettings)
+def invalidate_booking_settings(sender, **kwargs):
+    """Reload booking settings in every worker once the change is committed"""
+    booking_settings_cache.clear()
+    transaction.on_commit(booking_settings_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=AvailableDay)
+@receiver([post_save, post_delete], sender=ScheduleException)
+@receiver([post_save, post_delete], sender=Resource)
+def invalidate_schedule_index(sender, **kwargs):
+    """Rebuild the slot index in every worker once the change is committed"""
+    schedule_index_cache.clear()
+    transaction.on_commit(schedule_index_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def invalidate_appointment_availability(sender, **kwargs):
+    """Move the booking page version, again once the change is committed"""
+    invalidate_availability()
+    transaction.on_commit(invalidate_availability)
@@ -0,0 +1,110 @@
+"""
+Compact representation of appointment time slots.
+
+A slot is identified by its start as minutes since midnight (0-1439), so a
+day of slots fits in an ``array('H')`` of two bytes per slot. Display
+strings for every minute of the day are rendered once at import time and
+interned, which lets generating, diffing and serializing slots run without
+creating ``datetime.time`` objects or calling ``strftime``.
+"""
+import datetime
+import sys
+from array import array
+from bisect import bisect_left
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def _label_12h(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{hour % 12 or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+
+# '%I:%M %p' and '%H:%M' renderings of every minute of the day
+LABELS_12H = tuple(sys.intern(_label_12h(m)) for m in range(MINUTES_PER_DAY))
+VALUES_24H = tuple(sys.intern(f'{m // 60:02d}:{m % 60:02d}') for m in range(MINUTES_PER_DAY))
+
+
+class Slot:
+    """Lightweight view of one slot, rendered from the label tables"""
+    __slots__ = ('minutes',)
+
+    def __init__(self, minutes):
+        self.minutes = minutes
+
+    @property
+    def time(self):
+        return datetime.time(self.minutes // 60, self.minutes % 60)
+
+    @property
+    def formatted(self):
+        return LABELS_12H[self.minutes]
+
+    @property
+    def value(self):
+        return VALUES_24H[self.minutes]
+
+    def __eq__(self, other):
+        return isinstance(other, Slot) and other.minutes == self.minutes
+
+    def __hash__(self):
+        return hash(self.minutes)
+
+    def __repr__(self):
+        return f'<Slot {self.value}>'
+
+
+class SlotList:
+    """Sorted, de-duplicated slot starts backed by an ``array('H')``"""
+    __slots__ = ('minutes',)
+
+    def __init__(self, minutes=()):
+        self.minutes = minutes if isinstance(minutes, array) else array('H', minutes)
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """Merge several (possibly overlapping) ranges of minutes"""
+        merged = set()
+        for minutes in ranges:
+            merged.update(minutes)
+        return cls(sorted(merged))
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __iter__(self):
+        return iter(self.minutes)
+
+    def __bool__(self):
+        return bool(self.minutes)
+
+    def __contains__(self, minutes):
+        index = bisect_left(self.minutes, minutes)
+        return index < len(self.minutes) and self.minutes[index] == minutes
+
+    def __eq__(self, other):
+        return isinstance(other, SlotList) and other.minutes == self.minutes
+
+    def __reduce__(self):
+        # Pickle as raw bytes for the cache backends
+        return (_slot_list_from_bytes, (self.minutes.tobytes(),))
+
+    def difference(self, booked):
+        """Return the slots not in ``booked`` (a set of minutes), keeping order"""
+        if not booked:
+            return self
+        return SlotList(array('H', [m for m in self.minutes if m not in booked]))
+
+    def slots(self):
+        """Return the slots as ``Slot`` objects"""
+        return [Slot(m) for m in self.minutes]
+
+    def as_json(self):
+        """Return the JSON payload used by the time-slots endpoints"""
+        return [{'value': VALUES_24H[m], 'text': LABELS_12H[m]} for m in self.minutes]
+
+
+def _slot_list_from_bytes(data):
+    minutes = array('H')
+    minutes.frombytes(data)
+    return SlotList(minutes)
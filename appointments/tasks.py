@@ -0,0 +1,44 @@
+"""
+Background tasks of the appointments app, run by the jobs worker.
+"""
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+
+from jobs.queue import task
+
+from .models import Appointment
+
+# Email kind -> (subject, template, status the appointment must still have)
+APPOINTMENT_EMAILS = {
+    'confirmation': (
+        'We received your appointment request',
+        'appointments/emails/confirmation.txt',
+        None,
+    ),
+    'approved': (
+        'Your appointment has been approved',
+        'appointments/emails/approved.txt',
+        'approved',
+    ),
+    'cancelled': (
+        'Your appointment has been cancelled',
+        'appointments/emails/cancelled.txt',
+        'cancelled',
+    ),
+}
+
+
+@task
+def send_appointment_email(appointment_id, kind):
+    """Email the person who booked an appointment about it"""
+    subject, template, status = APPOINTMENT_EMAILS[kind]
+    appointment = Appointment.objects.filter(pk=appointment_id).first()
+    if appointment is None or (status and appointment.status != status):
+        # Deleted, or its status changed again before the email went out
+        return
+    send_mail(
+        subject,
+        render_to_string(template, {'appointment': appointment}),
+        None,
+        [appointment.email],
+    )
@@ -1,3 +1,1440 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Exists, OuterRef
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import quote_etag
+
+from church_records.testing import QueryBudgetMixin
+from jobs.models import Job
+from jobs.queue import run_due_jobs
+from members.models import Member
+
+from .availability import (
+    NO_APPOINTMENT_CHANGES, AvailabilityEngine, ScheduleIndex, _booked_rows, active_appointments,
+    availability_version, free_slot_minutes, free_slots_by_resource_for_range, get_schedule_index,
+)
+from .cache import VersionedValue, booking_settings_cache, free_slots_key, schedule_index_cache
+from .management.commands.bench_load import Command as BenchLoadCommand
+from .models import Appointment, AvailableDay, BookingSettings, Resource, ScheduleException
+from .slots import MINUTES_PER_DAY, Slot, SlotList
+from .views import AppointmentTimeSlotsView, AsyncAppointmentTimeSlotsView, BookingWindow
+
+
+def next_weekday(day_of_week):
+    """Return the first date after today that falls on ``day_of_week``"""
+    date = datetime.date.today() + datetime.timedelta(days=1)
+    while date.weekday() != day_of_week:
+        date += datetime.timedelta(days=1)
+    return date
+
+
+def clear_caches():
+    """Reset the process-local and availability caches between tests"""
+    booking_settings_cache.clear()
+    schedule_index_cache.clear()
+    caches['availability'].clear()
+    caches['template_fragments'].clear()
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Many simultaneous POSTs for one slot must produce a single booking"""
+
+    THREADS = 12
+
+    def setUp(self):
+        clear_caches()
+        BookingSettings.get_settings()
+        self.date = next_weekday(0)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(17, 0),
+            slot_duration=30,
+        )
+
+    def book(self, index, results):
+        client = Client()
+        try:
+            response = client.post(reverse('appointment-create'), {
+                'name': f'Visitor {index}',
+                'email': f'visitor{index}@example.com',
+                'phone': '0200000000',
+                'appointment_date': self.date.strftime('%Y-%m-%d'),
+                'appointment_time': '10:00',
+                'purpose': 'Counselling',
+            })
+            results[index] = response.status_code
+        finally:
+            connection.close()
+
+    def test_one_slot_hammered_from_many_threads(self):
+        results = [None] * self.THREADS
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker(index):
+            barrier.wait()
+            self.book(index, results)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Exactly one redirect to the confirmation page, the rest re-render
+        # the form with a friendly error instead of failing with a 500
+        self.assertEqual(results.count(302), 1, results)
+        self.assertEqual(results.count(200), self.THREADS - 1, results)
+        self.assertEqual(
+            Appointment.objects.filter(
+                appointment_date=self.date,
+                appointment_time=datetime.time(10, 0),
+            ).count(),
+            1
+        )
+
+    def test_cancelled_appointment_frees_the_slot(self):
+        Appointment.objects.create(
+            name='Earlier Visitor',
+            email='earlier@example.com',
+            phone='0200000000',
+            appointment_date=self.date,
+            appointment_time=datetime.time(10, 0),
+            purpose='Counselling',
+            status='cancelled',
+        )
+        results = [None]
+        self.book(0, results)
+        self.assertEqual(results, [302])
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Query budgets of the appointment pages, endpoints and admin changelists
+
+    Budgets are measured with caches cleared and enough rows that a query
+    per row would blow them.
+    """
+
+    APPOINTMENTS = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        BookingSettings.objects.create(is_enabled=True)
+        for day_of_week in range(5):
+            AvailableDay.objects.create(
+                day_of_week=day_of_week,
+                start_time=datetime.time(9, 0),
+                end_time=datetime.time(17, 0),
+                slot_duration=15,
+            )
+        cls.date = next_weekday(0)
+        cls.appointments = [
+            Appointment.objects.create(
+                name=f'Visitor {i}',
+                email=f'visitor{i}@example.com',
+                phone='0200000000',
+                appointment_date=cls.date,
+                appointment_time=datetime.time(9 + i // 4, (i % 4) * 15),
+                purpose='Counselling',
+            )
+            for i in range(cls.APPOINTMENTS)
+        ]
+
+    def setUp(self):
+        clear_caches()
+
+    def test_create_form(self):
+        self.assertGetWithinBudget(5, reverse('appointment-create'))
+
+    def test_create_post(self):
+        with self.assertQueryBudget(12):
+            response = self.client.post(reverse('appointment-create'), {
+                'name': 'New Visitor',
+                'email': 'new@example.com',
+                'phone': '0200000000',
+                'appointment_date': self.date.strftime('%Y-%m-%d'),
+                'appointment_time': '16:00',
+                'purpose': 'Counselling',
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_confirmation(self):
+        session = self.client.session
+        session['appointment_id'] = self.appointments[0].pk
+        session.save()
+        self.assertGetWithinBudget(5, reverse('appointment-confirmation'))
+
+    def test_time_slots(self):
+        url = reverse('appointment-time-slots')
+        params = {'date': self.date.strftime('%Y-%m-%d')}
+        self.assertGetWithinBudget(7, url, params)
+        # The free slots are cached now; the ETag aggregates and the
+        # appointment versions keying the cache remain
+        self.assertGetWithinBudget(3, url, params)
+
+    def test_time_slots_range(self):
+        start = datetime.date.today()
+        self.assertGetWithinBudget(5, reverse('appointment-time-slots-range'), {
+            'start': start.strftime('%Y-%m-%d'),
+            'end': (start + datetime.timedelta(days=60)).strftime('%Y-%m-%d'),
+        })
+
+    def test_home(self):
+        self.assertGetWithinBudget(0, reverse('appointments-home'))
+
+    def test_export(self):
+        self.client.force_login(self.admin)
+        self.assertGetWithinBudget(3, reverse('appointment-export'), {'format': 'jsonl'})
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        for model, budget in (('bookingsettings', 7), ('resource', 6), ('availableday', 7),
+                              ('scheduleexception', 9), ('appointment', 9)):
+            with self.subTest(model=model):
+                self.assertGetWithinBudget(budget, reverse(f'admin:appointments_{model}_changelist'))
+
+    def test_admin_appointment_search(self):
+        self.client.force_login(self.admin)
+        self.assertGetWithinBudget(
+            11, reverse('admin:appointments_appointment_changelist'), {'q': 'visitor'})
+
+    @override_settings(QUERY_TIMING_HEADERS=True)
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('appointment-time-slots'), {
+            'date': self.date.strftime('%Y-%m-%d'),
+        })
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$',
+        )
+
+    @override_settings(QUERY_TIMING_HEADERS=False)
+    def test_server_timing_header_disabled(self):
+        response = self.client.get(reverse('appointments-home'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+
+class ExplainHotQueriesTests(TestCase):
+    """explain_hot_queries plans the application's own queries"""
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command('explain_hot_queries', '--date', next_weekday(0).strftime('%Y-%m-%d'), stdout=out)
+        output = out.getvalue()
+        self.assertEqual(output.count('USING INDEX appointment_active_slot_idx'), 3)
+        self.assertIn('USING INDEX member_created_id_idx', output)
+        self.assertNotIn('SCAN appointments_appointment\n', output)
+        self.assertNotIn('SCAN members_member\n', output)
+
+
+@override_settings(DATABASE_READ_REPLICA='replica')
+class ReplicaRoutingTests(TestCase):
+    """Time-slot polls read the replica; cached data and confirmations use the primary"""
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(10, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_time_slots_poll_reads_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries, \
+                CaptureQueriesContext(connections['default']) as primary_queries:
+            response = self.client.get(reverse('appointment-time-slots'), {
+                'date': self.date.strftime('%Y-%m-%d'),
+            })
+        self.assertEqual(response.status_code, 200)
+        # The ETag aggregates run on the replica...
+        self.assertTrue(any(
+            'appointments_appointment' in query['sql'] for query in replica_queries.captured_queries
+        ))
+        # ...while the cached schedule index is loaded from the primary
+        self.assertTrue(any(
+            'slot_duration' in query['sql'] for query in primary_queries.captured_queries
+        ))
+        self.assertFalse(any(
+            'slot_duration' in query['sql'] for query in replica_queries.captured_queries
+        ))
+
+    def test_confirmation_reads_primary(self):
+        appointment = Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=self.date,
+            appointment_time=datetime.time(9, 0),
+            purpose='Counselling',
+        )
+        session = self.client.session
+        session['appointment_id'] = appointment.pk
+        session.save()
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get(reverse('appointment-confirmation'))
+        self.assertContains(response, 'Visitor')
+        self.assertEqual(len(replica_queries), 0)
+
+
+class AsyncTimeSlotsViewTests(TestCase):
+    """The async time-slots view answers exactly like the sync one"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(11, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+        Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=cls.date,
+            appointment_time=datetime.time(9, 30),
+            purpose='Counselling',
+        )
+
+    def setUp(self):
+        clear_caches()
+        self.factory = RequestFactory()
+
+    def responses(self, params, **headers):
+        request = self.factory.get('/book-appointment/time-slots/', params, headers=headers)
+        sync_response = AppointmentTimeSlotsView.as_view()(request)
+        async_response = async_to_sync(AsyncAppointmentTimeSlotsView.as_view())(request)
+        return sync_response, async_response
+
+    def test_same_slots_and_etag(self):
+        sync_response, async_response = self.responses({'date': self.date.strftime('%Y-%m-%d')})
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(json.loads(async_response.content), json.loads(sync_response.content))
+        self.assertEqual(async_response['ETag'], sync_response['ETag'])
+        self.assertEqual(async_response['Cache-Control'], sync_response['Cache-Control'])
+
+    def test_not_modified(self):
+        params = {'date': self.date.strftime('%Y-%m-%d')}
+        etag = self.responses(params)[0]['ETag']
+        _, async_response = self.responses(params, if_none_match=etag)
+        self.assertEqual(async_response.status_code, 304)
+
+    def test_same_errors(self):
+        past = datetime.date.today() - datetime.timedelta(days=1)
+        for params in ({}, {'date': 'not-a-date'}, {'date': past.strftime('%Y-%m-%d')},
+                       {'date': next_weekday(1).strftime('%Y-%m-%d')}):
+            with self.subTest(params=params):
+                sync_response, async_response = self.responses(params)
+                self.assertEqual(async_response.status_code, sync_response.status_code)
+                self.assertEqual(async_response.content, sync_response.content)
+
+
+class TimeSlotsEndpointTests(TestCase):
+    """Conditional GETs of the time-slots endpoint and validation of the range endpoint"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(10, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def time_slots(self, **headers):
+        return self.client.get(reverse('appointment-time-slots'),
+                               {'date': self.date.strftime('%Y-%m-%d')}, headers=headers)
+
+    def time_slots_range(self, start, end, **params):
+        return self.client.get(reverse('appointment-time-slots-range'), {
+            'start': start.strftime('%Y-%m-%d'), 'end': end.strftime('%Y-%m-%d'), **params,
+        })
+
+    def test_etag_revalidation(self):
+        response = self.time_slots()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.time_slots(if_none_match=etag).status_code, 304)
+
+        self.client.post(reverse('appointment-create'), {
+            'name': 'Visitor',
+            'email': 'visitor@example.com',
+            'phone': '0200000000',
+            'appointment_date': self.date.strftime('%Y-%m-%d'),
+            'appointment_time': '09:00',
+            'purpose': 'Counselling',
+        })
+        response = self.time_slots(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([slot['value'] for slot in response.json()['slots']], ['09:30'])
+
+    def test_body_matches_etag_after_another_worker_booked(self):
+        response = self.time_slots()
+        self.assertEqual(len(response.json()['slots']), 2)
+
+        Appointment.objects.create(
+            name='Visitor', email='visitor@example.com', phone='0200000000',
+            appointment_date=self.date, appointment_time=datetime.time(9, 0), purpose='Counselling',
+        )
+        # What a worker that cached the date before the booking still holds
+        caches['availability'].set(
+            free_slots_key(self.date, NO_APPOINTMENT_CHANGES), SlotList([540, 570]))
+
+        response = self.time_slots(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], quote_etag(availability_version(self.date)))
+        self.assertEqual([slot['value'] for slot in response.json()['slots']], ['09:30'])
+        self.assertEqual(self.time_slots(if_none_match=response['ETag']).status_code, 304)
+
+    def test_range_omits_dates_without_schedule(self):
+        response = self.time_slots_range(self.date, self.date + datetime.timedelta(days=13))
+        self.assertEqual(response.status_code, 200)
+        dates = response.json()['dates']
+        self.assertEqual(list(dates), [
+            self.date.strftime('%Y-%m-%d'),
+            (self.date + datetime.timedelta(weeks=1)).strftime('%Y-%m-%d'),
+        ])
+        self.assertEqual([slot['value'] for slot in dates[self.date.strftime('%Y-%m-%d')]],
+                         ['09:00', '09:30'])
+
+    def test_range_validation(self):
+        today = datetime.date.today()
+        cases = [
+            ('reversed', self.date, self.date - datetime.timedelta(days=1), {},
+             'End date must not be before start date'),
+            ('too long', today, today + datetime.timedelta(days=92), {},
+             'Date range cannot exceed 92 days'),
+            ('past', today - datetime.timedelta(days=10), today - datetime.timedelta(days=1), {},
+             'Cannot book appointments in the past'),
+            ('bad resource', today, self.date, {'resource': 'counselor'}, 'Invalid resource'),
+        ]
+        for label, start, end, params, error in cases:
+            with self.subTest(label):
+                response = self.time_slots_range(start, end, **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': error})
+
+        # 92 days counting both ends is the longest range accepted
+        response = self.time_slots_range(today, today + datetime.timedelta(days=91))
+        self.assertEqual(response.status_code, 200)
+        # A start in the past is clamped to today
+        response = self.time_slots_range(today - datetime.timedelta(days=5), self.date)
+        self.assertIn(self.date.strftime('%Y-%m-%d'), response.json()['dates'])
+
+
+class AppointmentEmailTests(TestCase):
+    """Appointment emails are queued with the change and sent by the job worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        BookingSettings.objects.create(is_enabled=True)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(11, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def create_appointment(self, time, **fields):
+        return Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=self.date,
+            appointment_time=time,
+            purpose='Counselling',
+            **fields,
+        )
+
+    def test_booking_queues_confirmation(self):
+        response = self.client.post(reverse('appointment-create'), {
+            'name': 'New Visitor',
+            'email': 'new@example.com',
+            'phone': '0200000000',
+            'appointment_date': self.date.strftime('%Y-%m-%d'),
+            'appointment_time': '09:00',
+            'purpose': 'Counselling',
+        })
+        self.assertEqual(response.status_code, 302)
+        # Nothing is sent during the request
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Job.objects.get().kwargs['kind'], 'confirmation')
+
+        self.assertEqual(run_due_jobs(batch_size=10), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+        self.assertIn('pending approval', mail.outbox[0].body)
+
+    def test_admin_actions_email_changed_appointments(self):
+        pending = self.create_appointment(datetime.time(9, 0))
+        approved = self.create_appointment(datetime.time(9, 30), status='approved')
+        self.client.force_login(self.admin)
+        self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'approve_appointments',
+            '_selected_action': [pending.pk, approved.pk],
+        })
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'approved')
+
+        run_due_jobs(batch_size=10)
+        # Only the appointment whose status changed is emailed
+        self.assertEqual([message.subject for message in mail.outbox],
+                         ['Your appointment has been approved'])
+
+    def test_cancel_queues_cancellation(self):
+        appointment = self.create_appointment(datetime.time(9, 0))
+        appointment.cancel()
+        run_due_jobs(batch_size=10)
+        self.assertEqual([message.subject for message in mail.outbox],
+                         ['Your appointment has been cancelled'])
+
+    def test_outdated_status_email_is_skipped(self):
+        appointment = self.create_appointment(datetime.time(9, 0))
+        appointment.cancel()
+        Appointment.objects.filter(pk=appointment.pk).update(status='pending')
+        self.assertEqual(run_due_jobs(batch_size=10), (1, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class BookingPageCacheTests(QueryBudgetMixin, TestCase):
+    """Anonymous GETs of the booking page are served from cached fragments"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        # One slot a week, so a single booking fills the day
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(9, 30),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_warm_page_runs_no_queries(self):
+        url = reverse('appointment-create')
+        first = self.client.get(url)
+        second = self.assertGetWithinBudget(0, url)
+        self.assertContains(second, 'id="appointment-form"')
+        self.assertContains(second, f'"{self.date:%Y-%m-%d}"')
+        self.assertEqual(first.content.count(b'badge bg-success'),
+                         second.content.count(b'badge bg-success'))
+
+    def test_booking_moves_fragment_version(self):
+        url = reverse('appointment-create')
+        self.assertContains(self.client.get(url), f'"{self.date:%Y-%m-%d}"')
+        Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=self.date,
+            appointment_time=datetime.time(9, 0),
+            purpose='Counselling',
+        )
+        # The fully booked date is no longer offered
+        self.assertNotContains(self.client.get(url), f'"{self.date:%Y-%m-%d}"')
+
+    def test_bound_form_is_not_cached(self):
+        url = reverse('appointment-create')
+        self.client.get(url)
+        response = self.client.post(url, {
+            'name': 'Visitor',
+            'appointment_date': self.date.strftime('%Y-%m-%d'),
+            'appointment_time': '09:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'value="Visitor"')
+        self.assertNotContains(self.client.get(url), 'value="Visitor"')
+
+
+class AvailabilityInvalidationTests(TestCase):
+    """Every way an appointment or the schedule changes drops cached free slots"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        BookingSettings.objects.create(is_enabled=True)
+        cls.rule = AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(10, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+        cls.other_date = cls.date + datetime.timedelta(weeks=1)
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.admin)
+        self.appointment = Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=self.date,
+            appointment_time=datetime.time(9, 0),
+            purpose='Counselling',
+        )
+        # Warm the cache for both dates
+        self.assertEqual(list(free_slot_minutes(self.date)), [570])
+        self.assertEqual(list(free_slot_minutes(self.other_date)), [540, 570])
+
+    def admin_action(self, model, action, *objects, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse(f'admin:appointments_{model}_changelist'), {
+                'action': action,
+                '_selected_action': [obj.pk for obj in objects],
+                **data,
+            })
+
+    def test_cancel_and_approve_actions(self):
+        self.admin_action('appointment', 'cancel_appointments', self.appointment)
+        self.assertEqual(list(free_slot_minutes(self.date)), [540, 570])
+        self.admin_action('appointment', 'approve_appointments', self.appointment)
+        self.assertEqual(list(free_slot_minutes(self.date)), [570])
+
+    def test_deactivate_and_activate_actions(self):
+        self.admin_action('availableday', 'deactivate_days', self.rule)
+        self.assertEqual(list(free_slot_minutes(self.date)), [])
+        self.assertEqual(list(free_slot_minutes(self.other_date)), [])
+        self.admin_action('availableday', 'activate_days', self.rule)
+        self.assertEqual(list(free_slot_minutes(self.date)), [570])
+        self.assertEqual(list(free_slot_minutes(self.other_date)), [540, 570])
+
+    def test_reschedule_to_another_date(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.appointment_date = self.other_date
+            self.appointment.save()
+        self.assertEqual(list(free_slot_minutes(self.date)), [540, 570])
+        self.assertEqual(list(free_slot_minutes(self.other_date)), [570])
+
+    def test_delete_action(self):
+        self.admin_action('appointment', 'delete_selected', self.appointment, post='yes')
+        self.assertFalse(Appointment.objects.exists())
+        self.assertEqual(list(free_slot_minutes(self.date)), [540, 570])
+
+
+class SyncScheduleTests(TestCase):
+    """sync_schedule diffs the schedule file against the AvailableDay rows"""
+
+    def setUp(self):
+        clear_caches()
+
+    def sync(self, days, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as schedule_file:
+            json.dump({'days': days}, schedule_file)
+        self.addCleanup(os.unlink, schedule_file.name)
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('sync_schedule', schedule_file.name, *args, '--warm-days', '7', stdout=out)
+        return out.getvalue()
+
+    def rows(self):
+        return set(AvailableDay.objects.values_list(
+            'day_of_week', 'start_time', 'slot_duration', 'is_active'))
+
+    def test_create_then_idempotent(self):
+        days = [
+            {'day': 'monday', 'start': '09:00', 'end': '12:00', 'slot_duration': 30},
+            {'day': 2, 'start': '13:00', 'end': '15:00'},
+        ]
+        self.assertIn('2 created, 0 updated, 0 deactivated', self.sync(days))
+        self.assertEqual(self.rows(), {
+            (0, datetime.time(9, 0), 30, True),
+            (2, datetime.time(13, 0), 30, True),
+        })
+        self.assertTrue(get_schedule_index().has_schedule(2))
+
+        # Nothing to write the second time
+        with self.assertNumQueries(3):
+            output = self.sync(days)
+        self.assertIn('0 created, 0 updated, 0 deactivated, 2 unchanged', output)
+
+    def test_update_and_deactivate_keep_rows(self):
+        kept = AvailableDay.objects.create(
+            day_of_week=0, start_time=datetime.time(9, 0), end_time=datetime.time(12, 0),
+            slot_duration=30,
+        )
+        dropped = AvailableDay.objects.create(
+            day_of_week=4, start_time=datetime.time(9, 0), end_time=datetime.time(12, 0),
+            slot_duration=30,
+        )
+        self.assertTrue(get_schedule_index().has_schedule(4))
+
+        output = self.sync([{'day': 'Monday', 'start': '09:00', 'end': '12:00', 'slot_duration': 60}])
+        self.assertIn('0 created, 1 updated, 1 deactivated', output)
+        kept.refresh_from_db()
+        dropped.refresh_from_db()
+        self.assertEqual((kept.slot_duration, kept.is_active), (60, True))
+        self.assertFalse(dropped.is_active)
+        # The bulk writes invalidated the cached slot index
+        self.assertFalse(get_schedule_index().has_schedule(4))
+        self.assertEqual(get_schedule_index().slot_count(0), 3)
+
+    def test_warms_shared_cache_only(self):
+        days = [{'day': 'monday', 'start': '09:00', 'end': '12:00'}]
+        self.assertIn('Skipped warming: the availability cache (LocMemCache) is local to this process',
+                      self.sync(days))
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={**settings.CACHES, 'availability': shared}):
+            output = self.sync([{**days[0], 'slot_duration': 60}])
+            self.assertIn('Warmed availability for 7 days', output)
+        self.assertTrue(os.listdir(location))
+
+    def test_rules_per_resource(self):
+        room = Resource.objects.create(name='Youth Room', kind='room', capacity=4)
+        days = [
+            {'day': 'monday', 'start': '09:00', 'end': '12:00'},
+            {'day': 'monday', 'start': '09:00', 'end': '12:00', 'resource': 'Youth Room'},
+        ]
+        self.assertIn('2 created', self.sync(days))
+        self.assertEqual(AvailableDay.objects.filter(resource=room).count(), 1)
+        self.assertEqual(set(get_schedule_index().calendars), {None, room.pk})
+        self.assertIn('2 unchanged', self.sync(days))
+
+    def test_dry_run_writes_nothing(self):
+        output = self.sync([{'day': 'monday', 'start': '09:00', 'end': '12:00'}], '--dry-run')
+        self.assertIn('Would apply: 1 created', output)
+        self.assertFalse(AvailableDay.objects.exists())
+
+    def test_invalid_schedule(self):
+        for days in (
+            [{'day': 'funday', 'start': '09:00', 'end': '12:00'}],
+            [{'day': 'monday', 'start': '12:00', 'end': '09:00'}],
+            [{'day': 'monday', 'start': '09:00', 'end': '09:15', 'slot_duration': 30}],
+            [{'day': 'monday', 'start': '09:00', 'end': '12:00'}] * 2,
+            [{'day': 'monday', 'start': '09:00', 'end': '12:00', 'resource': 'Nobody'}],
+        ):
+            with self.subTest(days=days), self.assertRaises(CommandError):
+                self.sync(days)
+        self.assertFalse(AvailableDay.objects.exists())
+
+
+class ScheduleExceptionTests(TestCase):
+    """Closed dates and extra hours override the weekly schedule date by date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(11, 0),
+            slot_duration=30,
+        )
+        cls.monday = next_weekday(0)
+        cls.saturday = next_weekday(5)
+
+    def setUp(self):
+        clear_caches()
+
+    def time_slots(self, date):
+        response = self.client.get(reverse('appointment-time-slots'), {
+            'date': date.strftime('%Y-%m-%d'),
+        })
+        return [slot['value'] for slot in response.json().get('slots', [])]
+
+    def appointment(self, date, time):
+        return Appointment(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=date,
+            appointment_time=time,
+            purpose='Counselling',
+        )
+
+    def test_closed_date(self):
+        ScheduleException.objects.create(date=self.monday, reason='Easter Monday')
+        next_monday = self.monday + datetime.timedelta(days=7)
+
+        dates = [day['date'] for day in AvailabilityEngine().get_available_days(days=14)]
+        self.assertNotIn(self.monday, dates)
+        self.assertIn(next_monday, dates)
+        self.assertEqual(self.time_slots(self.monday), [])
+        self.assertEqual(self.time_slots(next_monday), ['09:00', '09:30', '10:00', '10:30'])
+
+        with self.assertRaisesMessage(ValidationError, 'Easter Monday'):
+            self.appointment(self.monday, datetime.time(9, 0)).full_clean()
+        self.appointment(next_monday, datetime.time(9, 0)).full_clean()
+
+    def test_extra_hours(self):
+        ScheduleException.objects.create(
+            date=self.saturday, kind='extra',
+            start_time=datetime.time(10, 0), end_time=datetime.time(11, 0),
+        )
+        ScheduleException.objects.create(
+            date=self.monday, kind='extra',
+            start_time=datetime.time(14, 0), end_time=datetime.time(15, 0), slot_duration=60,
+        )
+
+        self.assertIn(self.saturday, AvailabilityEngine().available_dates(days=14))
+        self.assertEqual(self.time_slots(self.saturday), ['10:00', '10:30'])
+        self.assertEqual(self.time_slots(self.monday), ['09:00', '09:30', '10:00', '10:30', '14:00'])
+        self.appointment(self.saturday, datetime.time(10, 30)).full_clean()
+        # Other Saturdays stay closed
+        with self.assertRaisesMessage(ValidationError, 'not available on Saturdays'):
+            self.appointment(self.saturday + datetime.timedelta(days=7), datetime.time(10, 0)).full_clean()
+
+    def test_closed_date_with_extra_hours_replaces_weekly_hours(self):
+        ScheduleException.objects.bulk_create([
+            ScheduleException(date=self.monday, kind='closed'),
+            ScheduleException(date=self.monday, kind='extra',
+                              start_time=datetime.time(13, 0), end_time=datetime.time(14, 0)),
+        ])
+        # Bulk writes bypass the signals
+        schedule_index_cache.invalidate()
+        self.assertEqual(self.time_slots(self.monday), ['13:00', '13:30'])
+
+    def test_lookups_run_without_queries(self):
+        ScheduleException.objects.bulk_create([
+            ScheduleException(date=self.monday + datetime.timedelta(days=7 * week))
+            for week in range(1, 52)
+        ])
+        schedule = get_schedule_index()
+        with self.assertNumQueries(0):
+            dates = schedule.open_dates(datetime.date.today(), self.monday + datetime.timedelta(weeks=51))
+            self.assertTrue(schedule.is_open_on(self.monday))
+            self.assertFalse(schedule.is_open_on(self.monday + datetime.timedelta(days=7)))
+        # Every Monday after the first is closed
+        self.assertEqual([date for date in dates if date >= self.monday], [self.monday])
+
+    def test_exception_moves_availability_version(self):
+        before = availability_version(self.monday)
+        exception = ScheduleException.objects.create(date=self.monday)
+        closed = availability_version(self.monday)
+        self.assertNotEqual(before, closed)
+        exception.delete()
+        self.assertNotEqual(availability_version(self.monday), closed)
+
+    def test_validation(self):
+        for exception in (
+            ScheduleException(date=self.monday, kind='closed', start_time=datetime.time(9, 0)),
+            ScheduleException(date=self.monday, kind='extra'),
+            ScheduleException(date=self.monday, kind='extra',
+                              start_time=datetime.time(10, 0), end_time=datetime.time(9, 0)),
+            ScheduleException(date=self.monday, kind='extra',
+                              start_time=datetime.time(10, 0), end_time=datetime.time(10, 15)),
+        ):
+            with self.subTest(exception=exception.kind), self.assertRaises(ValidationError):
+                exception.full_clean()
+
+    def test_missing_date_is_a_field_error(self):
+        with self.assertRaises(ValidationError) as caught:
+            self.appointment(None, datetime.time(9, 0)).full_clean()
+        self.assertIn('appointment_date', caught.exception.message_dict)
+
+
+class ResourceCapacityTests(TestCase):
+    """Resources book on their own calendars, with several seats per slot"""
+
+    @classmethod
+    def setUpTestData(cls):
+        BookingSettings.objects.create(is_enabled=True)
+        cls.pastor = Resource.objects.create(name='Pastor Mensah')
+        cls.group = Resource.objects.create(name='Marriage Class', capacity=3)
+        for resource in (None, cls.pastor, cls.group):
+            AvailableDay.objects.create(
+                resource=resource,
+                day_of_week=0,
+                start_time=datetime.time(9, 0),
+                end_time=datetime.time(10, 0),
+                slot_duration=30,
+            )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def book(self, resource=None, time='09:00'):
+        return self.client.post(reverse('appointment-create'), {
+            'name': 'Visitor',
+            'email': 'visitor@example.com',
+            'phone': '0200000000',
+            'resource': resource.pk if resource else '',
+            'appointment_date': self.date.strftime('%Y-%m-%d'),
+            'appointment_time': time,
+            'purpose': 'Counselling',
+        })
+
+    def time_slots(self, resource=None):
+        params = {'date': self.date.strftime('%Y-%m-%d')}
+        if resource:
+            params['resource'] = resource.pk
+        response = self.client.get(reverse('appointment-time-slots'), params)
+        return [slot['value'] for slot in response.json().get('slots', [])]
+
+    def test_group_slot_takes_capacity_bookings(self):
+        for _ in range(3):
+            self.assertEqual(self.book(self.group).status_code, 302)
+        self.assertEqual(
+            sorted(Appointment.objects.filter(resource=self.group).values_list('seat', flat=True)),
+            [0, 1, 2],
+        )
+        self.assertEqual(self.time_slots(self.group), ['09:30'])
+
+        response = self.book(self.group)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'fully booked')
+
+    def test_cancelled_booking_frees_its_seat(self):
+        for _ in range(3):
+            self.book(self.group)
+        Appointment.objects.filter(resource=self.group, seat=1).get().cancel()
+        self.assertEqual(self.book(self.group).status_code, 302)
+        self.assertEqual(Appointment.objects.get(resource=self.group, status='pending', seat=1).name, 'Visitor')
+
+    def test_first_available_fills_shared_calendar_first(self):
+        self.book()
+        self.book()
+        self.assertEqual(
+            list(Appointment.objects.order_by('pk').values_list('resource', flat=True)),
+            [None, self.group.pk],
+        )
+        # The slot stays open while any calendar has a seat
+        self.assertEqual(self.time_slots(), ['09:00', '09:30'])
+        self.assertEqual(self.time_slots(self.pastor), ['09:00', '09:30'])
+
+    def test_seat_constraint(self):
+        def appointment(seat, resource=self.group):
+            return Appointment(
+                name='Visitor', email='visitor@example.com', phone='0200000000',
+                appointment_date=self.date, appointment_time=datetime.time(9, 0),
+                purpose='Counselling', resource=resource, seat=seat,
+            )
+        appointment(0).save()
+        appointment(1).save()
+        appointment(0, resource=None).save()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            appointment(1).save()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            appointment(0, resource=None).save()
+
+    def test_month_across_resources_uses_grouped_queries(self):
+        for day_of_week in range(1, 5):
+            AvailableDay.objects.create(
+                resource=self.group, day_of_week=day_of_week,
+                start_time=datetime.time(9, 0), end_time=datetime.time(17, 0),
+            )
+        self.book(self.group)
+        get_schedule_index()
+        start = datetime.date.today()
+        # The appointment versions of the month, then its bookings
+        with self.assertNumQueries(2):
+            free = free_slots_by_resource_for_range(start, start + datetime.timedelta(days=30))
+        self.assertEqual(set(free[self.date]), {None, self.pastor.pk, self.group.pk})
+        # Two of the three seats are still free
+        self.assertIn(540, free[self.date][self.group.pk])
+        with self.assertNumQueries(1):
+            free_slots_by_resource_for_range(start, start + datetime.timedelta(days=30))
+
+    def test_seat_conflict_retries_are_capped_at_capacity(self):
+        self.book(self.group)
+        # A stale seat check keeps offering the taken seat 0
+        with mock.patch.object(Appointment, 'assign_seat', return_value=True) as assign_seat:
+            response = self.book(self.group)
+        self.assertContains(response, 'just booked by someone else')
+        # One check from clean() and one before each of the two retries
+        self.assertEqual(assign_seat.call_count, 3)
+        self.assertEqual(Appointment.objects.filter(resource=self.group).count(), 1)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        error = IntegrityError('FOREIGN KEY constraint failed')
+        with mock.patch('appointments.views.send_appointment_email.enqueue', side_effect=error) as enqueue:
+            with self.assertRaises(IntegrityError):
+                self.book(self.group)
+        self.assertEqual(enqueue.call_count, 1)
+        self.assertFalse(Appointment.objects.exists())
+
+    def reopen(self, *appointments):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        return self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'approve_appointments',
+            '_selected_action': [appointment.pk for appointment in appointments],
+        }, follow=True)
+
+    def test_admin_approve_reassigns_seat_of_cancelled_booking(self):
+        for _ in range(2):
+            self.book(self.group)
+        cancelled = Appointment.objects.get(resource=self.group, seat=0)
+        cancelled.cancel()
+        self.book(self.group)
+
+        self.reopen(cancelled)
+        cancelled.refresh_from_db()
+        self.assertEqual((cancelled.status, cancelled.seat), ('approved', 2))
+
+    def test_admin_approve_skips_fully_booked_slot(self):
+        self.book(self.pastor)
+        cancelled = Appointment.objects.get(resource=self.pastor)
+        cancelled.cancel()
+        self.book(self.pastor)
+        pending = Appointment.objects.get(resource=self.pastor, status='pending')
+
+        response = self.reopen(cancelled, pending)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Skipped 1 appointment(s) whose time slot is fully booked')
+        cancelled.refresh_from_db()
+        pending.refresh_from_db()
+        self.assertEqual(cancelled.status, 'cancelled')
+        self.assertEqual(pending.status, 'approved')
+
+    def test_active_appointments_in_a_subquery(self):
+        self.book(self.pastor)
+        self.book(self.group)
+        Appointment.objects.get(resource=self.group).cancel()
+        # The subquery aliases the appointment table
+        booked = Resource.objects.filter(Exists(active_appointments().filter(resource=OuterRef('pk'))))
+        self.assertEqual(list(booked), [self.pastor])
+
+    def test_slot_counts_use_partial_covering_index(self):
+        start = datetime.date.today()
+        plan = _booked_rows([start, start + datetime.timedelta(days=30)]).explain()
+        self.assertIn('USING INDEX appointment_active_slot_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_inactive_resource_offers_no_slots(self):
+        self.pastor.is_active = False
+        self.pastor.save()
+        self.assertEqual(self.time_slots(self.pastor), [])
+        self.assertNotIn(self.pastor.pk, get_schedule_index().resources)
+
+    def test_booking_page_offers_resources(self):
+        response = self.client.get(reverse('appointment-create'))
+        self.assertContains(response, 'First available')
+        self.assertContains(response, 'Marriage Class (Counselor)')
+
+
+class AppointmentExportTests(TestCase):
+    """Staff stream appointments as CSV or JSONL with the changelist filters"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.date = next_weekday(0)
+        cls.pastor = Resource.objects.create(name='Pastor Mensah')
+        for offset, status in enumerate(['pending', 'approved', 'cancelled']):
+            Appointment.objects.create(
+                name=f'Visitor {status}',
+                email=f'{status}@example.com',
+                phone='0200000000',
+                appointment_date=cls.date + datetime.timedelta(days=7 * offset),
+                appointment_time=datetime.time(9, 0),
+                resource=cls.pastor if status == 'approved' else None,
+                purpose='Counselling',
+                status=status,
+            )
+
+    def export(self, **params):
+        self.client.force_login(self.admin)
+        return self.client.get(reverse('appointment-export'), params)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="appointments.csv"')
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], ','.join(Appointment.EXPORT_FIELDS))
+        self.assertEqual(len(lines), 4)
+
+    def test_jsonl_export(self):
+        response = self.export(format='jsonl', status='approved')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(list(rows[0]), Appointment.EXPORT_FIELDS)
+        self.assertEqual(rows[0]['email'], 'approved@example.com')
+        self.assertEqual(rows[0]['appointment_date'], (self.date + datetime.timedelta(days=7)).isoformat())
+        self.assertEqual(rows[0]['appointment_time'], '09:00:00')
+        self.assertEqual(rows[0]['resource'], self.pastor.pk)
+
+    def test_resource_filter(self):
+        response = self.export(format='jsonl', resource=self.pastor.pk)
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['email'] for row in rows], ['approved@example.com'])
+
+    def test_date_range_filter(self):
+        response = self.export(
+            format='jsonl',
+            start=(self.date + datetime.timedelta(days=7)).strftime('%Y-%m-%d'),
+            end=(self.date + datetime.timedelta(days=14)).strftime('%Y-%m-%d'),
+        )
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual(sorted(row['status'] for row in rows), ['approved', 'cancelled'])
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.export(format='xml').status_code, 400)
+        self.assertEqual(self.export(status='archived').status_code, 400)
+        self.assertEqual(self.export(resource='pastor').status_code, 400)
+        self.assertEqual(self.export(start='18/10/2026').status_code, 400)
+        self.assertEqual(self.export(end='2026-02-30').status_code, 400)
+
+    def test_staff_only(self):
+        response = self.client.get(reverse('appointment-export'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
+
+        User.objects.create_user('member', 'member@example.com', 'password')
+        self.client.login(username='member', password='password')
+        self.assertEqual(self.client.get(reverse('appointment-export')).status_code, 302)
+
+    def test_admin_export_action(self):
+        self.client.force_login(self.admin)
+        selected = Appointment.objects.filter(status='pending').values_list('pk', flat=True)
+        response = self.client.post(reverse('admin:appointments_appointment_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [str(pk) for pk in selected],
+        })
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('pending@example.com', lines[1])
+
+
+class SlotListTests(SimpleTestCase):
+    """Minute-offset slots render and round-trip like the datetime-based ones"""
+
+    def test_labels_match_strftime(self):
+        for minutes in range(MINUTES_PER_DAY):
+            slot = Slot(minutes)
+            self.assertEqual(slot.formatted, slot.time.strftime('%I:%M %p'))
+            self.assertEqual(slot.value, slot.time.strftime('%H:%M'))
+
+    def test_as_json(self):
+        slots = SlotList([0, 9 * 60 + 30, 13 * 60])
+        self.assertEqual(slots.as_json(), [
+            {'value': '00:00', 'text': '12:00 AM'},
+            {'value': '09:30', 'text': '09:30 AM'},
+            {'value': '13:00', 'text': '01:00 PM'},
+        ])
+        self.assertEqual(json.loads(json.dumps(slots.as_json())), slots.as_json())
+
+    def test_json_values_parse_back_to_slots(self):
+        slots = SlotList.from_ranges([range(540, 660, 30), range(600, 720, 30)])
+        self.assertEqual(list(slots), [540, 570, 600, 630, 660, 690])
+        parsed = [datetime.datetime.strptime(item['value'], '%H:%M').time() for item in slots.as_json()]
+        self.assertEqual(parsed, [slot.time for slot in slots.slots()])
+
+    def test_pickle_round_trip(self):
+        slots = SlotList(range(0, MINUTES_PER_DAY, 15))
+        restored = pickle.loads(pickle.dumps(slots))
+        self.assertEqual(restored, slots)
+        self.assertEqual(restored.as_json(), slots.as_json())
+
+    def test_difference_and_membership(self):
+        slots = SlotList([540, 570, 600])
+        free = slots.difference({570})
+        self.assertEqual(list(free), [540, 600])
+        self.assertIn(600, free)
+        self.assertNotIn(570, free)
+        self.assertIs(slots.difference(set()), slots)
+        self.assertFalse(SlotList())
+
+
+class DatabaseProfileTests(SimpleTestCase):
+    """DATABASE_PROFILE picks the SQLite tuning applied to new connections"""
+
+    SCRIPT = """
+import json
+import django
+django.setup()
+from django.conf import settings
+from django.db import connections
+replica = settings.DATABASES['replica']
+with connections['replica'].cursor() as cursor:
+    pragmas = {}
+    for name in ('journal_mode', 'synchronous', 'cache_size', 'temp_store', 'busy_timeout'):
+        cursor.execute(f'PRAGMA {name}')
+        pragmas[name] = cursor.fetchone()[0]
+print(json.dumps({
+    'conn_max_age': replica['CONN_MAX_AGE'],
+    'health_checks': replica['CONN_HEALTH_CHECKS'],
+    'pragmas': pragmas,
+}))
+"""
+
+    def connection_settings(self, profile):
+        # Only the replica alias is opened, on a scratch file
+        with tempfile.TemporaryDirectory() as directory:
+            env = {
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'church_records.settings',
+                'SQLITE_REPLICA_PATH': os.path.join(directory, 'replica.sqlite3'),
+            }
+            env.pop('DATABASE_PROFILE', None)
+            if profile:
+                env['DATABASE_PROFILE'] = profile
+            result = subprocess.run(
+                [sys.executable, '-c', self.SCRIPT],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+            )
+        return json.loads(result.stdout)
+
+    def test_default_profile(self):
+        loaded = self.connection_settings(None)
+        self.assertEqual(loaded['conn_max_age'], 0)
+        self.assertEqual(loaded['pragmas']['journal_mode'], 'delete')
+
+    def test_production_profile(self):
+        loaded = self.connection_settings('production')
+        self.assertEqual(loaded['conn_max_age'], 600)
+        self.assertTrue(loaded['health_checks'])
+        self.assertEqual(loaded['pragmas'], {
+            'journal_mode': 'wal',
+            'synchronous': 1,
+            'cache_size': -64 * 1024,
+            'temp_store': 2,
+            'busy_timeout': 20000,
+        })
+
+
+class AvailabilityEngineTests(TestCase):
+    """Booking windows come from one schedule load and one bookings query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(10, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def book(self, time, date=None, status='pending'):
+        return Appointment.objects.create(
+            name='Visitor',
+            email='visitor@example.com',
+            phone='0200000000',
+            appointment_date=date or self.date,
+            appointment_time=time,
+            purpose='Counselling',
+            status=status,
+        )
+
+    def test_window_follows_weekly_schedule(self):
+        engine = AvailabilityEngine()
+        with self.assertNumQueries(0):
+            dates = engine.available_dates(start=self.date, days=14)
+            self.assertTrue(engine.is_available_weekday(0))
+            self.assertFalse(engine.is_available_weekday(1))
+        self.assertEqual(dates, [self.date, self.date + datetime.timedelta(days=7)])
+        self.assertEqual(engine.available_dates(start=self.date, days=0), [])
+
+    def test_fully_booked_dates(self):
+        self.book(datetime.time(9, 0))
+        self.book(datetime.time(9, 30))
+        next_week = self.date + datetime.timedelta(days=7)
+
+        engine = AvailabilityEngine()
+        # The appointment versions of the window, then its bookings
+        with self.assertNumQueries(2):
+            days = engine.get_available_days(start=self.date, days=8)
+        self.assertEqual([(day['date'], day['fully_booked']) for day in days],
+                         [(self.date, True), (next_week, False)])
+
+        open_dates = json.loads(BookingWindow().open_dates_json)
+        self.assertNotIn(self.date.strftime('%Y-%m-%d'), open_dates)
+        self.assertIn(next_week.strftime('%Y-%m-%d'), open_dates)
+
+    def test_free_slots_are_a_minute_set_difference(self):
+        day = AvailableDay.objects.get()
+        self.assertEqual(list(day.get_slot_minutes()), [540, 570])
+        # A slot must end by the closing time
+        day.end_time = datetime.time(10, 15)
+        self.assertEqual(list(day.get_slot_minutes()), [540, 570])
+        day.slot_duration = 0
+        self.assertEqual(list(day.get_slot_minutes()), [])
+
+        self.book(datetime.time(9, 0), status='cancelled')
+        self.book(datetime.time(9, 30))
+        self.assertEqual(list(free_slot_minutes(self.date)), [540])
+        self.assertEqual(list(free_slot_minutes(self.date + datetime.timedelta(days=7))), [540, 570])
+
+
+class BookingSettingsCacheTests(TestCase):
+    """Booking settings stay in worker memory until a save moves the stamp"""
+
+    def setUp(self):
+        clear_caches()
+
+    def test_stamps_stay_out_of_the_working_tree(self):
+        # Set for the whole run by church_records.testing.TestRunner
+        self.assertFalse(booking_settings_cache.stamp.path.is_relative_to(settings.BASE_DIR))
+
+    def other_worker(self):
+        """Cache of another process sharing the version stamps"""
+        return VersionedValue(booking_settings_cache.stamp, BookingSettings.get_settings, max_age=30)
+
+    def test_settings_are_served_from_memory(self):
+        BookingSettings.get_cached_settings()
+        with self.assertNumQueries(0):
+            self.assertTrue(BookingSettings.get_cached_settings().is_enabled)
+
+    def test_save_reloads_every_worker(self):
+        worker = self.other_worker()
+        booking_settings = worker.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking_settings.is_enabled = False
+            booking_settings.save()
+        self.assertFalse(BookingSettings.get_cached_settings().is_enabled)
+        self.assertFalse(worker.get().is_enabled)
+
+    def test_max_age_bounds_staleness(self):
+        worker = self.other_worker()
+        worker.get()
+        # A write that fires no signal leaves the stamp untouched
+        BookingSettings.objects.update(is_enabled=False)
+        self.assertTrue(worker.get().is_enabled)
+        later = time.monotonic() + 31
+        with mock.patch('appointments.cache.time.monotonic', return_value=later):
+            self.assertFalse(worker.get().is_enabled)
+
+
+class ScheduleIndexCacheTests(TestCase):
+    """Slot lookups use the cached index until the schedule changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.monday = AvailableDay.objects.create(
+            day_of_week=0,
+            start_time=datetime.time(9, 0),
+            end_time=datetime.time(10, 0),
+            slot_duration=30,
+        )
+        cls.date = next_weekday(0)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_validation_runs_without_queries(self):
+        BookingSettings.get_cached_settings()
+        get_schedule_index()
+        appointment = Appointment(
+            name='Visitor', email='visitor@example.com', phone='0200000000',
+            appointment_date=self.date, appointment_time=datetime.time(9, 15), purpose='Counselling',
+        )
+        with self.assertNumQueries(0):
+            with self.assertRaisesMessage(ValidationError, 'The selected time slot is not available.'):
+                appointment.clean()
+            self.assertEqual(get_schedule_index().slot_count(0), 2)
+
+    def test_schedule_change_reloads_every_worker(self):
+        worker = VersionedValue(schedule_index_cache.stamp, ScheduleIndex.load, max_age=300)
+        self.assertEqual(worker.get().slot_count(0), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.monday.end_time = datetime.time(11, 0)
+            self.monday.save()
+        self.assertEqual(worker.get().slot_count(0), 4)
+        self.assertEqual(get_schedule_index().slot_count(0), 4)
+
+    def test_admin_actions_reload_the_index(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        self.assertTrue(get_schedule_index().has_schedule(0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:appointments_availableday_changelist'), {
+                'action': 'deactivate_days',
+                '_selected_action': [str(self.monday.pk)],
+            })
+        self.assertFalse(get_schedule_index().has_schedule(0))
+
+
+class BenchLoadTests(TestCase):
+    """bench_load seeds a weekday schedule and aggregates worker samples"""
+
+    OPTIONS = {
+        'processes': 2, 'duration': 2.0, 'days': 14, 'slot_duration': 60,
+        'appointments': 10, 'members': 5, 'random_seed': 0, 'url': None,
+    }
+
+    def setUp(self):
+        clear_caches()
+
+    def test_seed(self):
+        command = BenchLoadCommand()
+        command.seed(self.OPTIONS)
+        candidates = command.candidates(self.OPTIONS['days'])
+        # Eight one-hour slots on each of the ten weekdays in two weeks
+        self.assertEqual(len(candidates), 80)
+        self.assertTrue(all(datetime.date.fromisoformat(date).weekday() < 5 for date, _ in candidates))
+        self.assertEqual(Appointment.objects.count(), 10)
+        self.assertEqual(Member.objects.count(), 5)
+
+        # Seeding again never books a taken slot twice
+        command.seed(self.OPTIONS)
+        self.assertEqual(AvailableDay.objects.count(), 5)
+        self.assertEqual(Appointment.objects.count(), 20)
+        self.assertEqual(
+            Appointment.objects.values('appointment_date', 'appointment_time').distinct().count(), 20)
+
+    def test_report(self):
+        report = BenchLoadCommand().report(self.OPTIONS, [
+            ('booking_post', 0.010, 302),
+            ('booking_post', 0.050, 'OperationalError'),
+            ('time_slots', 0.002, 200),
+            ('member_list', 0.100, 500),
+        ])
+        self.assertEqual(report['total']['count'], 4)
+        self.assertEqual(report['total']['errors'], 2)
+        self.assertEqual(report['total']['bookings_per_s'], 0.5)
+        self.assertEqual(report['operations']['booking_post']['statuses'], {'302': 1, 'OperationalError': 1})
+        self.assertEqual(report['operations']['booking_page']['count'], 0)
+        self.assertEqual(report['run']['target'], 'test-client')
+
+    def test_needs_a_worker(self):
+        with self.assertRaisesMessage(CommandError, '--processes must be at least 1'):
+            call_command('bench_load', processes=0, stdout=StringIO())
@@ -1,11 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Async variants are served under ASGI (see settings.ASYNC_VIEWS)
+if settings.ASYNC_VIEWS:
+    AppointmentTimeSlotsView = views.AsyncAppointmentTimeSlotsView
+else:
+    AppointmentTimeSlotsView = views.AppointmentTimeSlotsView
+
 urlpatterns = [
     path('', views.AppointmentCreateView.as_view(), name='appointment-create'),
     path('confirmation/', views.AppointmentConfirmationView.as_view(),
          name='appointment-confirmation'),
-    path('time-slots/', views.AppointmentTimeSlotsView.as_view(),
+    path('time-slots/', AppointmentTimeSlotsView.as_view(),
          name='appointment-time-slots'),
+    path('time-slots/range/', views.AppointmentTimeSlotsRangeView.as_view(),
+         name='appointment-time-slots-range'),
     path('home/', views.home, name='appointments-home'),
+    path('export/', views.AppointmentExportView.as_view(),
+         name='appointment-export'),
 ]
@@ -1,14 +1,51 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import CreateView, DetailView, View
 from django.contrib import messages
-from django.http import JsonResponse, Http404, HttpResponseRedirect
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError
+from django.http import JsonResponse, Http404, HttpResponseBadRequest, HttpResponseRedirect
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.functional import cached_property
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 import datetime
 import json
 
 from .models import Appointment, AvailableDay, BookingSettings
+from church_records.exports import EXPORT_FORMATS, export_response, parse_date_param
+from church_records.routers import replica_reads, use_primary
+from church_records.search import write_transaction
+
+from .cache import booking_page_version
 from .forms import AppointmentForm
+from .tasks import send_appointment_email
+from .availability import (
+    AvailabilityEngine, aavailability_version, afree_slot_minutes,
+    availability_version, free_slot_minutes, free_slot_minutes_for_range, get_schedule_index,
+)
+
+
+class BookingWindow:
+    """Availability of the booking window, computed on first use"""
+
+    def __init__(self, days=30):
+        self.days = days
+
+    @cached_property
+    def available_days(self):
+        return AvailabilityEngine().get_available_days(days=self.days)
+
+    @cached_property
+    def open_dates_json(self):
+        """Dates for JavaScript (to disable unavailable and full days)"""
+        return json.dumps([
+            day['formatted'] for day in self.available_days if not day['fully_booked']
+        ])
 
 
 class AppointmentCreateView(CreateView):
@@ -20,7 +57,7 @@ class AppointmentCreateView(CreateView):
     def dispatch(self, request, *args, **kwargs):
         """Check if booking system is enabled"""
         # Get booking settings
-        booking_settings = BookingSettings.get_settings()
+        booking_settings = BookingSettings.get_cached_settings()
         self.booking_settings = booking_settings
 
         # If system is disabled, show message and redirect
@@ -41,17 +78,10 @@ class AppointmentCreateView(CreateView):
         # Add booking settings
         context['booking_settings'] = self.booking_settings
 
-        # Get available days to help with date selection
-        form = context.get('form')
-        if form:
-            available_days = form.get_available_days()
-            context['available_days'] = available_days
-
-            # Format days for JavaScript (to disable unavailable days)
-            available_days_js = []
-            for day in available_days:
-                available_days_js.append(day['formatted'])
-            context['available_days_js'] = json.dumps(available_days_js)
+        # Available days help with date selection. They are only computed
+        # when the page fragments are not cached for fragment_version.
+        context['booking_window'] = BookingWindow()
+        context['fragment_version'] = booking_page_version()
 
         return context
 
@@ -60,6 +90,31 @@ class AppointmentCreateView(CreateView):
         # Set appointment to pending status
         form.instance.status = 'pending'
 
+        # Save the appointment. The unique_active_appointment_seat constraint
+        # makes the INSERT fail if another request took the seat after
+        # validation, so concurrent bookings cannot both succeed. A group
+        # slot with seats left is retried on the next free seat, at most
+        # once per seat; any other integrity error is a real failure.
+        capacity = get_schedule_index().capacity(form.instance.resource_id)
+        for attempt in range(1, capacity + 1):
+            try:
+                with write_transaction():
+                    response = super().form_valid(form)
+                    # Sent by the job worker, so SMTP never delays the booking
+                    send_appointment_email.enqueue(appointment_id=self.object.pk, kind='confirmation')
+                break
+            except IntegrityError as error:
+                if not Appointment.is_seat_conflict(error):
+                    raise
+                form.instance.pk = None
+                if attempt == capacity or not form.instance.assign_seat():
+                    form.add_error(
+                        'appointment_time',
+                        "This time slot was just booked by someone else. "
+                        "Please select another time."
+                    )
+                    return self.form_invalid(form)
+
         # Show success message
         messages.success(
             self.request,
@@ -67,9 +122,6 @@ class AppointmentCreateView(CreateView):
             "Please check your email for confirmation details."
         )
 
-        # Save the appointment
-        response = super().form_valid(form)
-
         # Store appointment ID in session for confirmation view
         self.request.session['appointment_id'] = self.object.id
 
@@ -96,8 +148,10 @@ class AppointmentConfirmationView(DetailView):
         if 'appointment_id' in self.request.session:
             del self.request.session['appointment_id']
 
-        # Get appointment
-        return get_object_or_404(Appointment, id=appointment_id)
+        # Get appointment. It was written by the previous request, which a
+        # lagging replica may not have yet
+        with use_primary():
+            return get_object_or_404(Appointment, id=appointment_id)
 
     def get_context_data(self, **kwargs):
         """Add additional context"""
@@ -106,54 +160,220 @@ class AppointmentConfirmationView(DetailView):
         return context
 
 
+def time_slots_etag(request, *args, **kwargs):
+    """ETag of the time-slots response, computed without generating slots"""
+    try:
+        selected_date = datetime.datetime.strptime(
+            request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    return availability_version(selected_date)
+
+
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(condition(etag_func=time_slots_etag), name='get')
+@method_decorator(cache_control(public=True, max_age=settings.TIME_SLOTS_MAX_AGE), name='get')
 class AppointmentTimeSlotsView(View):
-    """AJAX view for getting available time slots for a date"""
+    """AJAX view for getting available time slots for a date
+
+    Responses carry a strong ETag derived from the date's availability
+    version, so unchanged dates are answered with 304 Not Modified.
+    """
 
     def get(self, request, *args, **kwargs):
         """Handle GET request for time slots"""
         # Check if booking is enabled
-        booking_settings = BookingSettings.get_settings()
+        booking_settings = BookingSettings.get_cached_settings()
+        if not booking_settings.is_enabled:
+            return JsonResponse({'error': 'Booking system is disabled'}, status=400)
+
+        selected_date, error = parse_time_slots_date(request)
+        if error:
+            return error
+        resource_id, error = parse_resource_param(request)
+        if error:
+            return error
+
+        # Get time slots for the date
+        return time_slots_response(selected_date, free_slot_minutes(selected_date, resource_id))
+
+
+@method_decorator(replica_reads, name='get')
+@method_decorator(cache_control(public=True, max_age=settings.TIME_SLOTS_MAX_AGE), name='get')
+class AsyncAppointmentTimeSlotsView(View):
+    """Async AppointmentTimeSlotsView, served instead of it under ASGI
+
+    Reads through the async ORM and cache API, so a single worker can
+    hold many concurrent slot lookups.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """Handle GET request for time slots"""
+        # Same ETag as the sync view; condition() only takes a sync etag_func
+        etag = None
+        try:
+            etag_date = datetime.datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+        else:
+            etag = quote_etag(await aavailability_version(etag_date))
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified is not None:
+                return not_modified
+
+        response = await self.slots_response(request)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        return response
+
+    async def slots_response(self, request):
+        booking_settings = await BookingSettings.aget_cached_settings()
         if not booking_settings.is_enabled:
             return JsonResponse({'error': 'Booking system is disabled'}, status=400)
 
-        # Get date from request
-        date_str = request.GET.get('date')
-        if not date_str:
-            return JsonResponse({'error': 'No date provided'}, status=400)
+        selected_date, error = parse_time_slots_date(request)
+        if error:
+            return error
+        resource_id, error = parse_resource_param(request)
+        if error:
+            return error
+        return time_slots_response(selected_date, await afree_slot_minutes(selected_date, resource_id))
+
+
+def parse_time_slots_date(request):
+    """Return (date, None) for a valid ``?date=``, or (None, error response)"""
+    # Get date from request
+    date_str = request.GET.get('date')
+    if not date_str:
+        return None, JsonResponse({'error': 'No date provided'}, status=400)
+
+    try:
+        # Parse date
+        selected_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return None, JsonResponse({'error': 'Invalid date format'}, status=400)
+
+    # Check if date is in the past
+    if selected_date < datetime.date.today():
+        return None, JsonResponse({'error': 'Cannot book appointments in the past'}, status=400)
+    return selected_date, None
+
+
+def parse_resource_param(request):
+    """Return (resource id or None, None) for ``?resource=``, or (None, error response)
+
+    Without the parameter, slots free on any calendar are listed.
+    """
+    value = request.GET.get('resource')
+    if not value:
+        return None, None
+    try:
+        return int(value), None
+    except ValueError:
+        return None, JsonResponse({'error': 'Invalid resource'}, status=400)
+
+
+def time_slots_response(selected_date, free_slots):
+    """Return the time-slots JSON response for a date's free SlotList"""
+    # Check if any slots available
+    if not free_slots:
+        day_name = selected_date.strftime('%A')
+        return JsonResponse({
+            'error': f'No available time slots on {day_name}, {selected_date.strftime("%B %d, %Y")}'
+        }, status=404)
+
+    # Labels come pre-rendered from the slot tables
+    return JsonResponse({'slots': free_slots.as_json()})
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class AppointmentExportView(View):
+    """Stream appointments as CSV or JSONL
+
+    Accepts the same filters as the admin changelist: ``status``,
+    ``resource`` (a resource id) and an ``start``/``end`` appointment date
+    range (YYYY-MM-DD).
+    """
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Unsupported export format')
+
+        queryset = Appointment.objects.all()
+
+        status = request.GET.get('status')
+        if status:
+            if status not in dict(Appointment.STATUS_CHOICES):
+                return HttpResponseBadRequest('Unknown status')
+            queryset = queryset.filter(status=status)
+
+        resource = request.GET.get('resource')
+        if resource:
+            try:
+                queryset = queryset.filter(resource=int(resource))
+            except ValueError:
+                return HttpResponseBadRequest('Invalid resource')
 
         try:
-            # Parse date
-            selected_date = datetime.datetime.strptime(
-                date_str, '%Y-%m-%d').date()
-
-            # Check if date is in the past
-            today = datetime.date.today()
-            if selected_date < today:
-                return JsonResponse({'error': 'Cannot book appointments in the past'}, status=400)
-
-            # Get time slots for the date
-            form = AppointmentForm()
-            time_slots = form.get_time_slots_for_day(selected_date)
-
-            # Check if any slots available
-            if not time_slots:
-                day_name = selected_date.strftime('%A')
-                return JsonResponse({
-                    'error': f'No available time slots on {day_name}, {selected_date.strftime("%B %d, %Y")}'
-                }, status=404)
-
-            # Format slots for response
-            formatted_slots = []
-            for slot in time_slots:
-                formatted_slots.append({
-                    'value': slot['value'],
-                    'text': slot['formatted']
-                })
-
-            return JsonResponse({'slots': formatted_slots})
+            start = parse_date_param(request.GET.get('start'))
+            end = parse_date_param(request.GET.get('end'))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid date format')
+        if start:
+            queryset = queryset.filter(appointment_date__gte=start)
+        if end:
+            queryset = queryset.filter(appointment_date__lte=end)
+
+        return export_response(queryset, Appointment.EXPORT_FIELDS, export_format, 'appointments')
+
+
+@method_decorator(replica_reads, name='dispatch')
+@method_decorator(cache_control(public=True, max_age=settings.TIME_SLOTS_MAX_AGE), name='get')
+class AppointmentTimeSlotsRangeView(View):
+    """AJAX view returning free time slots for every date in a range
+
+    Lets the calendar prefetch a week or a month in one round trip:
+    ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (inclusive, at most
+    ``max_days`` days), optionally narrowed to one calendar with
+    ``&resource=<id>``. Dates without a schedule are omitted and fully
+    booked dates have an empty slot list.
+    """
+    max_days = 92
 
+    def get(self, request, *args, **kwargs):
+        """Handle GET request for a range of time slots"""
+        booking_settings = BookingSettings.get_cached_settings()
+        if not booking_settings.is_enabled:
+            return JsonResponse({'error': 'Booking system is disabled'}, status=400)
+
+        try:
+            start = datetime.datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+            end = datetime.datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
         except ValueError:
-            return JsonResponse({'error': 'Invalid date format'}, status=400)
+            return JsonResponse({'error': 'Invalid or missing start/end date'}, status=400)
+
+        today = datetime.date.today()
+        if end < today:
+            return JsonResponse({'error': 'Cannot book appointments in the past'}, status=400)
+        start = max(start, today)
+
+        if end < start:
+            return JsonResponse({'error': 'End date must not be before start date'}, status=400)
+        if (end - start).days >= self.max_days:
+            return JsonResponse(
+                {'error': f'Date range cannot exceed {self.max_days} days'}, status=400)
+        resource_id, error = parse_resource_param(request)
+        if error:
+            return error
+
+        slots_by_date = free_slot_minutes_for_range(start, end, resource_id)
+        return JsonResponse({
+            'dates': {
+                date.strftime('%Y-%m-%d'): free_slots.as_json()
+                for date, free_slots in slots_by_date.items()
+            }
+        })
 
 
 def home(request):
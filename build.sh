@@ -9,6 +9,7 @@ mkdir -p staticfiles
 
 python manage.py collectstatic --no-input
 python manage.py migrate
+python manage.py createcachetable
 if [[ $CREATE_SUPERUSER ]]; then
   python manage.py createsuperuser --no-input --email "$DJANGO_SUPERUSER_EMAIL"
 fi
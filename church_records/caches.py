@@ -0,0 +1,15 @@
+"""
+Helpers for the caches configured in settings.CACHES.
+"""
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared_cache(cache):
+    """Whether other processes read what this process writes to ``cache``
+
+    Entries of a process-local cache can only be deleted in the process
+    that wrote them, so data invalidated by deleting keys must not be
+    cached there when several workers serve requests.
+    """
+    return not isinstance(cache, (LocMemCache, DummyCache))
@@ -0,0 +1,16 @@
+"""
+Base class of the data-only management commands.
+"""
+from django.core.management.base import BaseCommand
+
+
+class SlimCommand(BaseCommand):
+    """Management command started under ``SETTINGS_PROFILE=slim``
+
+    Used by cron jobs and workers that only touch data. List the command in
+    SLIM_COMMANDS in manage.py as well, so it starts without the admin,
+    sessions, messages and static files apps. System checks are skipped:
+    the URL checks would import every view and form on each start, and
+    ``manage.py check`` covers deploys.
+    """
+    requires_system_checks = []
@@ -0,0 +1,61 @@
+"""
+Streaming CSV/JSONL exports shared by the members and appointments apps.
+
+Rows are read with ``QuerySet.iterator()`` and ``values_list()`` and
+written straight into a ``StreamingHttpResponse``, so memory use stays flat
+and the first bytes leave the server before the query has finished.
+"""
+import csv
+import datetime
+import json
+
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Echo:
+    """File-like object whose write() hands back the line for yielding"""
+
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def iter_rows(queryset, fields, export_format, chunk_size=2000):
+    """Yield the queryset as CSV or JSONL text, one row at a time"""
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(fields, row)), default=_json_default) + '\n'
+
+
+def export_response(queryset, fields, export_format, filename, chunk_size=2000):
+    """Return a StreamingHttpResponse downloading the queryset as a file"""
+    response = StreamingHttpResponse(
+        iter_rows(queryset, fields, export_format, chunk_size),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
+
+
+def parse_date_param(value):
+    """Parse an optional YYYY-MM-DD query parameter, raising ValueError if invalid"""
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
@@ -0,0 +1,92 @@
+"""
+Per-request SQL profiling.
+
+When ``QUERY_TIMING_HEADERS`` is on, every response carries a
+``Server-Timing`` header with the number of SQL queries the view ran, the
+time spent in them and the total time spent in the view, e.g.::
+
+    Server-Timing: db;dur=3.42;desc="7 queries", app;dur=11.80
+
+Browser dev tools show these metrics next to the request timings.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """Database execute wrapper counting queries and the time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class QueryTimingMiddleware:
+    """Expose per-request query count and time in a Server-Timing header"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_TIMING_HEADERS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self.record_queries(recorder):
+            response = self.get_response(request)
+        return self.add_header(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        # Under ASGI the ORM runs in the request's thread-sensitive thread,
+        # so the wrappers go on that thread's connections
+        stack = await sync_to_async(self.record_queries)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.add_header(request, response, recorder, started)
+
+    def record_queries(self, recorder):
+        """Install ``recorder`` on every connection of the current thread"""
+        stack = ExitStack()
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        return stack
+
+    def add_header(self, request, response, recorder, started):
+        elapsed = time.perf_counter() - started
+        # Queries run while a streaming response is consumed are not counted
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f'app;dur={elapsed * 1000:.2f}'
+        )
+        logger.debug(
+            '%s %s: %d queries in %.2fms, %.2fms total',
+            request.method, request.path, recorder.count,
+            recorder.duration * 1000, elapsed * 1000,
+        )
+        return response
@@ -0,0 +1,110 @@
+"""
+Primary/replica database routing.
+
+Every query goes to the primary (``default``) unless it runs inside
+``use_replica()``, which read-only views and admin changelists opt into,
+and a read replica is configured with the ``DATABASE_READ_REPLICA``
+setting. Writes always go to the primary, and once a block has written,
+its later reads stick to the primary so they see their own writes.
+``use_primary()`` pins a block to the primary even inside ``use_replica()``.
+"""
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# None: no preference, 'replica': reads may use the replica,
+# 'primary': pinned to the primary
+_routing = contextvars.ContextVar('database_routing', default=None)
+
+# Sessions and users are read on every request right after being written
+# (login, messages), so they never come from a lagging replica
+PRIMARY_ONLY_APPS = {'sessions', 'auth'}
+
+
+def read_replica():
+    """Return the alias reads are sent to inside use_replica(), or None"""
+    return getattr(settings, 'DATABASE_READ_REPLICA', None)
+
+
+@contextmanager
+def use_replica():
+    """Send reads in the block to the read replica, unless pinned to the primary"""
+    if _routing.get() is not None:
+        yield
+        return
+    token = _routing.set('replica')
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Send every query in the block to the primary"""
+    token = _routing.set('primary')
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def _routed(view, routing):
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with routing():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with routing():
+                return view(*args, **kwargs)
+    return wrapper
+
+
+def replica_reads(view):
+    """Decorator running a sync or async view inside use_replica()"""
+    return _routed(view, use_replica)
+
+
+def primary_reads(view):
+    """Decorator running a sync or async view inside use_primary()"""
+    return _routed(view, use_primary)
+
+
+class PrimaryReplicaRouter:
+    """Route reads inside use_replica() to the replica and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        replica = read_replica()
+        if (replica and _routing.get() == 'replica'
+                and model._meta.app_label not in PRIMARY_ONLY_APPS):
+            return replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        if _routing.get() == 'replica':
+            # Read-after-write in the same block must see the write
+            _routing.set('primary')
+        # Explicit, so an instance read from the replica is saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+
+class ReplicaChangelistMixin:
+    """ModelAdmin mixin answering changelist GETs from the read replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            # Bulk actions write; keep their reads on the primary
+            return super().changelist_view(request, extra_context)
+        with use_replica():
+            return super().changelist_view(request, extra_context)
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -27,9 +28,26 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'members',
     'appointments',
+    'jobs',
 ]
 
+# SETTINGS_PROFILE=slim loads only the apps that own data, for cron jobs
+# and the data-only management commands manage.py starts with it. Without
+# admin, sessions, messages and static files django.setup() imports about
+# half as much. Never run migrate under it.
+SETTINGS_PROFILES = {
+    'full': INSTALLED_APPS,
+    'slim': [
+        'members',
+        'appointments',
+        'jobs',
+    ],
+}
+
+INSTALLED_APPS = SETTINGS_PROFILES[os.environ.get('SETTINGS_PROFILE', 'full')]
+
 MIDDLEWARE = [
+    'church_records.middleware.QueryTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -45,30 +63,130 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process. Spelled out (instead
+            # of APP_DIRS) so production never depends on Django's default;
+            # the development autoreloader still resets it on edits.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'church_records.wsgi.application'
 
+# Serve the async variants of the read-heavy views (time slots, member
+# list and detail). church_records/asgi.py turns this on; under WSGI the
+# sync views avoid an event loop per request.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# DATABASE_PROFILE=production tunes SQLite for several gunicorn workers:
+# WAL lets readers run alongside the single writer, writers queue on the
+# busy timeout instead of failing with "database is locked", and each
+# worker keeps its connection (and page cache) across requests.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable across application crashes; only a power loss can roll
+    # back the last commits, which WAL keeps consistent
+    'synchronous': 'NORMAL',
+    'mmap_size': 128 * 1024 * 1024,
+    # Negative values are KiB: 64 MiB of page cache per connection
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+DATABASE_PROFILES = {
+    'default': {
+        'OPTIONS': {},
+    },
+    'production': {
+        'OPTIONS': {
+            # Seconds a writer waits for the lock (the SQLite busy timeout)
+            'timeout': 20,
+            'init_command': ';'.join(
+                f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()
+            ),
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    },
+}
+
+DATABASE_PROFILE = DATABASE_PROFILES[os.environ.get('DATABASE_PROFILE', 'default')]
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        **DATABASE_PROFILE,
+        'TEST': {
+            # A file-backed test database honours the SQLite busy timeout,
+            # which the concurrent booking tests rely on
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Read replica alias: a replicated copy of the file (e.g. a LiteFS mount)
+# when SQLITE_REPLICA_PATH is set, otherwise the primary file itself. Its
+# separate test database lets the router tests tell the two apart.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'NAME': os.environ.get('SQLITE_REPLICA_PATH', DATABASES['default']['NAME']),
+    'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+}
+
+# Alias that read-only views and admin changelists read from (see
+# church_records/routers.py), or None to keep every query on the primary
+DATABASE_READ_REPLICA = 'replica' if os.environ.get('SQLITE_REPLICA_PATH') else None
+
+# PostgreSQL, when POSTGRES_DB is set, with Django's native connection
+# pool (psycopg[pool]) and an optional streaming replica on
+# POSTGRES_REPLICA_HOST. Pooled connections replace CONN_MAX_AGE.
+if os.environ.get('POSTGRES_DB'):
+    POSTGRES = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ.get('POSTGRES_USER', ''),
+        'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+        'HOST': os.environ.get('POSTGRES_HOST', ''),
+        'PORT': os.environ.get('POSTGRES_PORT', ''),
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                # Seconds a request waits for a free connection
+                'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),
+            },
+        },
+    }
+    DATABASES = {'default': POSTGRES}
+    DATABASE_READ_REPLICA = None
+    if os.environ.get('POSTGRES_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **POSTGRES,
+            'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+            'PORT': os.environ.get('POSTGRES_REPLICA_PORT', POSTGRES['PORT']),
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_READ_REPLICA = 'replica'
+
+DATABASE_ROUTERS = ['church_records.routers.PrimaryReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -113,6 +231,112 @@ STATICFILES_DIRS = [
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# The availability cache holds per-date free slots and booking counts, the
+# template_fragments cache {% cache %} fragments; each has its own store.
+# Local memory is fine for a single worker. With several gunicorn workers
+# set AVAILABILITY_CACHE_BACKEND=file or =db (run createcachetable) so a
+# fragment deleted by one worker is gone for all of them. Fragments that
+# are only ever deleted, like the member card, are not cached in local
+# memory (see church_records.caches.is_shared_cache).
+
+AVAILABILITY_CACHE_BACKEND = os.environ.get('AVAILABILITY_CACHE_BACKEND', 'locmem')
+
+
+def cache_store(name):
+    """Backend and location of the cache ``name`` for AVAILABILITY_CACHE_BACKEND"""
+    return {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': name,
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / '.cache' / name,
+        },
+        'db': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': f'{name}_cache',
+        },
+    }[AVAILABILITY_CACHE_BACKEND]
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'availability': {
+        **cache_store('availability'),
+        # Upper bound on staleness if an invalidation is ever missed
+        'TIMEOUT': 300,
+    },
+    'template_fragments': {
+        **cache_store('template_fragments'),
+        'TIMEOUT': 3600,
+    },
+}
+
+
+# Process-local caches
+# Version stamps in this directory let every worker notice changes made
+# by another worker (see appointments/cache.py)
+
+CACHE_VERSION_DIR = BASE_DIR / '.cache_versions'
+
+# Keeps the version stamps of the test run in a temporary directory
+TEST_RUNNER = 'church_records.testing.TestRunner'
+
+# Seconds a worker may keep serving its cached BookingSettings
+BOOKING_SETTINGS_CACHE_TIMEOUT = 30
+
+# Seconds a worker may keep serving its cached weekly slot index
+SCHEDULE_CACHE_TIMEOUT = 30
+
+# Cache-Control max-age of the time-slots JSON endpoint, short enough that
+# a reverse proxy only absorbs bursts of identical requests
+TIME_SLOTS_MAX_AGE = 10
+
+
+# Profiling
+# Add a Server-Timing header with the SQL query count and time of every
+# request (see church_records/middleware.py). On in development; set
+# QUERY_TIMING_HEADERS=1 to turn it on in production.
+
+QUERY_TIMING_HEADERS = DEBUG or os.environ.get('QUERY_TIMING_HEADERS') == '1'
+
+
+# Background jobs
+# Run `python manage.py run_jobs` next to the web processes (see
+# jobs/queue.py). A failed job is retried after JOB_RETRY_BACKOFF seconds,
+# doubling on every attempt up to JOB_RETRY_BACKOFF_MAX.
+
+JOB_RETRY_BACKOFF = 30
+
+JOB_RETRY_BACKOFF_MAX = 3600
+
+# Seconds after which a running job is presumed abandoned by a dead worker
+JOB_LOCK_TIMEOUT = 600
+
+
+# Email
+# https://docs.djangoproject.com/en/5.2/topics/email/
+# Appointment emails are sent by the job worker, never during a request.
+# Without EMAIL_HOST they are printed to the worker's console.
+
+EMAIL_HOST = os.environ.get('EMAIL_HOST', '')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '1') == '1'
+EMAIL_BACKEND = (
+    'django.core.mail.backends.smtp.EmailBackend' if EMAIL_HOST
+    else 'django.core.mail.backends.console.EmailBackend'
+)
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'appointments@church-records.onrender.com')
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
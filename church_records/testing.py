@@ -0,0 +1,59 @@
+"""
+Test helpers shared by the members and appointments test suites.
+"""
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner keeping the cache version stamps in a temporary directory
+
+    Every model save in a test bumps a stamp, which would otherwise touch
+    BASE_DIR/.cache_versions and move the versions a running dev server
+    reads.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_version_dir = tempfile.mkdtemp(prefix='cache_versions')
+        self.cache_version_override = override_settings(CACHE_VERSION_DIR=self.cache_version_dir)
+        self.cache_version_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_version_override.disable()
+        shutil.rmtree(self.cache_version_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """TestCase mixin asserting an upper bound on the queries a block runs
+
+    Budgets are upper bounds rather than exact counts, so a change that
+    removes queries passes while one that adds a query per row fails with
+    the captured SQL in the message.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using=connection):
+        with CaptureQueriesContext(using) as captured:
+            yield captured
+        executed = len(captured.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(captured.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {budget}\n{queries}')
+
+    def assertGetWithinBudget(self, budget, url, data=None, status_code=200):
+        """GET ``url`` with self.client and check the status and query budget"""
+        with self.assertQueryBudget(budget):
+            response = self.client.get(url, data)
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, status_code)
+        return response
@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.apps import apps
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
@@ -26,8 +27,11 @@ from django.shortcuts import redirect
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     # path('', home_redirect, name='home'),
     path('members/', include('members.urls')),
     path('book-appointment/', include('appointments.urls')),
 ]
+
+# Not installed under SETTINGS_PROFILE=slim
+if apps.is_installed('django.contrib.admin'):
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
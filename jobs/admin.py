@@ -0,0 +1,31 @@
+from django.contrib import admin
+from django.utils import timezone
+from church_records.routers import ReplicaChangelistMixin
+from .models import Job
+
+@admin.register(Job)
+class JobAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_at', 'updated_at')
+    list_filter = ('status', 'task')
+    readonly_fields = ('task', 'kwargs', 'attempts', 'locked_at', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry_jobs']
+
+    def retry_jobs(self, request, queryset):
+        now = timezone.now()
+        queryset.exclude(status='running').update(
+            status='queued', attempts=0, run_at=now, last_error='', updated_at=now,
+        )
+    retry_jobs.short_description = "Retry selected jobs now"
+
+    fieldsets = (
+        ('Job', {
+            'fields': ('task', 'kwargs', 'status'),
+        }),
+        ('Schedule', {
+            'fields': ('run_at', 'attempts', 'max_attempts', 'locked_at'),
+        }),
+        ('Last Error', {
+            'fields': ('last_error', 'created_at', 'updated_at'),
+            'classes': ('collapse',)
+        }),
+    )
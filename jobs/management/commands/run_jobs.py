@@ -0,0 +1,55 @@
+"""
+Background job worker.
+
+Run it next to the web processes (e.g. a Render background worker):
+
+    python manage.py run_jobs
+
+or from cron with ``--once`` to drain the due jobs and exit.
+"""
+import signal
+import time
+
+from django.db import close_old_connections
+
+from church_records.commands import SlimCommand
+from jobs.queue import run_due_jobs
+
+
+class Command(SlimCommand):
+    help = 'Run queued background jobs (appointment emails), retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Jobs claimed per dequeue')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Seconds to wait when no job is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit as soon as no job is due')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        # Finish the current batch on shutdown instead of abandoning it
+        previous = {
+            signum: signal.signal(signum, self.stop)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            self.work(options)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+
+    def work(self, options):
+        while not self.stopping:
+            succeeded, failed = run_due_jobs(options['batch_size'])
+            close_old_connections()
+            if succeeded or failed:
+                self.stdout.write(f'{succeeded} jobs done, {failed} failed')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+    def stop(self, signum, frame):
+        self.stopping = True
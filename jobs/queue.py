@@ -0,0 +1,143 @@
+"""
+Database-backed background job queue.
+
+Functions decorated with ``@task`` are queued with ``func.enqueue(**kwargs)``.
+The Job row is inserted in the caller's transaction, so a job exists only
+if the change that queued it was committed, and the caller never waits on
+the work itself (e.g. SMTP). The ``run_jobs`` worker claims due jobs in
+batches, runs them and retries failures with exponential backoff.
+"""
+import datetime
+import functools
+import logging
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Task name -> Task, filled as the apps' tasks modules are imported
+registry = {}
+
+
+class Task:
+    """A function the job worker can run in the background"""
+
+    def __init__(self, func, name, max_attempts):
+        functools.update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, **kwargs):
+        """Queue one call; the keyword arguments must be JSON serializable"""
+        return Job.objects.create(task=self.name, kwargs=kwargs, max_attempts=self.max_attempts)
+
+    def enqueue_many(self, kwargs_list):
+        """Queue one call per kwargs dict with a single INSERT"""
+        return Job.objects.bulk_create([
+            Job(task=self.name, kwargs=kwargs, max_attempts=self.max_attempts)
+            for kwargs in kwargs_list
+        ])
+
+
+def task(func=None, *, name=None, max_attempts=5):
+    """Register a function as a background task
+
+    Usable bare (``@task``) or with options (``@task(max_attempts=3)``).
+    Tasks are found by name, ``module.function`` unless given.
+    """
+    def decorator(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__qualname__}', max_attempts)
+        registry[registered.name] = registered
+        return registered
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def retry_delay(attempts):
+    """Return the seconds to wait after a job has failed ``attempts`` times"""
+    return min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOB_RETRY_BACKOFF_MAX,
+    )
+
+
+def claim_jobs(batch_size):
+    """Mark up to ``batch_size`` due jobs as running and return them
+
+    Jobs left running by a worker that died more than JOB_LOCK_TIMEOUT
+    seconds ago are queued again first. Several workers can claim
+    concurrently: the transaction writes first, so SQLite serializes the
+    claims, and on PostgreSQL rows being claimed by another worker are
+    skipped.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    with transaction.atomic():
+        Job.objects.filter(status='running', locked_at__lt=stale).update(
+            status='queued', locked_at=None, updated_at=now,
+        )
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=now)
+            .order_by('run_at', 'id')[:batch_size]
+        )
+        if not jobs:
+            return []
+        Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status='running', locked_at=now, attempts=F('attempts') + 1, updated_at=now,
+        )
+
+    for job in jobs:
+        job.status = 'running'
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; return True if it succeeded"""
+    registered = registry.get(job.task)
+    try:
+        if registered is None:
+            raise LookupError(f'Unknown task {job.task!r}')
+        registered(**job.kwargs)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %d', job.pk, job.task, job.attempts)
+        job.last_error = traceback.format_exc()
+        job.locked_at = None
+        if registered is None or job.attempts >= job.max_attempts:
+            job.status = 'failed'
+        else:
+            job.status = 'queued'
+            job.run_at = timezone.now() + datetime.timedelta(seconds=retry_delay(job.attempts))
+        job.save(update_fields=['status', 'run_at', 'locked_at', 'last_error', 'updated_at'])
+        return False
+
+    job.status = 'done'
+    job.locked_at = None
+    job.last_error = ''
+    job.save(update_fields=['status', 'locked_at', 'last_error', 'updated_at'])
+    return True
+
+
+def run_due_jobs(batch_size):
+    """Claim and run one batch of due jobs; return (succeeded, failed) counts"""
+    succeeded = failed = 0
+    for job in claim_jobs(batch_size):
+        if run_job(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Job
+from .queue import claim_jobs, retry_delay, run_due_jobs, task
+
+calls = []
+
+
+@task
+def record_call(value):
+    calls.append(value)
+
+
+@task(max_attempts=2)
+def always_fail():
+    raise RuntimeError('SMTP unavailable')
+
+
+@override_settings(JOB_RETRY_BACKOFF=30, JOB_RETRY_BACKOFF_MAX=3600, JOB_LOCK_TIMEOUT=600)
+class JobQueueTests(TestCase):
+    """Enqueueing, batch claiming, retries and worker recovery"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        record_call.enqueue(value=1)
+        record_call.enqueue_many([{'value': 2}, {'value': 3}])
+        self.assertEqual(run_due_jobs(batch_size=10), (3, 0))
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(Job.objects.filter(status='done').count(), 3)
+
+    def test_batch_claims_due_jobs_in_order(self):
+        record_call.enqueue_many([{'value': i} for i in range(5)])
+        Job.objects.filter(kwargs__value=0).update(run_at=timezone.now() + datetime.timedelta(hours=1))
+
+        with self.assertNumQueries(5):
+            # Savepoint, reclaim, select, mark running, release
+            jobs = claim_jobs(batch_size=3)
+        self.assertEqual([job.kwargs['value'] for job in jobs], [1, 2, 3])
+        self.assertEqual({job.status for job in jobs}, {'running'})
+        self.assertEqual(Job.objects.filter(status='running', attempts=1).count(), 3)
+        self.assertEqual(claim_jobs(batch_size=3)[0].kwargs['value'], 4)
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = always_fail.enqueue()
+        before = timezone.now()
+        self.assertEqual(run_due_jobs(batch_size=10), (0, 1))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.attempts, 1)
+        self.assertIn('SMTP unavailable', job.last_error)
+        self.assertGreaterEqual(job.run_at, before + datetime.timedelta(seconds=30))
+        # Not due yet
+        self.assertEqual(run_due_jobs(batch_size=10), (0, 0))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        self.assertEqual(run_due_jobs(batch_size=10), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_retry_delay_doubles_up_to_the_maximum(self):
+        self.assertEqual([retry_delay(n) for n in (1, 2, 3)], [30, 60, 120])
+        self.assertEqual(retry_delay(20), 3600)
+
+    def test_unknown_task_fails_without_retry(self):
+        job = Job.objects.create(task='jobs.tests.missing')
+        self.assertEqual(run_due_jobs(batch_size=10), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('Unknown task', job.last_error)
+
+    def test_abandoned_job_is_reclaimed(self):
+        job = record_call.enqueue(value='orphan')
+        Job.objects.filter(pk=job.pk).update(
+            status='running', attempts=1,
+            locked_at=timezone.now() - datetime.timedelta(seconds=601),
+        )
+        self.assertEqual(run_due_jobs(batch_size=10), (1, 0))
+        self.assertEqual(calls, ['orphan'])
+
+
+class RunJobsCommandTests(TransactionTestCase):
+    """The worker command drains due jobs batch by batch"""
+
+    def setUp(self):
+        calls.clear()
+
+    def test_run_jobs_once(self):
+        record_call.enqueue_many([{'value': i} for i in range(3)])
+        call_command('run_jobs', once=True, batch_size=2, stdout=StringIO())
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        self.assertFalse(Job.objects.exclude(status='done').exists())
+
+
+class SlimProfileTests(SimpleTestCase):
+    """The data-only commands load under SETTINGS_PROFILE=slim without the admin"""
+
+    SCRIPT = """
+import json, sys
+import django
+django.setup()
+from django.core.management import get_commands, load_command_class
+from church_records.commands import SlimCommand
+from manage import SLIM_COMMANDS
+commands = get_commands()
+slim = {name: issubclass(type(load_command_class(commands[name], name)), SlimCommand)
+        for name in SLIM_COMMANDS}
+print(json.dumps({
+    'slim': slim,
+    'admin': sorted(module for module in sys.modules if module.startswith('django.contrib.admin')),
+}))
+"""
+
+    def test_slim_commands_import_without_admin(self):
+        result = subprocess.run(
+            [sys.executable, '-c', self.SCRIPT],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'SETTINGS_PROFILE': 'slim', 'DJANGO_SETTINGS_MODULE': 'church_records.settings'},
+            capture_output=True, text=True, check=True,
+        )
+        loaded = json.loads(result.stdout)
+        self.assertEqual(loaded['slim'], {'import_members': True, 'run_jobs': True, 'sync_schedule': True})
+        self.assertEqual(loaded['admin'], [])
@@ -3,10 +3,17 @@
 import os
 import sys
 
+# Data-only commands start with SETTINGS_PROFILE=slim: no admin, sessions,
+# messages or static files to import (see church_records/settings.py).
+# Their Command classes extend church_records.commands.SlimCommand.
+SLIM_COMMANDS = {'import_members', 'run_jobs', 'sync_schedule'}
+
 
 def main():
     """Run administrative tasks."""
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'church_records.settings')
+    if len(sys.argv) > 1 and sys.argv[1] in SLIM_COMMANDS:
+        os.environ.setdefault('SETTINGS_PROFILE', 'slim')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
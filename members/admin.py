@@ -1,13 +1,18 @@
 from django.contrib import admin
-from .models import Member
+from church_records.exports import export_response
+from church_records.routers import ReplicaChangelistMixin
+from church_records.search import FullTextSearchMixin
+from .models import Member, member_search_index
 
 @admin.register(Member)
-class MemberAdmin(admin.ModelAdmin):
+class MemberAdmin(ReplicaChangelistMixin, FullTextSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'room_number', 'telephone_number', 'created_at')
-    search_fields = ('name', 'email', 'room_number', 'telephone_number')
+    search_fields = ('name', 'email', 'room_number', 'telephone_number', 'hall_or_hostel')
+    search_index = member_search_index
     list_filter = ('created_at',)
     ordering = ('-created_at',)
     date_hierarchy = 'created_at'
+    actions = ['export_csv', 'export_jsonl']
     
     fieldsets = (
         ('Personal Information', {
@@ -21,3 +26,11 @@ class MemberAdmin(admin.ModelAdmin):
     )
     
     readonly_fields = ('created_at',)
+    
+    def export_csv(self, request, queryset):
+        return export_response(queryset, Member.EXPORT_FIELDS, 'csv', 'members')
+    export_csv.short_description = "Export selected members as CSV"
+    
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, Member.EXPORT_FIELDS, 'jsonl', 'members')
+    export_jsonl.short_description = "Export selected members as JSONL"
@@ -0,0 +1,156 @@
+"""
+Bulk import members from a CSV or JSONL file.
+
+Rows are validated with the MemberForm field rules, de-duplicated against
+existing emails and inserted with bulk_create in batched transactions.
+Rejected rows are written to a side file together with their errors.
+"""
+import csv
+import json
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import CommandError
+from django.db import IntegrityError, transaction
+
+from church_records.commands import SlimCommand
+from members.forms import MemberForm
+from members.models import Member
+
+
+class Command(SlimCommand):
+    help = 'Import members from a CSV or JSONL file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='Input format, inferred from the file extension by default')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows inserted per bulk_create transaction')
+        parser.add_argument('--rejects', default=None,
+                            help='Where to write rejected rows as JSONL '
+                                 '(default: <path>.rejected.jsonl)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or self.infer_format(path)
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        rejects_path = options['rejects'] or (
+            'rejected.jsonl' if path == '-' else f'{path}.rejected.jsonl'
+        )
+
+        # Build the form once and reuse its field validators for every row
+        form_fields = MemberForm.base_fields
+        defaults = {
+            name: Member._meta.get_field(name).get_default()
+            for name in form_fields
+            if Member._meta.get_field(name).has_default()
+        }
+        seen_emails = set(Member.objects.values_list('email', flat=True))
+
+        imported = rejected = 0
+        started = time.perf_counter()
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+
+        with source, open(rejects_path, 'w', encoding='utf-8') as rejects:
+            def reject(line, row, errors):
+                nonlocal rejected
+                rejected += 1
+                rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors}) + '\n')
+
+            batch = []
+            for line, row in self.read_rows(source, input_format):
+                try:
+                    cleaned = self.clean_row(row, form_fields, defaults)
+                except ValidationError as e:
+                    reject(line, row, e.message_dict)
+                    continue
+
+                if cleaned['email'] in seen_emails:
+                    reject(line, row, {'email': ['Member with this Email already exists.']})
+                    continue
+                seen_emails.add(cleaned['email'])
+
+                batch.append((line, row, Member(**cleaned)))
+                if len(batch) >= batch_size:
+                    imported += self.insert_batch(batch, reject)
+                    batch = []
+
+            if batch:
+                imported += self.insert_batch(batch, reject)
+
+        elapsed = time.perf_counter() - started
+        rate = (imported + rejected) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} members, rejected {rejected} '
+            f'in {elapsed:.2f}s ({rate:.0f} rows/s)'
+        ))
+        if rejected:
+            self.stdout.write(f'Rejected rows written to {rejects_path}')
+
+    def infer_format(self, path):
+        if path.endswith('.csv'):
+            return 'csv'
+        if path.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        raise CommandError('Cannot infer the input format, pass --format csv or --format jsonl')
+
+    def read_rows(self, source, input_format):
+        """Yield (line number, row dict) pairs without loading the whole file"""
+        if input_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line, text in enumerate(source, start=1):
+                if not text.strip():
+                    continue
+                try:
+                    row = json.loads(text)
+                except ValueError:
+                    row = None
+                if not isinstance(row, dict):
+                    row = {'__raw__': text.rstrip('\n')}
+                yield line, row
+
+    def clean_row(self, row, form_fields, defaults):
+        """Apply the MemberForm field rules to a row and return cleaned values"""
+        cleaned = {}
+        errors = {}
+        for name, field in form_fields.items():
+            value = row.get(name)
+            if value is None and name in defaults:
+                value = defaults[name]
+            if isinstance(value, str):
+                value = value.strip()
+            try:
+                cleaned[name] = field.clean(value)
+            except ValidationError as e:
+                errors[name] = e.messages
+        if errors:
+            raise ValidationError(errors)
+        return cleaned
+
+    def insert_batch(self, batch, reject):
+        """Insert a batch in one transaction and return the number of rows inserted"""
+        try:
+            with transaction.atomic():
+                Member.objects.bulk_create([member for _, _, member in batch])
+            return len(batch)
+        except IntegrityError:
+            # Another writer inserted a clashing email since the prefetch;
+            # fall back to row-by-row inserts so only the clashing rows fail
+            inserted = 0
+            for line, row, member in batch:
+                try:
+                    with transaction.atomic():
+                        member.save(force_insert=True)
+                    inserted += 1
+                except IntegrityError as e:
+                    member.pk = None
+                    reject(line, row, {'__all__': [str(e)]})
+            return inserted
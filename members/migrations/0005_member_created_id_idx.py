@@ -0,0 +1,17 @@
+# Generated by Django 5.2 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0004_alter_member_hall_or_hostel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['created_at', 'id'], name='member_created_id_idx'),
+        ),
+    ]
@@ -1,8 +1,16 @@
 from django.db import models
 from django.urls import reverse
 
+from church_records.search import SearchIndex
+
 
 class Member(models.Model):
+    # Columns written by the CSV/JSONL exports, in order
+    EXPORT_FIELDS = [
+        'id', 'name', 'email', 'hall_or_hostel', 'room_number',
+        'year_of_enrollment', 'telephone_number', 'created_at',
+    ]
+
     name = models.CharField(max_length=100)
     email = models.EmailField(unique=True)
     hall_or_hostel = models.CharField(max_length=100, default='hall or hostel')
@@ -11,8 +19,21 @@ class Member(models.Model):
     telephone_number = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the roster (members.pagination)
+            models.Index(fields=['created_at', 'id'], name='member_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
     def get_absolute_url(self):
         return reverse('member-detail', kwargs={'pk': self.pk})
+
+
+# Full-text index behind MemberAdmin search (see church_records.search)
+member_search_index = SearchIndex(
+    'members_member',
+    ['name', 'email', 'room_number', 'telephone_number', 'hall_or_hostel'],
+)
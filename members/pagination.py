@@ -0,0 +1,85 @@
+"""
+Keyset (cursor) pagination for the member roster.
+
+Pages are addressed by the (created_at, id) of the row on their edge
+instead of an OFFSET, so fetching a deep page costs the same index seek as
+fetching the first one.
+"""
+import datetime
+
+from django.db.models import Q
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(member):
+    """Encode a member's position as ``<microseconds since epoch>-<id>``"""
+    micros = (member.created_at - EPOCH) // datetime.timedelta(microseconds=1)
+    return f'{micros}-{member.pk}'
+
+
+def decode_cursor(token):
+    """Decode a cursor into (created_at, id), or None if it is malformed"""
+    try:
+        micros, pk = token.split('-', 1)
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+class KeysetPage:
+    """One page of members, newest first, ordered by (-created_at, -id)"""
+
+    def __init__(self, queryset, size, after=None, before=None, rows=None):
+        self.size = size
+        self.after = decode_cursor(after) if after else None
+        self.before = decode_cursor(before) if before else None
+        self.rows_queryset = self.get_rows_queryset(queryset)
+        if rows is None:
+            rows = list(self.rows_queryset)
+        self.set_rows(rows)
+
+    @classmethod
+    async def aload(cls, queryset, size, after=None, before=None):
+        """Build a page, fetching its rows with the async ORM"""
+        page = cls(queryset, size, after, before, rows=[])
+        page.set_rows([row async for row in page.rows_queryset])
+        return page
+
+    def get_rows_queryset(self, queryset):
+        """Return the query for this page plus one row to detect a further page"""
+        if self.before:
+            # Walk backwards towards newer rows, display order is restored later
+            created_at, pk = self.before
+            return queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+            ).order_by('created_at', 'id')[:self.size + 1]
+        if self.after:
+            created_at, pk = self.after
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+            )
+        return queryset.order_by('-created_at', '-id')[:self.size + 1]
+
+    def set_rows(self, rows):
+        size = self.size
+        if self.before:
+            self.has_previous = len(rows) > size
+            self.object_list = rows[:size][::-1]
+            self.has_next = True
+        else:
+            self.has_next = len(rows) > size
+            self.object_list = rows[:size]
+            self.has_previous = self.after is not None
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return encode_cursor(self.object_list[0])
+        return None
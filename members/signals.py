@@ -0,0 +1,24 @@
+"""
+Signal handlers that keep the member page caches in sync with the database.
+"""
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Member
+
+
+def member_detail_key(pk):
+    """Cache key of the member card fragment in member_detail.html"""
+    return make_template_fragment_key('member-detail', [pk])
+
+
+@receiver([post_save, post_delete], sender=Member)
+def invalidate_member_detail(sender, instance, **kwargs):
+    """Drop the cached member card, again once the change is committed"""
+    cache = caches['template_fragments']
+    key = member_detail_key(instance.pk)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
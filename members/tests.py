@@ -1,3 +1,523 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connections
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from church_records.routers import use_primary, use_replica
+from church_records.search import SearchIndex, trigram_fts5_supported
+from church_records.testing import QueryBudgetMixin
+
+from .management.commands.import_members import Command as ImportMembersCommand
+from .models import Member
+from .pagination import KeysetPage
+from .signals import member_detail_key
+from .views import AsyncMemberDetailView, AsyncMemberListView, MemberListView
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Query budgets of the member pages and admin changelist
+
+    The roster is larger than a page and a stream chunk, so a query per
+    member would blow every budget.
+    """
+
+    MEMBERS = 120
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        Member.objects.bulk_create([
+            Member(
+                name=f'Member {i}',
+                email=f'member{i}@example.com',
+                telephone_number='0200000000',
+                hall_or_hostel='Commonwealth' if i % 2 else 'Legon',
+            )
+            for i in range(cls.MEMBERS)
+        ])
+        cls.member = Member.objects.first()
+
+    def test_member_list(self):
+        response = self.assertGetWithinBudget(1, reverse('member-list'))
+        self.assertGetWithinBudget(1, reverse('member-list'), {
+            'after': response.context['page'].next_cursor,
+        })
+
+    def test_member_list_stream(self):
+        self.assertGetWithinBudget(1, reverse('member-list'), {'stream': '1'})
+
+    def test_member_create_form(self):
+        self.assertGetWithinBudget(0, reverse('member-create'))
+
+    def test_member_create_post(self):
+        with self.assertQueryBudget(6):
+            response = self.client.post(reverse('member-create'), {
+                'name': 'New Member',
+                'email': 'new@example.com',
+                'hall_or_hostel': 'Legon',
+                'room_number': 'R12',
+                'year_of_enrollment': '2025',
+                'telephone_number': '0200000000',
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_member_detail(self):
+        self.assertGetWithinBudget(1, reverse('member-detail', args=[self.member.pk]))
+
+    def test_export(self):
+        self.client.force_login(self.admin)
+        self.assertGetWithinBudget(3, reverse('member-export'), {'format': 'csv'})
+
+    def test_admin_changelist(self):
+        self.client.force_login(self.admin)
+        self.assertGetWithinBudget(8, reverse('admin:members_member_changelist'))
+
+    def test_admin_search(self):
+        self.client.force_login(self.admin)
+        self.assertGetWithinBudget(
+            10, reverse('admin:members_member_changelist'), {'q': 'legon'})
+
+
+@override_settings(DATABASE_READ_REPLICA='replica')
+class ReplicaRoutingTests(TestCase):
+    """Read-only pages read from the replica alias, writes go to the primary
+
+    Runs against two separate SQLite test databases, so rows created on
+    only one of them show which alias a page read from.
+    """
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.primary_member = Member.objects.create(
+            name='Primary Only', email='primary@example.com', telephone_number='0200000000')
+        cls.replica_member = Member.objects.using('replica').create(
+            name='Replica Only', email='replica@example.com', telephone_number='0200000000')
+
+    def test_member_list_reads_replica(self):
+        response = self.client.get(reverse('member-list'))
+        self.assertContains(response, 'Replica Only')
+        self.assertNotContains(response, 'Primary Only')
+
+    def test_member_list_stream_reads_replica(self):
+        response = self.client.get(reverse('member-list'), {'stream': '1'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn('Replica Only', content)
+        self.assertNotIn('Primary Only', content)
+
+    def test_member_detail_reads_replica(self):
+        response = self.client.get(reverse('member-detail', args=[self.replica_member.pk]))
+        self.assertContains(response, 'Replica Only')
+
+    def test_admin_changelist_reads_replica(self):
+        # The session and user still come from the primary
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:members_member_changelist'))
+        self.assertContains(response, 'Replica Only')
+        self.assertNotContains(response, 'Primary Only')
+
+    def test_member_create_writes_primary(self):
+        self.client.post(reverse('member-create'), {
+            'name': 'New Member',
+            'email': 'new@example.com',
+            'hall_or_hostel': 'Legon',
+            'room_number': 'R12',
+            'year_of_enrollment': '2025',
+            'telephone_number': '0200000000',
+        })
+        self.assertTrue(Member.objects.using('default').filter(email='new@example.com').exists())
+        self.assertFalse(Member.objects.using('replica').filter(email='new@example.com').exists())
+
+    def test_reads_after_a_write_stick_to_primary(self):
+        with use_replica():
+            self.assertEqual(Member.objects.get().name, 'Replica Only')
+            Member.objects.create(
+                name='Written', email='written@example.com', telephone_number='0200000000')
+            self.assertEqual(Member.objects.filter(email='written@example.com').count(), 1)
+
+    def test_use_primary_wins_over_use_replica(self):
+        with use_primary(), use_replica():
+            self.assertEqual(Member.objects.get().name, 'Primary Only')
+
+    @override_settings(DATABASE_READ_REPLICA=None)
+    def test_no_replica_configured(self):
+        with CaptureQueriesContext(connections['replica']) as replica_queries:
+            response = self.client.get(reverse('member-list'))
+        self.assertContains(response, 'Primary Only')
+        self.assertEqual(len(replica_queries), 0)
+
+
+class AsyncMemberViewTests(TestCase):
+    """The async member views render the same pages as the sync ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Member.objects.bulk_create([
+            Member(name=f'Member {i}', email=f'member{i}@example.com',
+                   telephone_number='0200000000')
+            for i in range(60)
+        ])
+        cls.member = Member.objects.first()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_member_list_pages(self):
+        request = self.factory.get('/members/')
+        response = async_to_sync(AsyncMemberListView.as_view())(request)
+        self.assertContains(response, 'Member 59')
+        self.assertNotContains(response, 'Member 9<')
+        self.assertContains(response, '?after=')
+
+    def test_member_list_stream(self):
+        async def collect(response):
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        request = self.factory.get('/members/', {'stream': '1'})
+        response = async_to_sync(AsyncMemberListView.as_view())(request)
+        content = async_to_sync(collect)(response).decode()
+        self.assertIn('Member 0<', content)
+        self.assertIn('Member 59<', content)
+
+    def test_member_detail(self):
+        view = async_to_sync(AsyncMemberDetailView.as_view())
+        response = view(self.factory.get('/'), pk=self.member.pk)
+        self.assertContains(response, self.member.email)
+        with self.assertRaises(Http404):
+            view(self.factory.get('/'), pk=0)
+
+
+class MemberDetailCacheTests(TestCase):
+    """The member card is cached per member in a shared cache until that member is saved"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = Member.objects.create(
+            name='Ama', email='ama@example.com', telephone_number='0200000000')
+        cls.other = Member.objects.create(
+            name='Kofi', email='kofi@example.com', telephone_number='0200000001')
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.enterContext(override_settings(CACHES={
+            **settings.CACHES,
+            'template_fragments': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            },
+        }))
+        self.cache = caches['template_fragments']
+
+    def test_card_not_cached_in_process_local_cache(self):
+        url = reverse('member-detail', args=[self.member.pk])
+        with override_settings(CACHES={
+            **settings.CACHES,
+            'template_fragments': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'member-card-test',
+            },
+        }):
+            self.client.get(url)
+            self.assertIsNone(caches['template_fragments'].get(member_detail_key(self.member.pk)))
+            # Another worker's save could not have deleted a cached card
+            Member.objects.filter(pk=self.member.pk).update(telephone_number='0999999999')
+            self.assertContains(self.client.get(url), '0999999999')
+
+    def test_card_cached_per_member(self):
+        url = reverse('member-detail', args=[self.member.pk])
+        self.client.get(url)
+        self.assertIsNotNone(self.cache.get(member_detail_key(self.member.pk)))
+        self.assertIsNone(self.cache.get(member_detail_key(self.other.pk)))
+
+        # Served from the fragment, not from the row
+        Member.objects.filter(pk=self.member.pk).update(telephone_number='0999999999')
+        self.assertNotContains(self.client.get(url), '0999999999')
+
+    def test_save_invalidates_card(self):
+        url = reverse('member-detail', args=[self.member.pk])
+        other_url = reverse('member-detail', args=[self.other.pk])
+        self.client.get(url)
+        self.client.get(other_url)
+
+        self.member.email = 'ama.mensah@example.com'
+        self.member.save()
+        self.assertContains(self.client.get(url), 'ama.mensah@example.com')
+        self.assertIsNotNone(self.cache.get(member_detail_key(self.other.pk)))
+
+
+class ImportMembersTests(TestCase):
+    """import_members validates, de-duplicates and batches rows, rejecting the rest to a side file"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Member.objects.create(name='Ama', email='ama@example.com', telephone_number='0200000000')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def import_file(self, name, content, *args):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        out = StringIO()
+        call_command('import_members', path, *args, stdout=out)
+        return out.getvalue()
+
+    def rejects(self, name):
+        with open(os.path.join(self.directory, f'{name}.rejected.jsonl'), encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_csv(self):
+        output = self.import_file('members.csv', (
+            'name,email,telephone_number\n'
+            'Kofi,kofi@example.com,0200000001\n'
+            'Esi,not-an-email,0200000002\n'
+            'Yaw, yaw@example.com ,0200000003\n'
+        ))
+        self.assertIn('Imported 2 members, rejected 1', output)
+        # Missing columns fall back to the model defaults
+        yaw = Member.objects.get(email='yaw@example.com')
+        self.assertEqual((yaw.hall_or_hostel, yaw.room_number), ('hall or hostel', 'R10'))
+
+        [rejected] = self.rejects('members.csv')
+        self.assertEqual(rejected['line'], 3)
+        self.assertEqual(rejected['row']['email'], 'not-an-email')
+        self.assertEqual(list(rejected['errors']), ['email'])
+
+    def test_jsonl(self):
+        output = self.import_file('members.jsonl', '\n'.join([
+            json.dumps({'name': 'Kofi', 'email': 'kofi@example.com', 'telephone_number': '0200000001'}),
+            '',
+            '{"name": "broken"',
+            json.dumps({'name': 'Esi', 'email': 'esi@example.com'}),
+            json.dumps({'name': 'Yaw', 'email': 'yaw@example.com', 'telephone_number': '0200000003'}),
+        ]) + '\n')
+        self.assertIn('Imported 2 members, rejected 2', output)
+        self.assertEqual(Member.objects.filter(email__in=['kofi@example.com', 'yaw@example.com']).count(), 2)
+
+        broken, esi = self.rejects('members.jsonl')
+        self.assertEqual(broken['line'], 3)
+        self.assertEqual(broken['row'], {'__raw__': '{"name": "broken"'})
+        self.assertEqual(esi['line'], 4)
+        self.assertEqual(list(esi['errors']), ['telephone_number'])
+
+    def test_duplicate_and_existing_emails(self):
+        output = self.import_file('members.csv', (
+            'name,email,telephone_number\n'
+            'Kofi,kofi@example.com,0200000001\n'
+            'Ama Again,ama@example.com,0200000002\n'
+            'Kofi Again,kofi@example.com,0200000003\n'
+        ))
+        self.assertIn('Imported 1 members, rejected 2', output)
+        # The first occurrence in the file wins
+        self.assertEqual(Member.objects.get(email='kofi@example.com').name, 'Kofi')
+        self.assertEqual(Member.objects.get(email='ama@example.com').name, 'Ama')
+        self.assertEqual(
+            [(rejected['line'], rejected['errors']) for rejected in self.rejects('members.csv')],
+            [(3, {'email': ['Member with this Email already exists.']}),
+             (4, {'email': ['Member with this Email already exists.']})],
+        )
+
+    def test_failed_batch_falls_back_to_row_inserts(self):
+        read_rows = ImportMembersCommand.read_rows
+
+        def read_rows_then_clash(command, source, input_format):
+            yield from read_rows(command, source, input_format)
+            # Another writer takes an email of the pending batch
+            Member.objects.create(name='Late', email='esi@example.com', telephone_number='0200000009')
+
+        content = (
+            'name,email,telephone_number\n'
+            'Kofi,kofi@example.com,0200000001\n'
+            'Esi,esi@example.com,0200000002\n'
+            'Yaw,yaw@example.com,0200000003\n'
+        )
+        with mock.patch.object(ImportMembersCommand, 'read_rows', read_rows_then_clash):
+            output = self.import_file('members.csv', content, '--batch-size', '10')
+        self.assertIn('Imported 2 members, rejected 1', output)
+        self.assertEqual(
+            set(Member.objects.values_list('name', flat=True)),
+            {'Ama', 'Kofi', 'Late', 'Yaw'},
+        )
+        [rejected] = self.rejects('members.csv')
+        self.assertEqual(rejected['line'], 3)
+        self.assertIn('UNIQUE', rejected['errors']['__all__'][0])
+
+    def test_format_and_batch_size_checks(self):
+        with self.assertRaisesMessage(CommandError, 'Cannot infer the input format'):
+            self.import_file('members.txt', '')
+        with self.assertRaisesMessage(CommandError, '--batch-size must be at least 1'):
+            self.import_file('members.csv', '', '--batch-size', '0')
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages walk the roster by (created_at, id) without gaps or repeats"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Member.objects.bulk_create([
+            Member(name=f'Member {i}', email=f'member{i}@example.com', telephone_number='0200000000')
+            for i in range(10)
+        ])
+        # Most rows share a timestamp, as with a bulk import
+        joined = datetime.datetime(2025, 9, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        Member.objects.update(created_at=joined)
+        Member.objects.filter(email__in=['member2@example.com', 'member7@example.com']).update(
+            created_at=joined + datetime.timedelta(seconds=1)
+        )
+        cls.roster = list(Member.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def ids(self, page):
+        return [member.pk for member in page.object_list]
+
+    def test_walk_forward_and_back(self):
+        forward = []
+        page = KeysetPage(Member.objects.all(), 3)
+        self.assertFalse(page.has_previous)
+        forward.append(self.ids(page))
+        while page.next_cursor:
+            page = KeysetPage(Member.objects.all(), 3, after=page.next_cursor)
+            forward.append(self.ids(page))
+        self.assertEqual([pk for ids in forward for pk in ids], self.roster)
+        self.assertEqual([len(ids) for ids in forward], [3, 3, 3, 1])
+
+        backward = [self.ids(page)]
+        while page.previous_cursor:
+            page = KeysetPage(Member.objects.all(), 3, before=page.previous_cursor)
+            backward.append(self.ids(page))
+        self.assertEqual(backward, forward[::-1])
+
+    def test_malformed_cursor_falls_back_to_first_page(self):
+        first_page = self.roster[:3]
+        for cursor in ('garbage', '123-abc', '1-2-3', '9' * 30 + '-1'):
+            for direction in ('after', 'before'):
+                with self.subTest(cursor=cursor, direction=direction):
+                    page = KeysetPage(Member.objects.all(), 3, **{direction: cursor})
+                    self.assertEqual(self.ids(page), first_page)
+                    self.assertFalse(page.has_previous)
+
+        response = self.client.get(reverse('member-list'), {'after': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [member.pk for member in response.context['members']],
+            self.roster[:MemberListView.page_size],
+        )
+
+
+class MemberSearchTests(TestCase):
+    """Admin member search answers from the FTS index, best match first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.kofi = Member.objects.create(
+            name='Kofi Mensah', email='mensah.kofi@example.com', telephone_number='0200000001',
+            hall_or_hostel='Mensah Sarbah')
+        cls.ama = Member.objects.create(
+            name='Ama Mensah', email='ama@example.com', telephone_number='0200000002')
+        cls.esi = Member.objects.create(
+            name='Esi Owusu', email='esi@example.com', telephone_number='0200000003')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def search(self, term):
+        response = self.client.get(reverse('admin:members_member_changelist'), {'q': term})
+        return [member.pk for member in response.context['cl'].result_list]
+
+    def test_results_ranked_by_relevance(self):
+        # Three matching columns outrank one, ahead of the newest-first default
+        self.assertEqual(self.search('mensah'), [self.kofi.pk, self.ama.pk])
+        self.assertEqual(self.search('owusu'), [self.esi.pk])
+
+    def test_sorted_column_overrides_rank(self):
+        # Sorted by email
+        response = self.client.get(reverse('admin:members_member_changelist'), {'q': 'mensah', 'o': '2'})
+        self.assertEqual([member.pk for member in response.context['cl'].result_list],
+                         [self.ama.pk, self.kofi.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.ama.name = 'Ama Boateng'
+        self.ama.save()
+        Member.objects.filter(pk=self.esi.pk).update(hall_or_hostel='Mensah Sarbah')
+        self.assertEqual(self.search('boateng'), [self.ama.pk])
+        self.assertEqual(sorted(self.search('mensah')), sorted([self.kofi.pk, self.esi.pk]))
+
+        self.kofi.delete()
+        self.assertEqual(self.search('mensah'), [self.esi.pk])
+        self.assertEqual(self.search('sarbah'), [self.esi.pk])
+
+    def test_install_after_migrate_skips_missing_table(self):
+        index = SearchIndex('members_not_migrated', ['name'])
+        index.install_after_migrate(sender=None, using='default')
+        self.assertNotIn(index.fts_table, connections['default'].introspection.table_names())
+
+    def test_without_trigram_fts5_falls_back_to_icontains(self):
+        self.assertTrue(trigram_fts5_supported(connections['default']))
+        with mock.patch('church_records.search.trigram_fts5_supported', return_value=False):
+            index = SearchIndex('auth_user', ['username'])
+            index.install(connections['default'])
+            self.assertNotIn(index.fts_table, connections['default'].introspection.table_names())
+            with CaptureQueriesContext(connections['default']) as queries:
+                self.assertEqual(sorted(self.search('mensah')), sorted([self.kofi.pk, self.ama.pk]))
+        self.assertFalse(any('_fts' in query['sql'] for query in queries.captured_queries))
+
+
+class MemberExportTests(TestCase):
+    """Staff stream the roster as CSV or JSONL filtered by registration date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        joined = datetime.datetime(2026, 3, 1, 23, 30, tzinfo=datetime.timezone.utc)
+        for day, name in enumerate(['Ama', 'Kofi', 'Esi']):
+            member = Member.objects.create(
+                name=name, email=f'{name.lower()}@example.com', telephone_number='0200000000')
+            Member.objects.filter(pk=member.pk).update(created_at=joined + datetime.timedelta(days=day))
+
+    def export(self, **params):
+        self.client.force_login(self.admin)
+        return self.client.get(reverse('member-export'), params)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        response = self.export()
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="members.csv"')
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], ','.join(Member.EXPORT_FIELDS))
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['Ama', 'Kofi', 'Esi'])
+
+    def test_jsonl_export_with_date_range(self):
+        response = self.export(format='jsonl', start='2026-03-02', end='2026-03-02')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Kofi'])
+        self.assertEqual(list(rows[0]), Member.EXPORT_FIELDS)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.export(format='xlsx').status_code, 400)
+        self.assertEqual(self.export(start='March').status_code, 400)
+
+    def test_staff_only(self):
+        response = self.client.get(reverse('member-export'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse('admin:login'), response['Location'])
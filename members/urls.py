@@ -1,8 +1,16 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Async variants are served under ASGI (see settings.ASYNC_VIEWS)
+if settings.ASYNC_VIEWS:
+    MemberListView, MemberDetailView = views.AsyncMemberListView, views.AsyncMemberDetailView
+else:
+    MemberListView, MemberDetailView = views.MemberListView, views.MemberDetailView
+
 urlpatterns = [
-    path('', views.MemberListView.as_view(), name='member-list'),
+    path('', MemberListView.as_view(), name='member-list'),
     path('register/', views.MemberCreateView.as_view(), name='member-create'),
-    path('member/<int:pk>/', views.MemberDetailView.as_view(), name='member-detail'),
+    path('member/<int:pk>/', MemberDetailView.as_view(), name='member-detail'),
+    path('export/', views.MemberExportView.as_view(), name='member-export'),
 ]
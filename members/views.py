@@ -1,23 +1,148 @@
-from django.shortcuts import render, redirect
-from django.views.generic import ListView, CreateView, DetailView
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect
+from django.views.generic import ListView, CreateView, DetailView, View
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import caches
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+
+from church_records.caches import is_shared_cache
+from church_records.exports import EXPORT_FORMATS, export_response, parse_date_param
+from church_records.routers import replica_reads, use_primary, use_replica
 
 from .models import Member
 from .forms import MemberForm
+from .pagination import KeysetPage
 
+# Placeholder replaced by the streamed table rows
+STREAM_MARKER = '<!-- member-rows -->'
 
+
+@method_decorator(replica_reads, name='dispatch')
 class MemberListView(ListView):
+    """Roster of members, newest first, paginated by (created_at, id) cursor
+
+    Pass ``?after=<cursor>`` or ``?before=<cursor>`` to move between pages,
+    or ``?stream=1`` to stream the whole roster as one page.
+    """
     model = Member
     template_name = 'members/member_list.html'
+    row_template_name = 'members/member_rows.html'
     context_object_name = 'members'
-    ordering = ['-created_at']
+    ordering = ['-created_at', '-id']
+    page_size = 50
+    stream_chunk_size = 500
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('stream'):
+            return self.stream_response()
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        self.page = KeysetPage(
+            super().get_queryset(),
+            self.page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return self.page.object_list
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'All Members'
+        if hasattr(self, 'page'):
+            context['page'] = self.page
         return context
 
+    def stream_response(self):
+        """Stream the full roster, rendering rows in chunks from .iterator()"""
+        page = render_to_string(self.template_name, {
+            'title': 'All Members',
+            'streaming': True,
+            'stream_marker': STREAM_MARKER,
+        }, request=self.request)
+        head, tail = page.split(STREAM_MARKER, 1)
+        row_template = get_template(self.row_template_name)
+        queryset = Member.objects.order_by(*self.ordering)
+
+        def rows():
+            yield head
+            chunk = []
+            # The rows are read after dispatch() has returned
+            with use_replica():
+                for member in queryset.iterator(chunk_size=self.stream_chunk_size):
+                    chunk.append(member)
+                    if len(chunk) == self.stream_chunk_size:
+                        yield row_template.render({'members': chunk})
+                        chunk = []
+            if chunk:
+                yield row_template.render({'members': chunk})
+            yield tail
+
+        return StreamingHttpResponse(rows(), content_type='text/html; charset=utf-8')
+
+
+class AsyncMemberListView(View):
+    """Async MemberListView, served instead of it under ASGI
+
+    Rows are fetched with the async ORM; the page itself is rendered in a
+    thread because the messages in base.html load the session.
+    """
+    list_view = MemberListView
+
+    @method_decorator(replica_reads)
+    async def get(self, request, *args, **kwargs):
+        view = self.list_view
+        if request.GET.get('stream'):
+            return await self.stream_response()
+
+        page = await KeysetPage.aload(
+            Member.objects.all(),
+            view.page_size,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+        return await sync_to_async(render)(request, view.template_name, {
+            'title': 'All Members',
+            view.context_object_name: page.object_list,
+            'object_list': page.object_list,
+            'page': page,
+        })
+
+    async def stream_response(self):
+        """Stream the full roster, rendering rows in chunks from .aiterator()"""
+        view = self.list_view
+        page = await sync_to_async(render_to_string)(view.template_name, {
+            'title': 'All Members',
+            'streaming': True,
+            'stream_marker': STREAM_MARKER,
+        }, request=self.request)
+        head, tail = page.split(STREAM_MARKER, 1)
+        row_template = get_template(view.row_template_name)
+        queryset = Member.objects.order_by(*view.ordering)
+
+        async def rows():
+            yield head
+            chunk = []
+            # The rows are read after get() has returned
+            with use_replica():
+                async for member in queryset.aiterator(chunk_size=view.stream_chunk_size):
+                    chunk.append(member)
+                    if len(chunk) == view.stream_chunk_size:
+                        yield row_template.render({'members': chunk})
+                        chunk = []
+            if chunk:
+                yield row_template.render({'members': chunk})
+            yield tail
+
+        return StreamingHttpResponse(rows(), content_type='text/html; charset=utf-8')
+
 
 class MemberCreateView(CreateView):
     model = Member
@@ -35,17 +160,83 @@ class MemberCreateView(CreateView):
         return super().form_valid(form)
 
 
+def cache_member_card():
+    """Whether the member card fragment may be cached
+
+    A save deletes the fragment in this process only, unless the
+    template_fragments cache is shared by every worker.
+    """
+    return is_shared_cache(caches['template_fragments'])
+
+
+@method_decorator(replica_reads, name='dispatch')
 class MemberDetailView(DetailView):
     model = Member
     template_name = 'members/member_detail.html'
     context_object_name = 'member'
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Just registered members may not have reached the replica yet
+            with use_primary():
+                return super().get_object(queryset)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = f'Member: {self.object.name}'
+        context['cache_member_card'] = cache_member_card()
         return context
 
 
+class AsyncMemberDetailView(View):
+    """Async MemberDetailView, served instead of it under ASGI"""
+
+    @method_decorator(replica_reads)
+    async def get(self, request, pk, *args, **kwargs):
+        try:
+            member = await aget_object_or_404(Member, pk=pk)
+        except Http404:
+            with use_primary():
+                member = await aget_object_or_404(Member, pk=pk)
+        return await sync_to_async(render)(request, MemberDetailView.template_name, {
+            'title': f'Member: {member.name}',
+            'member': member,
+            'object': member,
+            'cache_member_card': cache_member_card(),
+        })
+
+
+@method_decorator(staff_member_required, name='dispatch')
+class MemberExportView(View):
+    """Stream members as CSV or JSONL, optionally filtered by registration date"""
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest('Unsupported export format')
+
+        try:
+            start = parse_date_param(request.GET.get('start'))
+            end = parse_date_param(request.GET.get('end'))
+        except ValueError:
+            return HttpResponseBadRequest('Invalid date format')
+
+        # Compare against datetimes so the (created_at, id) index is used
+        queryset = Member.objects.order_by('created_at', 'id')
+        if start:
+            queryset = queryset.filter(created_at__gte=self.start_of_day(start))
+        if end:
+            queryset = queryset.filter(
+                created_at__lt=self.start_of_day(end + datetime.timedelta(days=1)))
+
+        return export_response(queryset, Member.EXPORT_FIELDS, export_format, 'members')
+
+    def start_of_day(self, date):
+        return timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+
+
 # Home view to redirect to member list
 def home(request):
     return redirect('member-list')